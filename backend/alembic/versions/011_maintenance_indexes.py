@@ -0,0 +1,30 @@
+"""Add indexes used by maintenance purge jobs
+
+Revision ID: 011_maintenance_indexes
+Revises: 010_add_video_note_type
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "011_maintenance_indexes"
+down_revision = "010_add_video_note_type"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_pending_logins_expires_at", "pending_logins", ["expires_at"])
+    op.create_index("ix_telegram_auth_codes_expires_at", "telegram_auth_codes", ["expires_at"])
+    op.create_index("ix_sessions_revoked_at", "sessions", ["revoked_at"])
+    op.create_index("ix_sessions_last_used_at", "sessions", ["last_used_at"])
+    op.create_index("ix_audit_logs_created_at", "audit_logs", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_audit_logs_created_at", table_name="audit_logs")
+    op.drop_index("ix_sessions_last_used_at", table_name="sessions")
+    op.drop_index("ix_sessions_revoked_at", table_name="sessions")
+    op.drop_index("ix_telegram_auth_codes_expires_at", table_name="telegram_auth_codes")
+    op.drop_index("ix_pending_logins_expires_at", table_name="pending_logins")
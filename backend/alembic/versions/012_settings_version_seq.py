@@ -0,0 +1,22 @@
+"""Add settings version sequence for cache invalidation
+
+Revision ID: 012_settings_version_seq
+Revises: 011_maintenance_indexes
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "012_settings_version_seq"
+down_revision = "011_maintenance_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE SEQUENCE IF NOT EXISTS settings_version_seq")
+
+
+def downgrade():
+    op.execute("DROP SEQUENCE IF EXISTS settings_version_seq")
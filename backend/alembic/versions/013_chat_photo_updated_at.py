@@ -0,0 +1,23 @@
+"""Add photo_updated_at to chats
+
+Revision ID: 013_chat_photo_updated_at
+Revises: 012_settings_version_seq
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "013_chat_photo_updated_at"
+down_revision = "012_settings_version_seq"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("chats", sa.Column("photo_updated_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column("chats", "photo_updated_at")
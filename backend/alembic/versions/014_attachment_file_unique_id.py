@@ -0,0 +1,27 @@
+"""Index attachments by Telegram file_unique_id
+
+Revision ID: 014_attachment_file_unique_id
+Revises: 013_chat_photo_updated_at
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "014_attachment_file_unique_id"
+down_revision = "013_chat_photo_updated_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_attachments_file_unique_id",
+        "attachments",
+        [sa.text("(meta ->> 'file_unique_id')")],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_attachments_file_unique_id", table_name="attachments")
@@ -0,0 +1,26 @@
+"""Index messages by chat and Telegram message id
+
+Revision ID: 015_message_telegram_id_index
+Revises: 014_attachment_file_unique_id
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+
+
+revision = "015_message_telegram_id_index"
+down_revision = "014_attachment_file_unique_id"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_messages_chat_telegram_message_id",
+        "messages",
+        ["chat_id", "telegram_message_id"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_messages_chat_telegram_message_id", table_name="messages")
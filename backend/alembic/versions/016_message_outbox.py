@@ -0,0 +1,48 @@
+"""Add message delivery status and outbox
+
+Revision ID: 016_message_outbox
+Revises: 015_message_telegram_id_index
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "016_message_outbox"
+down_revision = "015_message_telegram_id_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    delivery_status = sa.Enum("queued", "sent", "failed", "retrying", name="deliverystatus")
+    delivery_status.create(op.get_bind(), checkfirst=True)
+    op.add_column("messages", sa.Column("delivery_status", delivery_status, nullable=True))
+    op.create_table(
+        "message_outbox",
+        sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column(
+            "message_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("messages.id", ondelete="CASCADE"),
+            nullable=False,
+            unique=True,
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("job_id", sa.String(length=64), nullable=True),
+        sa.Column("dispatched_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+    op.create_index("ix_message_outbox_next_attempt_at", "message_outbox", ["next_attempt_at"])
+
+
+def downgrade():
+    op.drop_index("ix_message_outbox_next_attempt_at", table_name="message_outbox")
+    op.drop_table("message_outbox")
+    op.drop_column("messages", "delivery_status")
+    sa.Enum(name="deliverystatus").drop(op.get_bind(), checkfirst=True)
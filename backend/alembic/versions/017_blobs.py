@@ -0,0 +1,34 @@
+"""Add content-addressed blobs
+
+Revision ID: 017_blobs
+Revises: 016_message_outbox
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "017_blobs"
+down_revision = "016_message_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(length=64), primary_key=True),
+        sa.Column("key", sa.String(length=128), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("released_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()")),
+    )
+    op.create_index("ix_blobs_released_at", "blobs", ["released_at"])
+
+
+def downgrade():
+    op.drop_index("ix_blobs_released_at", table_name="blobs")
+    op.drop_table("blobs")
@@ -0,0 +1,22 @@
+"""Index attachments by local_path for storage reconciliation
+
+Revision ID: 018_attachment_local_path_index
+Revises: 017_blobs
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+revision = "018_attachment_local_path_index"
+down_revision = "017_blobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_attachments_local_path", "attachments", ["local_path"])
+
+
+def downgrade():
+    op.drop_index("ix_attachments_local_path", table_name="attachments")
@@ -0,0 +1,32 @@
+"""Keep chat avatars as Telegram file ids
+
+Revision ID: 019_chat_photo_file_id
+Revises: 018_attachment_local_path_index
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "019_chat_photo_file_id"
+down_revision = "018_attachment_local_path_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("chats", sa.Column("photo_file_id", sa.String(length=256), nullable=True))
+    op.add_column("chats", sa.Column("photo_file_unique_id", sa.String(length=64), nullable=True))
+    op.create_index("ix_chats_photo_file_unique_id", "chats", ["photo_file_unique_id"])
+    # Download URLs embed the bot token; drop them so the bot re-sends the avatar as a file id
+    op.execute(
+        "UPDATE chats SET photo_url = NULL, photo_updated_at = NULL "
+        "WHERE photo_url LIKE 'https://api.telegram.org/file/bot%'"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_chats_photo_file_unique_id", table_name="chats")
+    op.drop_column("chats", "photo_file_unique_id")
+    op.drop_column("chats", "photo_file_id")
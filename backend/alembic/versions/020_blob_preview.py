@@ -0,0 +1,24 @@
+"""Keep rendered preview meta on blobs
+
+Revision ID: 020_blob_preview
+Revises: 019_chat_photo_file_id
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "020_blob_preview"
+down_revision = "019_chat_photo_file_id"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("blobs", sa.Column("preview", postgresql.JSONB(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("blobs", "preview")
@@ -0,0 +1,42 @@
+"""Drop stored Telegram download URLs (they embed the bot token)
+
+Attachments that keep a file_id and meta.file_unique_id are served through
+/files/tg/{file_unique_id} once the URL is gone; the serializer builds that
+route, so no absolute URL is written here. The rest had long expired anyway.
+
+Revision ID: 021_drop_telegram_token_urls
+Revises: 020_blob_preview
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+revision = "021_drop_telegram_token_urls"
+down_revision = "020_blob_preview"
+branch_labels = None
+depends_on = None
+
+TOKEN_URL = "https://api.telegram.org/file/bot%"
+
+
+def upgrade():
+    op.execute(f"UPDATE attachments SET url = NULL WHERE url LIKE '{TOKEN_URL}'")
+    for table in ("templates", "broadcasts"):
+        op.execute(
+            f"""
+            UPDATE {table} SET attachments = (
+                SELECT jsonb_agg(
+                    CASE WHEN item->>'url' LIKE '{TOKEN_URL}' THEN item || '{{"url": null}}'::jsonb ELSE item END
+                    ORDER BY position
+                )
+                FROM jsonb_array_elements(attachments) WITH ORDINALITY AS items(item, position)
+            )
+            WHERE jsonb_typeof(attachments) = 'array' AND attachments::text LIKE '%api.telegram.org/file/bot%'
+            """
+        )
+
+
+def downgrade():
+    # The URLs are not restored
+    pass
@@ -1,4 +1,4 @@
-from app.api import admins, auth, bot, broadcast, chats, external, messages, settings, templates, uploads
+from app.api import admins, auth, bot, broadcast, chats, external, messages, settings, system, templates, uploads
 
 __all__ = [
     "admins",
@@ -9,6 +9,7 @@ __all__ = [
     "external",
     "messages",
     "settings",
+    "system",
     "templates",
     "uploads",
 ]
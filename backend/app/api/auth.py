@@ -39,7 +39,6 @@ from app.core.deps import get_current_admin, require_role
 from app.db.session import get_db
 from app.models.auth import PendingLogin, Session, User, WebAuthnCredential
 from app.models.enums import UserRole
-from app.models.setting import Setting
 from app.schemas.auth import (
     LoginRequest,
     PendingLoginRequest,
@@ -49,6 +48,7 @@ from app.schemas.auth import (
     WebAuthnOptionsRequest,
     WebAuthnVerifyRequest,
 )
+from app.services.settings_cache import settings_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 settings = get_settings()
@@ -193,9 +193,8 @@ async def telegram_verify(
         raise HTTPException(status_code=429, detail="Too many attempts")
     
     # Get bot token from settings
-    result = await db.execute(select(Setting).where(Setting.key == "telegram_bot_token"))
-    setting = result.scalar_one_or_none()
-    bot_token = setting.value_json.get("token") if setting and setting.value_json else None
+    bot_token_setting = await settings_cache.get("telegram_bot_token")
+    bot_token = bot_token_setting.get("token") if bot_token_setting else None
     
     if not bot_token:
         raise HTTPException(status_code=500, detail="Telegram bot token not configured")
@@ -227,21 +226,20 @@ async def telegram_oauth_login(
         raise HTTPException(status_code=429, detail="Too many attempts")
     
     # Get bot token from telegram_oauth settings (not support bot)
-    result = await db.execute(select(Setting).where(Setting.key == "telegram_oauth"))
-    setting = result.scalar_one_or_none()
-    if not setting or not setting.value_json:
+    oauth = await settings_cache.get("telegram_oauth")
+    if not oauth:
         raise HTTPException(
             status_code=500, 
             detail={"code": "not_configured", "message": "Вход через Telegram не настроен администратором."}
         )
     
-    if not setting.value_json.get("enabled"):
+    if not oauth.get("enabled"):
         raise HTTPException(
             status_code=403, 
             detail={"code": "globally_disabled", "message": "Вход через Telegram отключён администратором."}
         )
     
-    bot_token = setting.value_json.get("bot_token")
+    bot_token = oauth.get("bot_token")
     if not bot_token:
         raise HTTPException(
             status_code=500, 
@@ -302,9 +300,8 @@ async def telegram_oauth_login(
 @router.get("/telegram/bot_id")
 async def telegram_bot_id(db: AsyncSession = Depends(get_db)) -> dict:
     # Get bot token from settings
-    result = await db.execute(select(Setting).where(Setting.key == "telegram_bot_token"))
-    setting = result.scalar_one_or_none()
-    bot_token = setting.value_json.get("token") if setting and setting.value_json else None
+    bot_token_setting = await settings_cache.get("telegram_bot_token")
+    bot_token = bot_token_setting.get("token") if bot_token_setting else None
     
     if not bot_token:
         raise HTTPException(status_code=500, detail="Telegram bot token not configured")
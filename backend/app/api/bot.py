@@ -1,8 +1,14 @@
+import asyncio
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+import logging
+from pathlib import Path
 import secrets
+import uuid
 
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -13,15 +19,33 @@ from app.models.attachment import Attachment
 from app.models.chat import Chat
 from app.models.enums import ChatStatus, MessageDirection, MessageType
 from app.models.message import Message
-from app.models.setting import Setting
 from app.models.telegram_code import TelegramAuthCode
 from app.schemas.chats import ChatCreateFromBot, ChatOut
-from app.schemas.messages import MessageEditedFromBot, MessageFromBot, MessageOutgoingFromBot, MessageOut
-from app.services.serializers import serialize_message
+from app.schemas.messages import (
+    DeliveryReportFromBot,
+    ImageConvertFromBot,
+    MessageBatchFromBot,
+    MessageEditedFromBot,
+    MessageEnrichFromBot,
+    MessageFromBot,
+    MessageOutgoingFromBot,
+    MessageOut,
+)
+from app.services.blobs import adjust_refs, attachment_paths, store_blob
+from app.services.images import image_service
+from app.services.message_outbox import apply_delivery_report
+from app.services.serializers import TELEGRAM_FILE_URL, serialize_message, telegram_file_route
+from app.services.settings_cache import settings_cache
+from app.services.storage import iter_bytes
+from app.services.thumbnails import schedule_previews
 from app.ws.manager import manager
 
 router = APIRouter(prefix="/bot", tags=["bot"])
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Settings mirrored into the bot's local snapshot
+BOT_SETTING_KEYS = ["messages", "telegram_bot_token"]
 
 
 def verify_internal_token(x_internal_token: str = Header(...)) -> None:
@@ -29,89 +53,189 @@ def verify_internal_token(x_internal_token: str = Header(...)) -> None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
 
+def _update_chat_profile(chat: Chat, payload: ChatCreateFromBot | MessageFromBot) -> bool:
+    """Copy non-empty profile fields from the bot; returns True if the avatar changed."""
+    if payload.tg_username and payload.tg_username != chat.tg_username:
+        chat.tg_username = payload.tg_username
+    if payload.first_name and payload.first_name != chat.first_name:
+        chat.first_name = payload.first_name
+    if payload.last_name and payload.last_name != chat.last_name:
+        chat.last_name = payload.last_name
+    if payload.language_code and payload.language_code != chat.language_code:
+        chat.language_code = payload.language_code
+    photo = _photo_fields(payload)
+    if not photo:
+        return False
+    photo_changed = photo["photo_url"] != chat.photo_url
+    for key, value in photo.items():
+        setattr(chat, key, value)
+    chat.photo_updated_at = datetime.now(timezone.utc)
+    return photo_changed
+
+
+def _photo_fields(payload: ChatCreateFromBot | MessageFromBot) -> dict:
+    """Avatar columns for a bot payload; Telegram download URLs embed the bot token and are never stored."""
+    if payload.photo_file_id and payload.photo_file_unique_id:
+        return {
+            "photo_url": telegram_file_route(payload.photo_file_unique_id),
+            "photo_file_id": payload.photo_file_id,
+            "photo_file_unique_id": payload.photo_file_unique_id,
+        }
+    if payload.photo_url and not payload.photo_url.startswith(TELEGRAM_FILE_URL):
+        return {"photo_url": payload.photo_url, "photo_file_id": None, "photo_file_unique_id": None}
+    return {}
+
+
+def _photo_needs_refresh(chat: Chat) -> bool:
+    if not chat.photo_url or not chat.photo_updated_at:
+        return True
+    age = datetime.now(timezone.utc) - chat.photo_updated_at
+    return age > timedelta(hours=settings.chat_photo_refresh_hours)
+
+
 @router.post("/chat", response_model=ChatOut, dependencies=[Depends(verify_internal_token)])
 async def create_chat(payload: ChatCreateFromBot, db: AsyncSession = Depends(get_db)) -> Chat:
-    result = await db.execute(select(Chat).where(Chat.tg_id == payload.tg_id))
-    chat = result.scalar_one_or_none()
-    if chat:
-        if payload.tg_username and payload.tg_username != chat.tg_username:
-            chat.tg_username = payload.tg_username
-        if payload.first_name and payload.first_name != chat.first_name:
-            chat.first_name = payload.first_name
-        if payload.last_name and payload.last_name != chat.last_name:
-            chat.last_name = payload.last_name
-        if payload.language_code and payload.language_code != chat.language_code:
-            chat.language_code = payload.language_code
-        if payload.photo_url and payload.photo_url != chat.photo_url:
-            chat.photo_url = payload.photo_url
+    chats = await _load_chats(db, {payload.tg_id})
+    created = await _ensure_chats(db, [payload], chats, last_message_at=datetime.now(timezone.utc))
+    chat = chats[payload.tg_id]
+    if created:
         await db.commit()
         await db.refresh(chat)
+        await manager.broadcast("chat_created", {"chat": ChatOut.model_validate(chat).model_dump()})
         return chat
-    chat = Chat(
-        tg_id=payload.tg_id,
-        tg_username=payload.tg_username,
-        first_name=payload.first_name,
-        last_name=payload.last_name,
-        language_code=payload.language_code,
-        photo_url=payload.photo_url,
-        status=ChatStatus.new,
-        unread_count=0,
-        last_message_at=datetime.now(timezone.utc),
-    )
-    db.add(chat)
+    photo_changed = _update_chat_profile(chat, payload)
     await db.commit()
     await db.refresh(chat)
-    await manager.broadcast("chat_created", {"chat": ChatOut.model_validate(chat).model_dump()})
+    if photo_changed:
+        await manager.broadcast("chat_updated", {"id": str(chat.id), "photo_url": chat.photo_url})
     return chat
 
 
-@router.post("/incoming", dependencies=[Depends(verify_internal_token)])
-async def incoming_message(payload: MessageFromBot, db: AsyncSession = Depends(get_db)) -> dict:
-    result = await db.execute(select(Chat).where(Chat.tg_id == payload.tg_id))
-    chat = result.scalar_one_or_none()
-    send_autoreply = False
-    reopened = False
-    if not chat:
-        chat = Chat(
-            tg_id=payload.tg_id,
-            tg_username=payload.tg_username,
-            first_name=payload.first_name,
-            last_name=payload.last_name,
-            language_code=payload.language_code,
-            photo_url=payload.photo_url,
-            status=ChatStatus.new,
-            unread_count=0,
+_DUPLICATE_RESULT = {"send_autoreply": False, "photo_refresh": False, "duplicate": True}
+
+
+@dataclass
+class _Ingested:
+    chat: Chat
+    message: Message
+    attachments: list[Attachment]
+    created: bool
+    reopen_message: Message | None
+    send_autoreply: bool
+
+
+async def _load_chats(db: AsyncSession, tg_ids: set[int]) -> dict[int, Chat]:
+    result = await db.execute(select(Chat).where(Chat.tg_id.in_(tg_ids)))
+    return {chat.tg_id: chat for chat in result.scalars().all()}
+
+
+def _new_chat_values(
+    payload: ChatCreateFromBot | MessageFromBot, now: datetime, last_message_at: datetime | None = None
+) -> dict:
+    photo = _photo_fields(payload)
+    return {
+        "id": uuid.uuid4(),
+        "tg_id": payload.tg_id,
+        "tg_username": payload.tg_username,
+        "first_name": payload.first_name,
+        "last_name": payload.last_name,
+        "language_code": payload.language_code,
+        # Every row needs the same keys for a multi-row INSERT
+        "photo_url": None,
+        "photo_file_id": None,
+        "photo_file_unique_id": None,
+        **photo,
+        "photo_updated_at": now if photo else None,
+        "status": ChatStatus.new,
+        "unread_count": 0,
+        "autoreply_sent": False,
+        "last_message_at": last_message_at,
+    }
+
+
+async def _ensure_chats(
+    db: AsyncSession,
+    payloads: list[ChatCreateFromBot] | list[MessageFromBot],
+    chats: dict[int, Chat],
+    last_message_at: datetime | None = None,
+) -> set[int]:
+    """Create the chats missing from ``chats`` and load them; returns the tg_ids created here.
+
+    ON CONFLICT waits for a concurrent request (or a spool replay from another bot
+    worker) inserting the same tg_id, and its chat is then loaded instead of
+    failing the whole transaction.
+    """
+    now = datetime.now(timezone.utc)
+    rows = {}
+    for payload in payloads:
+        if payload.tg_id not in chats and payload.tg_id not in rows:
+            rows[payload.tg_id] = _new_chat_values(payload, now, last_message_at)
+    if not rows:
+        return set()
+    result = await db.execute(
+        insert(Chat).values(list(rows.values())).on_conflict_do_nothing(index_elements=[Chat.tg_id]).returning(Chat.tg_id)
+    )
+    created = set(result.scalars().all())
+    chats.update(await _load_chats(db, set(rows)))
+    return created
+
+
+async def _load_delivered(
+    db: AsyncSession, chats: dict[int, Chat], payloads: list[MessageFromBot]
+) -> set[tuple[uuid.UUID, int]]:
+    """(chat_id, telegram_message_id) pairs already stored; the bot retries spooled messages."""
+    message_ids = {p.telegram_message_id for p in payloads if p.telegram_message_id is not None}
+    if not chats or not message_ids:
+        return set()
+    result = await db.execute(
+        select(Message.chat_id, Message.telegram_message_id).where(
+            Message.chat_id.in_([chat.id for chat in chats.values()]),
+            Message.telegram_message_id.in_(message_ids),
+            Message.direction == MessageDirection.inbound,
         )
-        db.add(chat)
-        await db.flush()
-        await manager.broadcast("chat_created", {"chat": ChatOut.model_validate(chat).model_dump()})
+    )
+    return {(row.chat_id, row.telegram_message_id) for row in result}
+
+
+def _ingest_incoming(
+    db: AsyncSession,
+    payload: MessageFromBot,
+    chats: dict[int, Chat],
+    delivered: set[tuple[uuid.UUID, int]],
+    new_chats: set[int],
+) -> _Ingested | None:
+    """Stage one inbound message; ids are assigned up front so nothing is flushed here.
+
+    The chat is in ``chats`` already (see ``_ensure_chats``); ``new_chats`` holds the
+    tg_ids created for this request and is drained as their first message is staged.
+    Returns None for a message that is already stored.
+    """
+    now = datetime.now(timezone.utc)
+    chat = chats[payload.tg_id]
+    if payload.telegram_message_id is not None:
+        key = (chat.id, payload.telegram_message_id)
+        if key in delivered:
+            return None
+        delivered.add(key)
+    created = payload.tg_id in new_chats
+    reopened = False
+    reopen_msg = None
+    if created:
+        new_chats.discard(payload.tg_id)
     else:
-        if payload.tg_username and payload.tg_username != chat.tg_username:
-            chat.tg_username = payload.tg_username
-        if payload.first_name and payload.first_name != chat.first_name:
-            chat.first_name = payload.first_name
-        if payload.last_name and payload.last_name != chat.last_name:
-            chat.last_name = payload.last_name
-        if payload.language_code and payload.language_code != chat.language_code:
-            chat.language_code = payload.language_code
-        if payload.photo_url and payload.photo_url != chat.photo_url:
-            chat.photo_url = payload.photo_url
+        _update_chat_profile(chat, payload)
         # При повторном сообщении в закрытый чат - возвращаем в "Новые"
         if chat.status == ChatStatus.closed:
             chat.status = ChatStatus.new
             reopened = True
             reopen_msg = Message(
+                id=uuid.uuid4(),
                 chat_id=chat.id,
                 direction=MessageDirection.outbound,
                 type=MessageType.system,
                 text="Тикет открыт повторно",
             )
             db.add(reopen_msg)
-            await db.flush()
-            await manager.broadcast(
-                "message_created",
-                {"chat_id": str(chat.id), "message": serialize_message(reopen_msg, [])},
-            )
 
     if payload.text and payload.text.startswith("/start"):
         chat.autoreply_sent = False
@@ -124,6 +248,7 @@ async def incoming_message(payload: MessageFromBot, db: AsyncSession = Depends(g
         send_autoreply = False
 
     msg = Message(
+        id=uuid.uuid4(),
         chat_id=chat.id,
         direction=MessageDirection.inbound,
         type=payload.type,
@@ -136,7 +261,6 @@ async def incoming_message(payload: MessageFromBot, db: AsyncSession = Depends(g
         forward_date=payload.forward_date,
     )
     db.add(msg)
-    await db.flush()
 
     attachments = []
     for a in payload.attachments:
@@ -152,33 +276,83 @@ async def incoming_message(payload: MessageFromBot, db: AsyncSession = Depends(g
         )
         db.add(attachment)
         attachments.append(attachment)
-    if attachments:
-        await db.flush()
 
     chat.unread_count = (chat.unread_count or 0) + 1
-    chat.last_message_at = datetime.now(timezone.utc)
+    chat.last_message_at = now
     # Не меняем статус на active - это произойдёт только после первого ответа оператора
     # Автоприветствие не должно переводить тикет в активные
+    return _Ingested(chat, msg, attachments, created, reopen_msg, send_autoreply)
+
+
+def _ingest_events(items: list[_Ingested]) -> list[tuple[str, dict]]:
+    """WebSocket events for committed messages; one chat_updated per chat with its final state."""
+    events: list[tuple[str, dict]] = []
+    last_by_chat: dict = {}
+    for item in items:
+        chat = item.chat
+        if item.created:
+            events.append(("chat_created", {"chat": ChatOut.model_validate(chat).model_dump()}))
+        if item.reopen_message is not None:
+            events.append(
+                ("message_created", {"chat_id": str(chat.id), "message": serialize_message(item.reopen_message, [])})
+            )
+        events.append(
+            ("message_created", {"chat_id": str(chat.id), "message": serialize_message(item.message, item.attachments)})
+        )
+        last_by_chat[chat.id] = item
+    for item in last_by_chat.values():
+        chat, msg = item.chat, item.message
+        # Send full chat update with preview
+        preview = msg.text[:100] if msg.text else msg.type.value if msg.type else ""
+        events.append(
+            (
+                "chat_updated",
+                {
+                    "id": str(chat.id),
+                    "unread_count": chat.unread_count,
+                    "last_message_at": chat.last_message_at,
+                    "last_message_preview": preview,
+                    "status": chat.status.value if hasattr(chat.status, 'value') else str(chat.status),
+                },
+            )
+        )
+    return events
+
 
+@router.post("/incoming", dependencies=[Depends(verify_internal_token)])
+async def incoming_message(payload: MessageFromBot, db: AsyncSession = Depends(get_db)) -> dict:
+    chats = await _load_chats(db, {payload.tg_id})
+    new_chats = await _ensure_chats(db, [payload], chats)
+    delivered = await _load_delivered(db, chats, [payload])
+    item = _ingest_incoming(db, payload, chats, delivered, new_chats)
+    if item is None:
+        return {"ok": True, **_DUPLICATE_RESULT}
     await db.commit()
-    await db.refresh(msg)
-    await manager.broadcast(
-        "message_created",
-        {"chat_id": str(chat.id), "message": serialize_message(msg, attachments)},
-    )
-    # Send full chat update with preview
-    preview = msg.text[:100] if msg.text else msg.type.value if msg.type else ""
-    await manager.broadcast(
-        "chat_updated",
-        {
-            "id": str(chat.id),
-            "unread_count": chat.unread_count,
-            "last_message_at": chat.last_message_at,
-            "last_message_preview": preview,
-            "status": chat.status.value if hasattr(chat.status, 'value') else str(chat.status),
-        },
-    )
-    return {"ok": True, "send_autoreply": send_autoreply}
+    await manager.broadcast_many(_ingest_events([item]))
+    schedule_previews(item.attachments)
+    return {"ok": True, "send_autoreply": item.send_autoreply, "photo_refresh": _photo_needs_refresh(item.chat)}
+
+
+@router.post("/incoming/batch", dependencies=[Depends(verify_internal_token)])
+async def incoming_batch(payload: MessageBatchFromBot, db: AsyncSession = Depends(get_db)) -> dict:
+    """Ingest many inbound messages in one transaction; results follow the input order."""
+    chats = await _load_chats(db, {m.tg_id for m in payload.messages})
+    new_chats = await _ensure_chats(db, payload.messages, chats)
+    delivered = await _load_delivered(db, chats, payload.messages)
+    items = [_ingest_incoming(db, m, chats, delivered, new_chats) for m in payload.messages]
+    await db.commit()
+    ingested = [item for item in items if item is not None]
+    await manager.broadcast_many(_ingest_events(ingested))
+    schedule_previews(att for item in ingested for att in item.attachments)
+    return {
+        "ok": True,
+        "results": [
+            {"send_autoreply": item.send_autoreply, "photo_refresh": _photo_needs_refresh(item.chat)}
+            if item is not None
+            else _DUPLICATE_RESULT
+            for item in items
+        ],
+    }
 
 
 @router.post("/outgoing", dependencies=[Depends(verify_internal_token)])
@@ -187,6 +361,16 @@ async def outgoing_message(payload: MessageOutgoingFromBot, db: AsyncSession = D
     chat = result.scalar_one_or_none()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+    if payload.telegram_message_id is not None:
+        existing = await db.scalar(
+            select(Message.id).where(
+                Message.chat_id == chat.id,
+                Message.telegram_message_id == payload.telegram_message_id,
+                Message.direction == MessageDirection.outbound,
+            )
+        )
+        if existing:
+            return {"ok": True, "duplicate": True}
 
     msg = Message(
         chat_id=chat.id,
@@ -216,6 +400,7 @@ async def outgoing_message(payload: MessageOutgoingFromBot, db: AsyncSession = D
         attachments.append(attachment)
     if attachments:
         await db.flush()
+        await adjust_refs(db, attachment_paths(attachments), 1)
 
     chat.last_message_at = datetime.now(timezone.utc)
     await db.commit()
@@ -229,9 +414,18 @@ async def outgoing_message(payload: MessageOutgoingFromBot, db: AsyncSession = D
         "chat_updated",
         {"id": str(chat.id), "last_message_at": chat.last_message_at},
     )
+    schedule_previews(attachments)
     return {"ok": True}
 
 
+@router.post("/delivery", dependencies=[Depends(verify_internal_token)])
+async def delivery_report(payload: DeliveryReportFromBot, db: AsyncSession = Depends(get_db)) -> dict:
+    """Outcome of an asynchronous /internal/send job."""
+    if payload.message_id is None:
+        return {"ok": True}
+    return {"ok": await apply_delivery_report(db, payload)}
+
+
 @router.post("/edited", dependencies=[Depends(verify_internal_token)])
 async def edited_message(payload: MessageEditedFromBot, db: AsyncSession = Depends(get_db)) -> dict:
     result = await db.execute(select(Chat).where(Chat.tg_id == payload.tg_id))
@@ -248,6 +442,18 @@ async def edited_message(payload: MessageEditedFromBot, db: AsyncSession = Depen
         .options(selectinload(Message.attachments))
     )
     msg = msg_result.scalar_one_or_none()
+    if not msg:
+        # Later parts of an album are stored as attachments of the album message
+        msg_result = await db.execute(
+            select(Message)
+            .join(Attachment, Attachment.message_id == Message.id)
+            .where(
+                Message.chat_id == chat.id,
+                Attachment.meta["telegram_message_id"].astext == str(payload.telegram_message_id),
+            )
+            .options(selectinload(Message.attachments))
+        )
+        msg = msg_result.scalars().first()
     if not msg:
         return {"ok": False}
 
@@ -263,11 +469,85 @@ async def edited_message(payload: MessageEditedFromBot, db: AsyncSession = Depen
     return {"ok": True}
 
 
+@router.post("/enrich", dependencies=[Depends(verify_internal_token)])
+async def enrich_message(payload: MessageEnrichFromBot, db: AsyncSession = Depends(get_db)) -> dict:
+    """Apply data the bot produced after forwarding an inbound message (HEIC conversion)."""
+    msg_result = await db.execute(
+        select(Message)
+        .join(Chat, Chat.id == Message.chat_id)
+        .where(
+            Chat.tg_id == payload.tg_id,
+            Message.telegram_message_id == payload.telegram_message_id,
+            Message.direction == MessageDirection.inbound,
+        )
+        .options(selectinload(Message.attachments))
+    )
+    msg = msg_result.scalars().first()
+    if not msg:
+        return {"ok": False}
+
+    if payload.type:
+        msg.type = payload.type
+    patches = {p.file_unique_id: p for p in payload.attachments}
+    for attachment in msg.attachments or []:
+        patch = patches.get((attachment.meta or {}).get("file_unique_id"))
+        if not patch:
+            continue
+        previous = attachment_paths([attachment])
+        for field in ("url", "local_path", "mime", "name", "size"):
+            value = getattr(patch, field)
+            if value is not None:
+                setattr(attachment, field, value)
+        if patch.meta:
+            attachment.meta = {**(attachment.meta or {}), **patch.meta}
+        await adjust_refs(db, attachment_paths([attachment]), 1)
+        await adjust_refs(db, previous, -1)
+    await db.commit()
+    await manager.broadcast(
+        "message_updated",
+        {"chat_id": str(msg.chat_id), "message": serialize_message(msg, msg.attachments or [])},
+    )
+    schedule_previews(msg.attachments or [])
+    return {"ok": True}
+
+
+@router.post("/images/heic", dependencies=[Depends(verify_internal_token)])
+async def convert_heic(payload: ImageConvertFromBot, db: AsyncSession = Depends(get_db)) -> dict:
+    """Convert a HEIC file the bot downloaded into the shared uploads volume."""
+    base = Path(settings.storage_local_path).resolve()
+    source = Path(payload.local_path).resolve()
+    if not source.is_relative_to(base) or not source.is_file():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid path")
+    data = await asyncio.to_thread(source.read_bytes)
+    converted = await image_service.heic_to_jpeg(data)
+    if converted is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Conversion failed")
+    name = payload.name.rsplit(".", 1)[0] + ".jpg"
+    stored = await store_blob(db, iter_bytes(converted), name)
+    source.unlink(missing_ok=True)
+    return {"local_path": stored.local_path, "url": stored.url, "name": name, "size": stored.size, "mime": "image/jpeg"}
+
+
+@router.get("/settings", dependencies=[Depends(verify_internal_token)])
+async def sync_settings(version: int = 0, wait: float = Query(0, ge=0, le=60)) -> dict:
+    """Long-poll for the bot settings snapshot.
+
+    Returns immediately when the settings version differs from ``version``,
+    otherwise after the next change or ``wait`` seconds, whichever comes first.
+    The database sequence is the reference, so a worker whose cache fell behind
+    (e.g. it missed a notification) catches up instead of answering "changed"
+    on every poll.
+    """
+    if await settings_cache.current_version() > settings_cache.version:
+        await settings_cache.load()
+    if wait and version == settings_cache.version:
+        await settings_cache.wait_for_change(version, wait)
+    return {"version": settings_cache.version, "values": await settings_cache.get_many(BOT_SETTING_KEYS)}
+
+
 @router.get("/settings/{key}", dependencies=[Depends(verify_internal_token)])
-async def get_setting(key: str, db: AsyncSession = Depends(get_db)) -> dict:
-    result = await db.execute(select(Setting).where(Setting.key == key))
-    setting = result.scalar_one_or_none()
-    return {"key": key, "value_json": setting.value_json if setting else None}
+async def get_setting(key: str) -> dict:
+    return {"key": key, "value_json": await settings_cache.get(key)}
 
 
 @router.post("/link", dependencies=[Depends(verify_internal_token)])
@@ -8,6 +8,7 @@ from app.db.session import get_db
 from app.models.broadcast import Broadcast
 from app.models.enums import UserRole
 from app.schemas.broadcasts import BroadcastCreate, BroadcastOut
+from app.services.blobs import adjust_refs, attachment_paths
 
 router = APIRouter(prefix="/broadcast", tags=["broadcast"])
 
@@ -37,6 +38,7 @@ async def create_broadcast(
         inline_buttons=[[b.model_dump() for b in row] for row in payload.inline_buttons] if payload.inline_buttons else None,
     )
     db.add(broadcast)
+    await adjust_refs(db, attachment_paths(broadcast.attachments), 1)
     await db.commit()
     await db.refresh(broadcast)
     return broadcast
@@ -13,6 +13,7 @@ from app.models.chat import Chat
 from app.models.message import Message
 from app.models.enums import ChatStatus, MessageDirection, MessageType, UserRole
 from app.schemas.chats import ChatAssign, ChatEscalate, ChatOut, ChatNote
+from app.services.blobs import adjust_refs, attachment_paths
 from app.services.pagination import decode_cursor, encode_cursor
 from app.services.serializers import serialize_message
 from app.ws.manager import manager
@@ -268,6 +269,12 @@ async def delete_chat(
     
     # Delete all attachments for messages in this chat
     from app.models.attachment import Attachment
+    paths = await db.execute(
+        select(Attachment.local_path, Attachment.url, Attachment.meta).where(
+            Attachment.message_id.in_(select(Message.id).where(Message.chat_id == chat.id))
+        )
+    )
+    await adjust_refs(db, attachment_paths(row._asdict() for row in paths.all()), -1)
     await db.execute(
         Attachment.__table__.delete().where(
             Attachment.message_id.in_(
@@ -3,14 +3,13 @@ from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from app.core.deps import get_current_admin
 from app.db.session import get_db
 from app.external.remnawave import RemnawaveClient
 from app.external.solobot import SolobotClient
 from app.schemas.external import ExternalProfile
-from app.models.setting import Setting
+from app.services.settings_cache import settings_cache
 from app.services.panel_mode import is_test_mode, TEST_CHAT_FIRST_NAME, TEST_CHAT_LAST_NAME, TEST_CHAT_USERNAME
 
 router = APIRouter(prefix="/external", tags=["external"])
@@ -81,14 +80,9 @@ async def solobot_profile(tg_id: int, admin=Depends(get_current_admin), db: Asyn
                 "source_invite": "test",
             },
         )
-    solobot_cfg = None
-    remnawave_cfg = None
-    result = await db.execute(select(Setting).where(Setting.key.in_(["solobot_integration", "remnawave_integration"])))
-    for setting in result.scalars().all():
-        if setting.key == "solobot_integration":
-            solobot_cfg = setting.value_json
-        if setting.key == "remnawave_integration":
-            remnawave_cfg = setting.value_json
+    integrations = await settings_cache.get_many(["solobot_integration", "remnawave_integration"])
+    solobot_cfg = integrations["solobot_integration"]
+    remnawave_cfg = integrations["remnawave_integration"]
 
     solobot_base = solobot_cfg.get("api_url") if isinstance(solobot_cfg, dict) else None
     solobot_token = solobot_cfg.get("api_key") if isinstance(solobot_cfg, dict) else None
@@ -329,11 +323,7 @@ async def solobot_profile(tg_id: int, admin=Depends(get_current_admin), db: Asyn
 async def delete_hwid_device(payload: dict, admin=Depends(get_current_admin), db: AsyncSession = Depends(get_db)) -> dict:
     if await is_test_mode(db):
         return {"ok": True, "result": {"status": "test_mode"}}
-    remnawave_cfg = None
-    result = await db.execute(select(Setting).where(Setting.key == "remnawave_integration"))
-    setting = result.scalar_one_or_none()
-    if setting:
-        remnawave_cfg = setting.value_json
+    remnawave_cfg = await settings_cache.get("remnawave_integration")
 
     rem_base = remnawave_cfg.get("panel_url") if isinstance(remnawave_cfg, dict) else None
     rem_token = remnawave_cfg.get("api_token") if isinstance(remnawave_cfg, dict) else None
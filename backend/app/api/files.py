@@ -1,29 +1,81 @@
 from __future__ import annotations
 
-from urllib.parse import urlparse
+from pathlib import Path
 
-import httpx
-from fastapi import APIRouter, HTTPException, Query
-from starlette.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import Response, StreamingResponse
+
+from app.core.deps import get_current_admin
+from app.db.session import get_db
+from app.models.attachment import Attachment
+from app.models.chat import Chat
+from app.services.file_cache import FileUnavailable, parse_range, read_range, telegram_file_cache
 
 
 router = APIRouter(prefix="/files", tags=["files"])
 
+# Content behind a file_unique_id never changes
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+def _file_response(path: Path, size: int, range_header: str | None, headers: dict) -> Response:
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+    if byte_range is None:
+        return StreamingResponse(read_range(path, 0, size - 1), headers={**headers, "content-length": str(size)})
+    start, end = byte_range
+    headers = {**headers, "content-length": str(end - start + 1), "content-range": f"bytes {start}-{end}/{size}"}
+    return StreamingResponse(read_range(path, start, end), status_code=206, headers=headers)
+
+
+@router.get("/tg/{file_unique_id}")
+async def telegram_file(
+    file_unique_id: str, request: Request, db: AsyncSession = Depends(get_db), admin=Depends(get_current_admin)
+):
+    result = await db.execute(
+        select(Attachment.telegram_file_id, Attachment.mime, Attachment.name)
+        .where(Attachment.meta["file_unique_id"].astext == file_unique_id, Attachment.telegram_file_id.is_not(None))
+        .limit(1)
+    )
+    row = result.first()
+    if not row:
+        # Chat avatars are kept by file_id too
+        result = await db.execute(
+            select(Chat.photo_file_id.label("telegram_file_id"), literal("image/jpeg").label("mime"))
+            .where(Chat.photo_file_unique_id == file_unique_id, Chat.photo_file_id.is_not(None))
+            .limit(1)
+        )
+        row = result.first()
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = f'"{file_unique_id}"'
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"etag": etag, "cache-control": IMMUTABLE})
+    headers = {
+        "content-type": row.mime or "application/octet-stream",
+        "etag": etag,
+        "cache-control": IMMUTABLE,
+        "accept-ranges": "bytes",
+    }
+    range_header = request.headers.get("range")
 
-@router.get("/proxy")
-async def proxy_file(url: str = Query(..., description="Remote file URL")):
-    parsed = urlparse(url)
-    if parsed.scheme not in {"http", "https"}:
-        raise HTTPException(status_code=400, detail="Invalid URL")
-    if parsed.netloc not in {"api.telegram.org"}:
-        raise HTTPException(status_code=403, detail="Forbidden host")
-
-    async with httpx.AsyncClient(follow_redirects=True, timeout=20.0) as client:
-        resp = await client.get(url)
-        if resp.status_code >= 400:
-            raise HTTPException(status_code=resp.status_code, detail="Upstream error")
-        headers = {}
-        ct = resp.headers.get("content-type")
-        if ct:
-            headers["content-type"] = ct
-        return StreamingResponse(resp.aiter_bytes(), headers=headers)
+    cached = await telegram_file_cache.lookup(file_unique_id)
+    try:
+        if cached is None:
+            fill = telegram_file_cache.fill(file_unique_id, row.telegram_file_id)
+            if range_header is None:
+                # Pass the download through while it is being cached
+                size = await telegram_file_cache.wait_size(fill)
+                if size is not None:
+                    headers["content-length"] = str(size)
+                return StreamingResponse(telegram_file_cache.tail(fill), headers=headers)
+            cached = await telegram_file_cache.wait_done(fill)
+    except FileUnavailable:
+        raise HTTPException(status_code=502, detail="File unavailable")
+    path, size = cached
+    return _file_response(path, size, range_header, headers)
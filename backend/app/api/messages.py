@@ -14,7 +14,9 @@ from app.models.enums import ChatStatus, MessageDirection, MessageType
 from app.models.message import Message
 from app.schemas.messages import MessageCreate, MessageOut
 from app.services.pagination import decode_cursor
+from app.services.blobs import adjust_refs, attachment_paths
 from app.services.bot_client import BotClient
+from app.services.message_outbox import enqueue_message, notify_outbox
 from app.services.serializers import serialize_message
 from app.ws.manager import manager
 from app.services.panel_mode import ensure_test_chat, is_test_mode
@@ -115,6 +117,7 @@ async def create_message(
         )
         db.add(attachment)
         attachments.append(attachment)
+    await adjust_refs(db, attachment_paths(attachments), 1)
 
     chat.unread_count = 0
     chat.last_message_at = datetime.now(timezone.utc)
@@ -135,9 +138,14 @@ async def create_message(
         await db.flush()
         system_serialized = serialize_message(system_msg, [])
         await manager.broadcast("message_created", {"chat_id": str(chat.id), "message": system_serialized})
-    
+
+    if not test_mode:
+        # Delivered by the outbox worker; the row commits together with the message
+        enqueue_message(db, msg)
     await db.commit()
     await db.refresh(msg)
+    if not test_mode:
+        notify_outbox()
 
     serialized = serialize_message(msg, attachments)
     await manager.broadcast("message_created", {"chat_id": str(chat.id), "message": serialized})
@@ -177,18 +185,6 @@ async def create_message(
         if status_changed:
             chat_update["status"] = chat.status.value
         await manager.broadcast("chat_updated", chat_update)
-    else:
-        bot_client = BotClient()
-        telegram_message_id = await bot_client.send_to_user(chat.tg_id, msg, attachments)
-        
-        # Update message with telegram_message_id if bot returned it
-        if telegram_message_id:
-            msg.telegram_message_id = telegram_message_id
-            await db.commit()
-            await db.refresh(msg)
-            # Broadcast updated message with telegram_message_id
-            serialized = serialize_message(msg, attachments)
-            await manager.broadcast("message_updated", {"chat_id": str(chat.id), "message": serialized})
 
     return MessageOut.model_validate(serialized)
 
@@ -231,6 +227,7 @@ async def delete_message(
     tg_msg_id = msg.telegram_message_id
     direction = msg.direction
 
+    await adjust_refs(db, attachment_paths(msg.attachments), -1)
     await db.delete(msg)
     await db.commit()
 
@@ -8,38 +8,37 @@ from app.models.enums import UserRole
 from app.models.setting import Setting
 from app.schemas.settings import SettingOut, SettingUpsert
 from app.services.panel_mode import PANEL_MODE_KEY, PANEL_MODE_PROD, delete_test_chat
+from app.services.settings_cache import bump_settings_version, settings_cache
 from app.ws.manager import manager
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
 
 @router.get("/public/branding")
-async def get_public_branding(db: AsyncSession = Depends(get_db)) -> dict:
+async def get_public_branding() -> dict:
     """Public endpoint for app branding (no auth required)"""
-    result = await db.execute(select(Setting).where(Setting.key == "app_branding"))
-    setting = result.scalar_one_or_none()
-    if setting and setting.value_json:
+    branding = await settings_cache.get("app_branding")
+    if branding:
         return {
-            "name": setting.value_json.get("name", "Support Bot Console"),
-            "description": setting.value_json.get("description", "Premium support console"),
-            "page_title": setting.value_json.get("page_title", ""),
-            "favicon_url": setting.value_json.get("favicon_url", ""),
+            "name": branding.get("name", "Support Bot Console"),
+            "description": branding.get("description", "Premium support console"),
+            "page_title": branding.get("page_title", ""),
+            "favicon_url": branding.get("favicon_url", ""),
         }
     return {"name": "Support Bot Console", "description": "Premium support console", "page_title": "", "favicon_url": ""}
 
 
 @router.get("/public/telegram-oauth")
-async def get_public_telegram_oauth(db: AsyncSession = Depends(get_db)) -> dict:
+async def get_public_telegram_oauth() -> dict:
     """Public endpoint for Telegram OAuth settings (only enabled status, bot username and bot_id)"""
-    result = await db.execute(select(Setting).where(Setting.key == "telegram_oauth"))
-    setting = result.scalar_one_or_none()
-    if setting and setting.value_json:
-        bot_token = setting.value_json.get("bot_token", "")
+    oauth = await settings_cache.get("telegram_oauth")
+    if oauth:
+        bot_token = oauth.get("bot_token", "")
         # Extract bot_id from token (format: BOT_ID:HASH)
         bot_id = bot_token.split(":")[0] if ":" in bot_token else ""
         return {
-            "enabled": setting.value_json.get("enabled", False),
-            "bot_username": setting.value_json.get("bot_username", ""),
+            "enabled": oauth.get("enabled", False),
+            "bot_username": oauth.get("bot_username", ""),
             "bot_id": bot_id,
         }
     return {"enabled": False, "bot_username": "", "bot_id": ""}
@@ -75,8 +74,10 @@ async def upsert_setting(
     else:
         setting = Setting(key=payload.key, value_json=payload.value_json)
         db.add(setting)
+    version = await bump_settings_version(db, payload.key)
     await db.commit()
     await db.refresh(setting)
+    settings_cache.apply(setting.key, setting.value_json, version)
     if payload.key == PANEL_MODE_KEY:
         new_mode = payload.value_json.get("mode") if isinstance(payload.value_json, dict) else None
         if new_mode == PANEL_MODE_PROD:
@@ -96,4 +97,6 @@ async def delete_setting(
     if not setting:
         raise HTTPException(status_code=404, detail="Not found")
     await db.delete(setting)
+    version = await bump_settings_version(db, key)
     await db.commit()
+    settings_cache.apply(key, None, version)
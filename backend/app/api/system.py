@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends
+
+from app.core.deps import require_role
+from app.models.enums import UserRole
+from app.services.bot_client import bot_http_stats
+from app.services.images import image_service
+from app.services.maintenance import get_job_stats
+from app.services.file_cache import telegram_file_cache
+from app.services.storage_gc import get_storage_gc_stats
+from app.services.telegram_files import file_path_cache
+
+router = APIRouter(prefix="/system", tags=["system"], dependencies=[Depends(require_role(UserRole.administrator))])
+
+
+@router.get("/maintenance")
+async def maintenance_stats() -> dict:
+    return {"jobs": get_job_stats()}
+
+
+@router.get("/http")
+async def http_pool_stats() -> dict:
+    return {"bot": bot_http_stats()}
+
+
+@router.get("/images")
+async def image_pool_stats() -> dict:
+    return image_service.stats()
+
+
+@router.get("/storage")
+async def storage_gc_stats() -> dict:
+    return get_storage_gc_stats()
+
+
+@router.get("/files")
+async def telegram_file_stats() -> dict:
+    return {"file_paths": file_path_cache.stats(), "cache": telegram_file_cache.stats()}
@@ -6,6 +6,7 @@ from app.core.deps import get_current_admin
 from app.db.session import get_db
 from app.models.template import Template
 from app.schemas.templates import TemplateCreate, TemplateOut, TemplateUpdate
+from app.services.blobs import adjust_refs, attachment_paths
 from app.ws.manager import manager
 
 router = APIRouter(prefix="/templates", tags=["templates"])
@@ -26,6 +27,7 @@ async def create_template(payload: TemplateCreate, db: AsyncSession = Depends(ge
         inline_buttons=[[b.model_dump() for b in row] for row in payload.inline_buttons] if payload.inline_buttons else None,
     )
     db.add(template)
+    await adjust_refs(db, attachment_paths(template.attachments), 1)
     await db.commit()
     await db.refresh(template)
     await manager.broadcast("template_created", {"template": TemplateOut.model_validate(template).model_dump()})
@@ -43,7 +45,9 @@ async def update_template(template_id: int, payload: TemplateUpdate, db: AsyncSe
     if payload.body is not None:
         template.body = payload.body
     if payload.attachments is not None:
+        await adjust_refs(db, attachment_paths(template.attachments), -1)
         template.attachments = [a.model_dump() for a in payload.attachments] if payload.attachments else None
+        await adjust_refs(db, attachment_paths(template.attachments), 1)
     if payload.inline_buttons is not None:
         template.inline_buttons = [[b.model_dump() for b in row] for row in payload.inline_buttons] if payload.inline_buttons else None
     await db.commit()
@@ -58,6 +62,7 @@ async def delete_template(template_id: int, db: AsyncSession = Depends(get_db),
     template = result.scalar_one_or_none()
     if not template:
         raise HTTPException(status_code=404, detail="Not found")
+    await adjust_refs(db, attachment_paths(template.attachments), -1)
     await db.delete(template)
     await db.commit()
     await manager.broadcast("template_deleted", {"id": template_id})
@@ -1,89 +1,98 @@
-import io
 import logging
-from fastapi import APIRouter, Depends, File, UploadFile
+from typing import AsyncIterator
 
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
 from app.core.deps import get_current_admin
-from app.services.storage import get_storage
+from app.db.session import get_db
+from app.services.blobs import blob_preview, find_blob, save_blob_preview, store_blob
+from app.services.images import image_service, is_heic_file
+from app.services.storage import StorageLimitExceeded, StoredFile
+from app.services.thumbnails import preview_kind, render_stored_file, store_preview
 
 router = APIRouter(prefix="/uploads", tags=["uploads"])
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
-# Register HEIF opener at module load time
-try:
-    import pillow_heif
-    pillow_heif.register_heif_opener()
-    logger.info("pillow_heif registered successfully")
-except Exception as e:
-    logger.warning(f"Failed to register pillow_heif: {e}")
+CHUNK_SIZE = 1024 * 1024
+# Enough for content sniffing (the HEIC ftyp box sits in the first 12 bytes)
+SNIFF_BYTES = 64 * 1024
 
 
-def is_heic_file(data: bytes, filename: str, content_type: str) -> bool:
-    """Check if file is HEIC/HEIF by content-type, extension, or magic bytes."""
-    # Check by content-type
-    if content_type in ('image/heic', 'image/heif'):
-        return True
-    # Check by extension
-    if filename.lower().endswith(('.heic', '.heif')):
-        return True
-    # Check by magic bytes (ftyp box with heic/heif brands)
-    if len(data) >= 12:
-        # HEIC files start with ftyp box
-        if data[4:8] == b'ftyp':
-            brand = data[8:12].decode('ascii', errors='ignore').lower()
-            if brand in ('heic', 'heix', 'hevc', 'hevx', 'mif1', 'msf1'):
-                return True
-    return False
+async def _upload_result(db: AsyncSession, stored: StoredFile, name: str, mime: str) -> dict:
+    meta = None
+    kind = preview_kind(mime, stored.size)
+    if kind:
+        meta = await blob_preview(db, stored.sha256)
+        if meta is None:
+            # Rendered once per content; repeat uploads and /blobs lookups reuse it
+            meta = await store_preview(db, await render_stored_file(stored.local_path, kind))
+            await save_blob_preview(db, stored.sha256, meta)
+        meta = meta or None
+    return {
+        "local_path": stored.local_path,
+        "url": stored.url,
+        "mime": mime,
+        "name": name,
+        "size": stored.size,
+        "sha256": stored.sha256,
+        "meta": meta,
+    }
 
 
-def convert_heic_to_jpeg(data: bytes) -> tuple[bytes, str, str]:
-    """Convert HEIC/HEIF image to JPEG. Returns (data, mime, extension)."""
-    try:
-        import pillow_heif
-        from PIL import Image
-        
-        # Use open_heif which handles complex HEIC files better (Live Photos, HDR)
-        heif_file = pillow_heif.open_heif(data)
-        img = heif_file.to_pillow()
-        
-        # Convert to RGB if necessary (HEIC can have alpha)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=92)
-        output.seek(0)
-        logger.info(f"HEIC converted successfully, output size: {len(output.getvalue())} bytes")
-        return output.getvalue(), 'image/jpeg', '.jpg'
-    except Exception as e:
-        # If conversion fails, return original
-        logger.error(f"HEIC conversion failed: {e}", exc_info=True)
-        return data, 'image/heic', '.heic'
+async def _chunks(head: bytes, file: UploadFile | None = None) -> AsyncIterator[bytes]:
+    if head:
+        yield head
+    if file is None:
+        return
+    while chunk := await file.read(CHUNK_SIZE):
+        yield chunk
+
+
+@router.get("/blobs/{sha256}")
+async def get_blob(
+    sha256: str, name: str = 'file', mime: str = '', db: AsyncSession = Depends(get_db), admin=Depends(get_current_admin)
+) -> dict:
+    """Upload result for content the server already has, keyed by its SHA-256."""
+    stored = await find_blob(db, sha256.lower())
+    if not stored:
+        raise HTTPException(status_code=404, detail="Not found")
+    return await _upload_result(db, stored, name, mime)
 
 
 @router.post("")
-async def upload_file(file: UploadFile = File(...), admin=Depends(get_current_admin)) -> dict:
-    storage = get_storage()
-    data = await file.read()
+async def upload_file(
+    file: UploadFile = File(...), db: AsyncSession = Depends(get_db), admin=Depends(get_current_admin)
+) -> dict:
+    head = await file.read(SNIFF_BYTES)
     
     filename = file.filename or 'file'
     content_type = file.content_type or ''
+    body = _chunks(head, file)
     
     # Convert HEIC/HEIF to JPEG for browser compatibility
-    if is_heic_file(data, filename, content_type):
-        data, content_type, ext = convert_heic_to_jpeg(data)
-        # Change filename extension
-        if '.' in filename:
-            filename = filename.rsplit('.', 1)[0] + ext
+    if is_heic_file(head, filename, content_type):
+        # The decoder needs the whole image; anything over the image limit is stored as-is
+        data = head + await file.read(settings.image_max_input_bytes + 1 - len(head))
+        converted = None
+        if len(data) <= settings.image_max_input_bytes:
+            converted = await image_service.heic_to_jpeg(data)
+        # If conversion fails, keep the original
+        if converted is not None:
+            body = _chunks(converted)
+            content_type = 'image/jpeg'
+            # Change filename extension
+            if '.' in filename:
+                filename = filename.rsplit('.', 1)[0] + '.jpg'
+            else:
+                filename = filename + '.jpg'
         else:
-            filename = filename + ext
+            body = _chunks(data, file)
     
-    local_path, url = await storage.save(data, filename)
-    return {
-        "local_path": local_path,
-        "url": url,
-        "mime": content_type,
-        "name": filename,
-        "size": len(data),
-    }
+    try:
+        stored = await store_blob(db, body, filename, max_bytes=settings.upload_max_bytes)
+    except StorageLimitExceeded:
+        raise HTTPException(status_code=413, detail="File is too large")
+    return await _upload_result(db, stored, filename, content_type)
@@ -6,7 +6,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
-    @field_validator("cookie_domain", mode="before")
+    @field_validator("cookie_domain", "bot_uds_path", "backend_uds_path", mode="before")
     @classmethod
     def empty_str_to_none(cls, v: str | None) -> str | None:
         if v == "":
@@ -26,15 +26,33 @@ class Settings(BaseSettings):
     storage_backend: str = "local"  # local | s3
     storage_local_path: str = "/data/uploads"
     storage_public_base_url: str = "/static"
+    # Telegram bots cannot send files larger than 50 MB
+    upload_max_bytes: int = 50 * 1024 * 1024
+    # Unreferenced blobs are kept this long (uploads not yet sent, undo of a deletion)
+    blob_gc_grace_hours: int = 24
+    # Files no row references: dry_run (only count) | archive (move under archive/) | delete
+    orphan_gc_action: str = "archive"
+    orphan_gc_grace_hours: int = 72
 
     s3_endpoint_url: str | None = None
     s3_access_key: str | None = None
     s3_secret_key: str | None = None
     s3_bucket: str | None = None
     s3_region: str | None = None
+    s3_max_pool_connections: int = 20
+    s3_part_size_bytes: int = 8 * 1024 * 1024
+    s3_upload_concurrency: int = 4
 
     bot_internal_token: str = "change-me-bot"
     bot_base_url: str = "http://bot:8081"
+    # Avatars older than this are re-fetched by the bot in the background
+    chat_photo_refresh_hours: int = 12
+    bot_http_max_connections: int = 50
+    bot_http_max_keepalive: int = 20
+    bot_http2: bool = False  # needs the optional h2 package and an HTTP/2-capable bot endpoint
+    # Optional Unix domain sockets on a shared volume (empty = loopback TCP only)
+    bot_uds_path: str | None = None
+    backend_uds_path: str | None = None
 
     # Auth settings
     panel_origin: str = "http://localhost:5173"
@@ -55,6 +73,61 @@ class Settings(BaseSettings):
     rate_limit_backend: str = "memory"  # redis | memory
     redis_url: str | None = None
 
+    # Maintenance jobs
+    maintenance_enabled: bool = True
+    maintenance_tick_seconds: int = 30
+    maintenance_batch_size: int = 500
+    maintenance_max_batches: int = 200
+    audit_log_retention_days: int = 90
+    session_retention_days: int = 7
+
+    # Telegram download paths stay valid for about an hour
+    telegram_file_path_ttl_seconds: int = 50 * 60
+    telegram_file_path_cache_size: int = 10000
+    # Disk cache of downloaded Telegram files; the cap covers all workers sharing the directory
+    telegram_cache_path: str = "/data/cache/telegram"
+    telegram_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+
+    # HEIC conversion process pool
+    image_workers: int = 2
+    image_max_concurrency: int = 2
+    image_max_pixels: int = 50_000_000
+    image_max_input_bytes: int = 50 * 1024 * 1024
+    image_timeout_seconds: int = 30
+    image_jpeg_quality: int = 92
+
+    # Attachment previews (WebP thumbnails, video poster frames)
+    thumbnail_max_side: int = 320
+    thumbnail_quality: int = 70
+    # Smaller images are shown as they are
+    thumbnail_min_bytes: int = 64 * 1024
+    thumbnail_concurrency: int = 2
+    thumbnail_queue_size: int = 10000
+
+    # Operator reply outbox
+    outbox_poll_seconds: int = 2
+    outbox_batch_size: int = 50
+    outbox_max_attempts: int = 8
+    outbox_base_backoff_seconds: int = 2
+    outbox_max_backoff_seconds: int = 300
+    # Re-dispatch a job the bot accepted but never reported on
+    outbox_dispatch_timeout_seconds: int = 300
+
+    # Broadcast delivery: sends in flight, and a rate kept under the bot's 30 msg/s
+    # so operator replies still get through while a broadcast runs
+    broadcast_concurrency: int = 20
+    broadcast_rate_per_second: float = 25.0
+    broadcast_max_attempts: int = 3
+    # Recipients read (and their messages committed) per keyset page
+    broadcast_batch_size: int = 500
+    # How often progress (sent, failed, msg/s) is written to the broadcast
+    broadcast_progress_seconds: float = 2.0
+
+    # Settings cache: full reload interval in case a change notification was missed
+    cached_settings_ttl_seconds: int = 300
+    # How often the LISTEN connection is checked and re-established if it died
+    cached_settings_listener_check_seconds: int = 10
+
 
 @lru_cache
 
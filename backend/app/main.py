@@ -1,10 +1,11 @@
+import asyncio
 import logging
 from fastapi import Depends, FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 
-from app.api import admins, auth, bot, broadcast, chats, external, files, messages, settings as settings_api, templates, uploads
+from app.api import admins, auth, bot, broadcast, chats, external, files, messages, settings as settings_api, system, templates, uploads
 from app.core.config import get_settings
 from app.auth.security import decode_token
 from app.auth.crypto import hash_secret
@@ -14,7 +15,16 @@ from app.middleware.csrf import CSRFMiddleware
 from app.db.session import AsyncSessionLocal
 from app.models.auth import User
 from app.models.enums import UserRole
+from app.services.bot_client import close_bot_http
+from app.services.telegram_files import close_telegram_http
 from app.services.broadcast_worker import start_broadcast_worker
+from app.services.file_cache import telegram_file_cache
+from app.services.images import image_service
+from app.services.maintenance import start_maintenance_scheduler
+from app.services.message_outbox import start_outbox_worker
+from app.services.settings_cache import settings_cache
+from app.services.storage import close_storage
+from app.services.thumbnails import start_thumbnail_worker
 from sqlalchemy import select
 
 logger = logging.getLogger(__name__)
@@ -52,16 +62,32 @@ async def init_admin():
 async def lifespan(app: FastAPI):
     # Startup
     await init_admin()
+    await settings_cache.start()
     # Start broadcast worker
     broadcast_task = await start_broadcast_worker()
     logger.info("✅ Broadcast worker started")
+    background_tasks = [broadcast_task, await start_outbox_worker()]
+    logger.info("✅ Message outbox worker started")
+    background_tasks.append(await start_thumbnail_worker())
+    logger.info("✅ Thumbnail worker started")
+    if settings.maintenance_enabled:
+        background_tasks.append(await start_maintenance_scheduler())
+        logger.info("✅ Maintenance scheduler started")
     yield
     # Shutdown
-    broadcast_task.cancel()
-    try:
-        await broadcast_task
-    except Exception:
-        pass
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    await settings_cache.stop()
+    await close_bot_http()
+    await telegram_file_cache.close()
+    await close_telegram_http()
+    image_service.shutdown()
+    close_storage()
 
 
 app = FastAPI(title=settings.app_name, lifespan=lifespan)
@@ -99,6 +125,7 @@ app.include_router(broadcast.router, prefix=settings.api_prefix)
 app.include_router(settings_api.router, prefix=settings.api_prefix)
 app.include_router(external.router, prefix=settings.api_prefix)
 app.include_router(bot.router, prefix=settings.api_prefix)
+app.include_router(system.router, prefix=settings.api_prefix)
 
 
 @app.websocket("/ws")
@@ -1,7 +1,9 @@
 from app.models.attachment import Attachment
+from app.models.blob import Blob
 from app.models.broadcast import Broadcast
 from app.models.chat import Chat
 from app.models.message import Message
+from app.models.outbox import MessageOutbox
 from app.models.auth import AuditLog, PendingLogin, Session, User, WebAuthnCredential
 from app.models.setting import Setting
 from app.models.template import Template
@@ -9,9 +11,11 @@ from app.models.telegram_code import TelegramAuthCode
 
 __all__ = [
     "Attachment",
+    "Blob",
     "Broadcast",
     "Chat",
     "Message",
+    "MessageOutbox",
     "User",
     "PendingLogin",
     "WebAuthnCredential",
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import ForeignKey, Index, Integer, String
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -13,7 +13,7 @@ class Attachment(Base, TimestampMixin):
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     message_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("messages.id"), index=True)
     telegram_file_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
-    local_path: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    local_path: Mapped[str | None] = mapped_column(String(512), nullable=True, index=True)
     url: Mapped[str | None] = mapped_column(String(512), nullable=True)
     mime: Mapped[str | None] = mapped_column(String(128), nullable=True)
     name: Mapped[str | None] = mapped_column(String(256), nullable=True)
@@ -21,3 +21,7 @@ class Attachment(Base, TimestampMixin):
     meta: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
 
     message = relationship("Message", back_populates="attachments")
+
+
+# Lookups from the stable /files/tg/{file_unique_id} route
+Index("ix_attachments_file_unique_id", Attachment.meta["file_unique_id"].astext)
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.session import Base
+from app.models.base import TimestampMixin
+
+
+class Blob(Base, TimestampMixin):
+    """A stored object named by the SHA-256 of its content, shared by every reference to it."""
+
+    __tablename__ = "blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    key: Mapped[str] = mapped_column(String(128))
+    size: Mapped[int] = mapped_column(BigInteger)
+    # Attachments, templates and broadcasts pointing at this object
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)
+    # When ref_count last dropped to zero; garbage collected after a grace period
+    released_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    # Preview ``meta`` rendered on first store ({} when there is none), reused by later uploads
+    preview: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
@@ -19,6 +19,10 @@ class Chat(Base, TimestampMixin):
     last_name: Mapped[str | None] = mapped_column(String(128), nullable=True)
     language_code: Mapped[str | None] = mapped_column(String(16), nullable=True)
     photo_url: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    # Avatars are served through /files/tg/{photo_file_unique_id}
+    photo_file_id: Mapped[str | None] = mapped_column(String(256), nullable=True)
+    photo_file_unique_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    photo_updated_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     status: Mapped[ChatStatus] = mapped_column(
         Enum(ChatStatus, name="chatstatus", values_callable=lambda x: [e.value for e in x]),
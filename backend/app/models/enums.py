@@ -23,6 +23,13 @@ class MessageDirection(str, enum.Enum):
     outbound = "OUT"
 
 
+class DeliveryStatus(str, enum.Enum):
+    queued = "queued"
+    sent = "sent"
+    failed = "failed"
+    retrying = "retrying"
+
+
 class MessageType(str, enum.Enum):
     text = "text"
     photo = "photo"
@@ -6,7 +6,7 @@ from sqlalchemy import DateTime, Boolean
 
 from app.db.session import Base
 from app.models.base import TimestampMixin
-from app.models.enums import MessageDirection, MessageType
+from app.models.enums import DeliveryStatus, MessageDirection, MessageType
 
 
 class Message(Base, TimestampMixin):
@@ -29,6 +29,11 @@ class Message(Base, TimestampMixin):
     edited_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     sent_by_user_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     inline_buttons: Mapped[list | None] = mapped_column(JSONB, nullable=True)
+    # Only set for operator replies that go through the outbox
+    delivery_status: Mapped[DeliveryStatus | None] = mapped_column(
+        Enum(DeliveryStatus, name="deliverystatus", values_callable=lambda x: [e.value for e in x]),
+        nullable=True,
+    )
     # Forward info
     forward_from_name: Mapped[str | None] = mapped_column(String(256), nullable=True)
     forward_from_username: Mapped[str | None] = mapped_column(String(128), nullable=True)
@@ -40,3 +45,4 @@ class Message(Base, TimestampMixin):
 
 Index("ix_messages_chat_id", Message.chat_id)
 Index("ix_messages_created_at", Message.created_at)
+Index("ix_messages_chat_telegram_message_id", Message.chat_id, Message.telegram_message_id)
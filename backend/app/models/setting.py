@@ -1,4 +1,4 @@
-from sqlalchemy import String
+from sqlalchemy import Sequence, String
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -11,3 +11,7 @@ class Setting(Base, TimestampMixin):
 
     key: Mapped[str] = mapped_column(String(128), primary_key=True)
     value_json: Mapped[dict] = mapped_column(JSONB, default=dict)
+
+
+# Bumped on every settings write so all workers agree on a single version number
+settings_version_seq = Sequence("settings_version_seq", metadata=Base.metadata)
@@ -30,6 +30,8 @@ class ChatCreateFromBot(BaseModel):
     last_name: str | None = None
     language_code: str | None = None
     photo_url: str | None = None
+    photo_file_id: str | None = None
+    photo_file_unique_id: str | None = None
 
 
 class ChatAssign(BaseModel):
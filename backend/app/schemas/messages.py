@@ -1,8 +1,8 @@
 from datetime import datetime
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from app.models.enums import MessageDirection, MessageType
+from app.models.enums import DeliveryStatus, MessageDirection, MessageType
 from app.schemas.common import Timestamped
 
 
@@ -36,6 +36,8 @@ class MessageFromBot(BaseModel):
     last_name: str | None = None
     language_code: str | None = None
     photo_url: str | None = None
+    photo_file_id: str | None = None
+    photo_file_unique_id: str | None = None
     text: str | None = None
     type: MessageType = MessageType.text
     telegram_message_id: int | None = None
@@ -48,6 +50,28 @@ class MessageFromBot(BaseModel):
     forward_date: datetime | None = None
 
 
+class MessageBatchFromBot(BaseModel):
+    messages: list[MessageFromBot] = Field(..., min_length=1, max_length=500)
+
+
+class UploadedFileFromBot(BaseModel):
+    """file_id Telegram assigned to a file the bot uploaded (or had Telegram fetch by URL)."""
+    local_path: str | None = None
+    url: str | None = None
+    kind: str
+    file_id: str
+
+
+class DeliveryReportFromBot(BaseModel):
+    job_id: str
+    message_id: uuid.UUID | None = None
+    tg_id: int
+    ok: bool
+    telegram_message_id: int | None = None
+    error: str | None = None
+    uploads: list[UploadedFileFromBot] = []
+
+
 class MessageOutgoingFromBot(BaseModel):
     tg_id: int
     text: str | None = None
@@ -58,6 +82,28 @@ class MessageOutgoingFromBot(BaseModel):
     attachments: list[AttachmentIn] = []
 
 
+class AttachmentPatchFromBot(BaseModel):
+    file_unique_id: str
+    url: str | None = None
+    local_path: str | None = None
+    mime: str | None = None
+    name: str | None = None
+    size: int | None = None
+    meta: dict | None = None
+
+
+class MessageEnrichFromBot(BaseModel):
+    tg_id: int
+    telegram_message_id: int
+    type: MessageType | None = None
+    attachments: list[AttachmentPatchFromBot] = []
+
+
+class ImageConvertFromBot(BaseModel):
+    local_path: str
+    name: str
+
+
 class MessageEditedFromBot(BaseModel):
     tg_id: int
     telegram_message_id: int
@@ -90,6 +136,7 @@ class MessageOut(Timestamped):
     sent_by_user_id: uuid.UUID | None = None
     attachments: list[AttachmentOut] = []
     inline_buttons: list[list[InlineButton]] | None = None
+    delivery_status: DeliveryStatus | None = None
     created_at: datetime | None = None
     # Forward info
     forward_from_name: str | None = None
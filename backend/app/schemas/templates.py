@@ -14,6 +14,7 @@ class AttachmentData(BaseModel):
     mime: str | None = None
     name: str | None = None
     size: int | None = None
+    meta: dict | None = None
 
 
 class TemplateCreate(BaseModel):
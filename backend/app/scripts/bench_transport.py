@@ -0,0 +1,68 @@
+"""Compare backend -> bot latency over loopback TCP and the Unix domain socket.
+
+    docker compose exec backend python -m app.scripts.bench_transport --requests 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.core.config import get_settings
+
+
+async def _run(client: httpx.AsyncClient, path: str, requests: int, concurrency: int) -> list[float]:
+    timings: list[float] = []
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker() -> None:
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            resp = await client.get(path)
+            resp.raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings
+
+
+async def bench(name: str, transport: httpx.AsyncHTTPTransport, base_url: str, args: argparse.Namespace) -> None:
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=10) as client:
+        await _run(client, args.path, min(50, args.requests), args.concurrency)  # warm-up
+        started = time.perf_counter()
+        timings = await _run(client, args.path, args.requests, args.concurrency)
+        elapsed = time.perf_counter() - started
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"{name:>4}: {len(timings) / elapsed:8.0f} req/s  "
+        f"mean {statistics.mean(timings):6.3f} ms  p50 {statistics.median(timings):6.3f} ms  p95 {p95:6.3f} ms"
+    )
+
+
+async def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default=settings.bot_base_url)
+    parser.add_argument("--uds", default=settings.bot_uds_path)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    await bench("tcp", httpx.AsyncHTTPTransport(), args.base_url, args)
+    if args.uds:
+        await bench("uds", httpx.AsyncHTTPTransport(uds=args.uds), args.base_url, args)
+    else:
+        print(" uds: skipped, set BOT_UDS_PATH or pass --uds")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
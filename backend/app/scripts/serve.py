@@ -0,0 +1,44 @@
+"""Run the API on TCP and, when BACKEND_UDS_PATH is set, on a Unix domain socket too.
+
+uvicorn's CLI binds either a TCP port or a socket path; serving the same app
+on both lets the bot use the socket while the panel keeps using TCP.
+"""
+import os
+import socket
+import stat
+
+import uvicorn
+
+from app.core.config import get_settings
+
+
+def _tcp_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _unix_socket(path: str) -> socket.socket:
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, 0o666)
+    return sock
+
+
+def main() -> None:
+    settings = get_settings()
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8000"))
+    sockets = [_tcp_socket(host, port)]
+    if settings.backend_uds_path:
+        sockets.append(_unix_socket(settings.backend_uds_path))
+    config = uvicorn.Config("app.main:app")
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Reference-counted, content-addressed file storage.
+
+Uploads are staged, recorded in ``blobs`` and only then moved under their
+SHA-256 key, so identical bytes end up as one object. Every attachment,
+template or broadcast that points at a blob holds a reference; blobs whose
+count stayed at zero for ``blob_gc_grace_hours`` are deleted by the
+``purge_unreferenced_blobs`` maintenance job.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.config import get_settings
+from app.models.blob import Blob
+from app.services.storage import StoredFile, get_storage, key_sha256
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+async def store_blob(
+    db: AsyncSession, chunks: AsyncIterator[bytes], filename: str | None, max_bytes: int | None = None
+) -> StoredFile:
+    """Store bytes once per content hash; the blob starts unreferenced.
+
+    The row is committed before the object is moved into place: the upsert waits
+    for a garbage collector holding the same row, so it can never delete the
+    object after this upload has put it back.
+    """
+    storage = get_storage()
+    staged = await storage.stage_stream(chunks, filename, max_bytes)
+    try:
+        now = datetime.now(timezone.utc)
+        stmt = insert(Blob).values(sha256=staged.sha256, key=staged.key, size=staged.size, ref_count=0, released_at=now)
+        # Restart the grace period of an unreferenced blob that is being uploaded again
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={"released_at": case((Blob.ref_count == 0, now), else_=Blob.released_at)},
+        ).returning(Blob.key)
+        staged.key = await db.scalar(stmt)
+        await db.commit()
+    except BaseException:
+        await storage.discard(staged)
+        raise
+    return await storage.promote(staged)
+
+
+async def find_blob(db: AsyncSession, sha256: str) -> StoredFile | None:
+    """Existing object with this hash, so a client that already knows it can skip the upload."""
+    blob = await db.scalar(select(Blob).where(Blob.sha256 == sha256).with_for_update())
+    if blob is None:
+        return None
+    if blob.ref_count == 0:
+        blob.released_at = datetime.now(timezone.utc)
+    await db.commit()
+    storage = get_storage()
+    return StoredFile(storage.path_for(blob.key), storage.url_for(blob.key), blob.size, blob.sha256)
+
+
+async def blob_preview(db: AsyncSession, sha256: str) -> dict | None:
+    """Preview meta saved for a blob; None if never rendered or its thumbnail is gone."""
+    preview = await db.scalar(select(Blob.preview).where(Blob.sha256 == sha256))
+    if not preview:
+        return preview
+    # Also restarts the thumbnail's grace period until the upload gets referenced
+    if not await find_blob(db, key_sha256(preview.get("thumb_path")) or ""):
+        return None
+    return preview
+
+
+async def save_blob_preview(db: AsyncSession, sha256: str, preview: dict) -> None:
+    await db.execute(update(Blob).where(Blob.sha256 == sha256).values(preview=preview))
+    await db.commit()
+
+
+def attachment_paths(attachments: Iterable) -> list[str | None]:
+    """Storage locations of attachment models, schemas or stored JSON dicts, thumbnails included."""
+    paths = []
+    for att in attachments or []:
+        if isinstance(att, dict):
+            paths.append(att.get("local_path") or att.get("url"))
+            meta = att.get("meta")
+        else:
+            paths.append(att.local_path or att.url)
+            meta = att.meta
+        if meta and meta.get("thumb_path"):
+            paths.append(meta["thumb_path"])
+    return paths
+
+
+async def adjust_refs(db: AsyncSession | AsyncConnection, paths: Iterable[str | None], delta: int) -> None:
+    """Add ``delta`` references per path to the blobs they point at (in the caller's transaction).
+
+    Paths that are not content-addressed (legacy uploads, Telegram files) are ignored.
+    """
+    counts = Counter(sha for sha in map(key_sha256, paths) if sha)
+    for sha, n in sorted(counts.items()):
+        new_count = Blob.ref_count + n * delta
+        await db.execute(
+            update(Blob)
+            .where(Blob.sha256 == sha)
+            .values(
+                ref_count=func.greatest(new_count, 0),
+                released_at=case((new_count <= 0, func.now()), else_=None),
+            )
+        )
+
+
+async def purge_unreferenced(conn: AsyncConnection, batch_size: int) -> int:
+    """Delete up to ``batch_size`` blobs past their grace period, objects first."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.blob_gc_grace_hours)
+    result = await conn.execute(
+        select(Blob.sha256, Blob.key)
+        .where(Blob.ref_count == 0, Blob.released_at < cutoff)
+        .order_by(Blob.released_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+    storage = get_storage()
+    for _, key in rows:
+        await storage.delete(key)
+    await conn.execute(Blob.__table__.delete().where(Blob.sha256.in_([sha for sha, _ in rows])))
+    return len(rows)
@@ -1,18 +1,99 @@
+import importlib.util
+import logging
+import time
+from typing import Any
+
 import httpx
 
 from app.core.config import get_settings
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Per-route timeouts (seconds); sends may include uploads of large local files
+BOT_ROUTE_TIMEOUTS = {
+    "/internal/send": 30.0,  # synchronous sends (broadcasts) wait for Telegram
+    "/internal/delete": 10.0,
+    "/internal/file-path": 10.0,
+}
+DEFAULT_TIMEOUT = 10.0
 
-class BotClient:
-    def __init__(self) -> None:
-        self.base_url = settings.bot_base_url.rstrip("/")
-        self.token = settings.bot_internal_token
+_client: httpx.AsyncClient | None = None
+_stats = {"requests": 0, "errors": 0, "in_flight": 0, "total_ms": 0.0}
+
+
+def get_bot_http() -> httpx.AsyncClient:
+    """Shared keep-alive client for backend -> bot traffic."""
+    global _client
+    if _client is None:
+        http2 = settings.bot_http2 and importlib.util.find_spec("h2") is not None
+        if settings.bot_http2 and not http2:
+            logger.warning("BOT_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+        transport = httpx.AsyncHTTPTransport(
+            uds=settings.bot_uds_path,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.bot_http_max_connections,
+                max_keepalive_connections=settings.bot_http_max_keepalive,
+                keepalive_expiry=60.0,
+            ),
+        )
+        _client = httpx.AsyncClient(
+            base_url=settings.bot_base_url.rstrip("/"),
+            headers={"X-Internal-Token": settings.bot_internal_token},
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=3.0),
+            transport=transport,
+        )
+    return _client
+
+
+async def close_bot_http() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+async def bot_request(method: str, path: str, json_body: dict | None = None) -> httpx.Response:
+    client = get_bot_http()
+    _stats["requests"] += 1
+    _stats["in_flight"] += 1
+    started = time.perf_counter()
+    try:
+        return await client.request(method, path, json=json_body, timeout=BOT_ROUTE_TIMEOUTS.get(path, DEFAULT_TIMEOUT))
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+        _stats["total_ms"] += (time.perf_counter() - started) * 1000
 
-    async def send_to_user(self, tg_id: int, message, attachments) -> int | None:
-        """Send message to user. Returns telegram_message_id if successful."""
-        payload = {
+
+def bot_http_stats() -> dict[str, Any]:
+    stats: dict[str, Any] = {
+        "requests": _stats["requests"],
+        "errors": _stats["errors"],
+        "in_flight": _stats["in_flight"],
+        "avg_ms": round(_stats["total_ms"] / _stats["requests"], 2) if _stats["requests"] else None,
+        "transport": "uds" if settings.bot_uds_path else "tcp",
+        "connections": None,
+        "idle_connections": None,
+    }
+    if _client is not None:
+        try:
+            # httpcore does not expose pool stats publicly
+            connections = _client._transport._pool.connections
+            stats["connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        except Exception:
+            pass
+    return stats
+
+
+class BotClient:
+    @staticmethod
+    def message_payload(tg_id: int, message, attachments) -> dict:
+        return {
             "tg_id": tg_id,
             "message_id": str(message.id),  # Backend message ID for callback
             "text": message.text,
@@ -32,20 +113,34 @@ class BotClient:
                 for a in attachments
             ],
         }
-        headers = {"X-Internal-Token": self.token}
-        async with httpx.AsyncClient(timeout=30) as client:
-            try:
-                resp = await client.post(f"{self.base_url}/internal/send", json=payload, headers=headers)
-                data = resp.json()
-                return data.get("telegram_message_id")
-            except Exception:
+
+    async def queue_to_user(
+        self, tg_id: int, message, attachments, idempotency_key: str | None = None
+    ) -> str | None:
+        """Hand a message to the bot; returns the job id, the result arrives at /api/bot/delivery.
+
+        The bot answers a repeated ``idempotency_key`` with the job it already has
+        instead of sending the message again.
+        """
+        payload = {**self.message_payload(tg_id, message, attachments), "async": True}
+        if idempotency_key:
+            payload["idempotency_key"] = idempotency_key
+        try:
+            resp = await bot_request("POST", "/internal/send", payload)
+            if resp.status_code != 202:
+                logger.warning(f"Bot refused message {message.id}: {resp.status_code} {resp.text}")
                 return None
+            return resp.json().get("job_id")
+        except Exception as e:
+            logger.warning(f"Could not hand message {message.id} to the bot: {e}")
+            return None
+
+    async def send_payload(self, payload: dict) -> httpx.Response:
+        return await bot_request("POST", "/internal/send", payload)
 
     async def delete_message(self, tg_id: int, telegram_message_id: int) -> None:
         payload = {"tg_id": tg_id, "telegram_message_id": telegram_message_id}
-        headers = {"X-Internal-Token": self.token}
-        async with httpx.AsyncClient(timeout=10) as client:
-            try:
-                await client.post(f"{self.base_url}/internal/delete", json=payload, headers=headers)
-            except Exception:
-                pass
+        try:
+            await bot_request("POST", "/internal/delete", payload)
+        except Exception:
+            pass
@@ -1,10 +1,17 @@
-"""Background worker for processing broadcasts."""
+"""Background worker for processing broadcasts.
+
+Recipients are sent to concurrently, up to ``broadcast_concurrency`` at a
+time, paced by one token bucket at ``broadcast_rate_per_second``. When the bot
+reports Telegram's 429 RetryAfter, every sender pauses for that long and the
+rate is halved, then won back step by step as sends succeed.
+"""
 import asyncio
 import logging
+import time
+import uuid
 from datetime import datetime, timezone
 
-import httpx
-from sqlalchemy import select
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import get_settings
@@ -13,19 +20,67 @@ from app.models.broadcast import Broadcast
 from app.models.chat import Chat
 from app.models.message import Message
 from app.models.attachment import Attachment
-from app.models.enums import MessageDirection, MessageType
+from app.models.enums import DeliveryStatus, MessageDirection, MessageType
+from app.services.blobs import adjust_refs, attachment_paths
+from app.services.bot_client import BotClient
+from app.services.upload_ids import merge_upload_ids
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+class BotThrottled(Exception):
+    """Telegram asked the bot to slow down and its own retries ran out."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Paces sends to ``rate`` per second with AIMD adaptation to 429 feedback."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens go out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self, retry_after: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.rate = max(1.0, self.rate / 2)
+        self.tokens = 0.0
+
+    def succeeded(self) -> None:
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+
 async def send_broadcast_message(
     tg_id: int,
     text: str,
     attachments: list | None = None,
     inline_buttons: list | None = None,
-) -> bool:
-    """Send a broadcast message to a single user via the bot."""
+) -> dict | None:
+    """Send a broadcast message to a single user via the bot; returns the bot's result or None."""
     try:
         payload = {
             "tg_id": tg_id,
@@ -33,43 +88,94 @@ async def send_broadcast_message(
             "type": "text",
             "attachments": attachments or [],
             "inline_buttons": inline_buttons,
+            # Queued behind operator replies in the bot's send scheduler
+            "priority": "broadcast",
         }
-        headers = {"X-Internal-Token": settings.bot_internal_token}
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post(
-                f"{settings.bot_base_url.rstrip('/')}/internal/send",
-                json=payload,
-                headers=headers,
-            )
-            return resp.status_code == 200
+        resp = await BotClient().send_payload(payload)
     except Exception as e:
         logger.error(f"Failed to send broadcast to {tg_id}: {e}")
-        return False
+        return None
+    if resp.status_code == 429:
+        raise BotThrottled(float(resp.json().get("retry_after") or 1))
+    return resp.json() if resp.status_code == 200 else None
+
+
+async def _deliver(bucket: TokenBucket, tg_id: int, broadcast: Broadcast, attachments: list | None) -> dict | None:
+    for attempt in range(settings.broadcast_max_attempts):
+        await bucket.acquire()
+        try:
+            result = await send_broadcast_message(
+                tg_id=tg_id,
+                text=broadcast.body,
+                attachments=attachments,
+                inline_buttons=broadcast.inline_buttons,
+            )
+        except BotThrottled as e:
+            logger.warning(f"Broadcast {broadcast.id} throttled for {e.retry_after}s")
+            bucket.throttled(e.retry_after)
+            continue
+        if result is not None:
+            bucket.succeeded()
+        return result
+    return None
+
+
+def _progress(sent: int, failed: int, total: int, elapsed: float, bucket: TokenBucket | None = None) -> dict:
+    stats = {
+        "sent": sent,
+        "failed": failed,
+        "total": total,
+        "per_second": round((sent + failed) / elapsed, 1) if elapsed > 0 else None,
+    }
+    if bucket is not None:
+        stats["rate_limit"] = round(bucket.rate, 1)
+    return stats
+
+
+def _recipient_filter(broadcast: Broadcast) -> list:
+    # Get chats filtered by target_statuses (supports multiple statuses)
+    target_statuses = broadcast.target_statuses or ["all"]
+    if "all" in target_statuses:
+        return []
+    # Convert lowercase status names to uppercase enum values
+    status_mapping = {"new": "NEW", "active": "ACTIVE", "closed": "CLOSED", "escalated": "ESCALATED"}
+    uppercase_statuses = [status_mapping.get(s, s.upper()) for s in target_statuses]
+    # Filter by multiple statuses using IN clause
+    return [Chat.status.in_(uppercase_statuses)]
+
+
+async def _recipient_batches(db: AsyncSession, conditions: list):
+    """(chat id, tg_id) rows in keyset-paginated batches; nothing else is loaded."""
+    after = None
+    while True:
+        query = select(Chat.id, Chat.tg_id).where(*conditions).order_by(Chat.id).limit(settings.broadcast_batch_size)
+        if after is not None:
+            query = query.where(Chat.id > after)
+        batch = (await db.execute(query)).all()
+        if not batch:
+            return
+        yield batch
+        if len(batch) < settings.broadcast_batch_size:
+            return
+        after = batch[-1].id
 
 
 async def process_broadcast(broadcast: Broadcast, db: AsyncSession) -> None:
-    """Process a single broadcast, sending it to all users."""
+    """Process a single broadcast, sending it to all users.
+
+    Recipients are read in keyset batches and each batch's messages are
+    committed before the next is read, so memory stays flat with audience size.
+    """
     logger.info(f"Processing broadcast {broadcast.id}")
     
     # Update status to in_progress
     broadcast.status = "in_progress"
     await db.commit()
     
-    # Get chats filtered by target_statuses (supports multiple statuses)
-    target_statuses = broadcast.target_statuses or ["all"]
-    if "all" in target_statuses:
-        query = select(Chat)
-    else:
-        # Convert lowercase status names to uppercase enum values
-        status_mapping = {"new": "NEW", "active": "ACTIVE", "closed": "CLOSED", "escalated": "ESCALATED"}
-        uppercase_statuses = [status_mapping.get(s, s.upper()) for s in target_statuses]
-        # Filter by multiple statuses using IN clause
-        query = select(Chat).where(Chat.status.in_(uppercase_statuses))
-    
-    result = await db.execute(query)
-    chats = result.scalars().all()
+    conditions = _recipient_filter(broadcast)
+    total = await db.scalar(select(func.count()).select_from(Chat).where(*conditions))
     
-    if not chats:
+    if not total:
         logger.warning(f"No chats found for broadcast {broadcast.id}")
         broadcast.status = "completed"
         broadcast.stats = {"sent": 0, "failed": 0, "total": 0}
@@ -78,6 +184,8 @@ async def process_broadcast(broadcast: Broadcast, db: AsyncSession) -> None:
     
     sent = 0
     failed = 0
+    # Recipients reached since the last commit; their messages are written on the next one
+    delivered: list[uuid.UUID] = []
     
     # Convert attachments from dict format to expected format
     attachments_data = None
@@ -93,32 +201,41 @@ async def process_broadcast(broadcast: Broadcast, db: AsyncSession) -> None:
                 "size": att.get("size"),
                 "meta": att.get("meta"),
             })
-    
-    for chat in chats:
-        success = await send_broadcast_message(
-            tg_id=chat.tg_id,
-            text=broadcast.body,
-            attachments=attachments_data,
-            inline_buttons=broadcast.inline_buttons,
-        )
-        if success:
-            sent += 1
+
+    def record(chat_id: uuid.UUID, result: dict | None) -> None:
+        nonlocal sent, failed
+        if result is None:
+            failed += 1
+            return
+        sent += 1
+        delivered.append(chat_id)
+        if result.get("uploads"):
+            # Upload once; every later recipient gets Telegram's copy
+            merge_upload_ids(attachments_data, result["uploads"])
+            stored = [dict(att) for att in broadcast.attachments or []]
+            if merge_upload_ids(stored, result["uploads"]):
+                broadcast.attachments = stored
+
+    async def save(stats: dict) -> None:
+        created = []
+        for chat_id in delivered:
             # Create message in chat for successful sends
             msg = Message(
-                chat_id=chat.id,
+                id=uuid.uuid4(),
+                chat_id=chat_id,
                 direction=MessageDirection.outbound,
                 type=MessageType.text,
                 text=broadcast.body,
                 inline_buttons=broadcast.inline_buttons,
                 sent_by_user_id=getattr(broadcast, "created_by_user_id", None),
+                delivery_status=DeliveryStatus.sent,
             )
-            db.add(msg)
-            
+            created.append(msg)
             # Add attachments to message if any
-            if broadcast.attachments:
-                for att in broadcast.attachments:
-                    attachment = Attachment(
-                        message=msg,
+            for att in broadcast.attachments or []:
+                created.append(
+                    Attachment(
+                        message_id=msg.id,
                         local_path=att.get("local_path"),
                         url=att.get("url"),
                         telegram_file_id=att.get("telegram_file_id"),
@@ -127,20 +244,61 @@ async def process_broadcast(broadcast: Broadcast, db: AsyncSession) -> None:
                         size=att.get("size"),
                         meta=att.get("meta"),
                     )
-                    db.add(attachment)
-            
-            # Update chat's last_message_at
-            chat.last_message_at = datetime.now(timezone.utc)
-        else:
-            failed += 1
-        
-        # Rate limiting - don't send too fast
-        await asyncio.sleep(0.05)  # 20 messages per second max
-    
+                )
+        if delivered:
+            db.add_all(created)
+            # Each recipient's message holds its own reference to the broadcast's files
+            await adjust_refs(db, attachment_paths(broadcast.attachments), len(delivered))
+            await db.execute(
+                update(Chat)
+                .where(Chat.id.in_(delivered))
+                .values(last_message_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            )
+            delivered.clear()
+        broadcast.stats = stats
+        await db.commit()
+        # Written rows are not needed again; keep the identity map small
+        for obj in created:
+            db.expunge(obj)
+
+    bucket = TokenBucket(settings.broadcast_rate_per_second, settings.broadcast_concurrency)
+    started = last_report = time.monotonic()
+
+    async def send(chat_id: uuid.UUID, tg_id: int) -> tuple[uuid.UUID, dict | None]:
+        return chat_id, await _deliver(bucket, tg_id, broadcast, attachments_data)
+
+    async def collect(tasks: set[asyncio.Task]) -> set[asyncio.Task]:
+        nonlocal last_report
+        done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            record(*task.result())
+        now = time.monotonic()
+        if now - last_report >= settings.broadcast_progress_seconds:
+            # Live progress for the panel, which polls the broadcast list
+            last_report = now
+            await save(_progress(sent, failed, total, now - started, bucket))
+        return tasks
+
+    # Media goes to the first recipient alone, so it is uploaded once and the
+    # rest of the audience is sent Telegram's file_id
+    window = 1 if attachments_data else settings.broadcast_concurrency
+    in_flight: set[asyncio.Task] = set()
+    async for batch in _recipient_batches(db, conditions):
+        for chat_id, tg_id in batch:
+            while len(in_flight) >= window:
+                in_flight = await collect(in_flight)
+                if sent:
+                    window = settings.broadcast_concurrency
+            in_flight.add(asyncio.create_task(send(chat_id, tg_id)))
+        # Sends keep running into the next batch; what finished so far is committed now
+        await save(_progress(sent, failed, total, time.monotonic() - started, bucket))
+    while in_flight:
+        in_flight = await collect(in_flight)
+
     # Update broadcast status
     broadcast.status = "completed"
-    broadcast.stats = {"sent": sent, "failed": failed, "total": len(chats)}
-    await db.commit()
+    await save(_progress(sent, failed, total, time.monotonic() - started))
     
     logger.info(f"Broadcast {broadcast.id} completed: {sent} sent, {failed} failed")
 
@@ -0,0 +1,289 @@
+"""Disk-backed LRU cache of Telegram files, keyed by ``file_unique_id``.
+
+A miss starts one background fill per file that downloads into a temporary
+file; every request for that file, including the one that caused the miss,
+streams from the temporary file as it grows. A client that goes away does not
+abort the fill, and concurrent misses cost a single download. Content behind a
+``file_unique_id`` never changes, so cached files are served as immutable.
+
+The directory is shared by every worker process: a hit touches the file's
+access time, and eviction rescans the directory, so ``telegram_cache_max_bytes``
+holds for the whole deployment and not per worker.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator
+
+import aiofiles
+
+from app.core.config import get_settings
+from app.services.telegram_files import open_telegram_file
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHUNK_SIZE = 64 * 1024
+# Temporary files older than this belong to a download that died with its worker
+STALE_TMP_SECONDS = 3600
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class FileUnavailable(RuntimeError):
+    pass
+
+
+class _Fill:
+    """A download in progress; readers follow ``written`` and wait on ``changed``."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.written = 0
+        self.size: int | None = None
+        # Upstream answered; ``size`` stays None when it sent no Content-Length
+        self.started = False
+        self.done = False
+        self.error: Exception | None = None
+        self.changed = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class TelegramFileCache:
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._fills: dict[str, _Fill] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _path(self, file_unique_id: str) -> Path:
+        return self.directory / file_unique_id
+
+    def _scan(self, rank: dict[str, int]) -> list[tuple[str, int]]:
+        """Cached files in the shared directory, least recently used first (runs in a thread)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stale = time.time() - STALE_TMP_SECONDS
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".tmp"):
+                # Another worker may still be writing a recent one
+                if stat.st_mtime < stale:
+                    os.unlink(entry.path)
+                continue
+            # Ties in access time fall back to this worker's own order
+            found.append((stat.st_atime_ns, rank.get(entry.name, -1), entry.name, stat.st_size))
+        return [(name, size) for _, _, name, size in sorted(found)]
+
+    def _trim(self, rank: dict[str, int]) -> tuple[list[tuple[str, int]], int]:
+        """Delete the least recently used files beyond ``max_bytes``; returns what is left."""
+        found = self._scan(rank)
+        total = sum(size for _, size in found)
+        evicted = 0
+        while total > self.max_bytes and evicted < len(found):
+            name, size = found[evicted]
+            total -= size
+            evicted += 1
+            # Readers that already opened the file keep their handle
+            self._path(name).unlink(missing_ok=True)
+        return found[evicted:], evicted
+
+    def _set_entries(self, found: list[tuple[str, int]]) -> None:
+        self._entries = OrderedDict(found)
+        self._total = sum(self._entries.values())
+        self._loaded = True
+
+    async def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self._set_entries(await asyncio.to_thread(self._scan, {}))
+
+    async def _evict(self) -> None:
+        """Trim the directory, counting what other workers cached too."""
+        rank = {name: i for i, name in enumerate(self._entries)}
+        found, evicted = await asyncio.to_thread(self._trim, rank)
+        self.evictions += evicted
+        self._set_entries(found)
+
+    async def lookup(self, file_unique_id: str) -> tuple[Path, int] | None:
+        await self._ensure_loaded()
+        size = self._entries.get(file_unique_id)
+        if size is None:
+            return None
+        path = self._path(file_unique_id)
+        try:
+            # Marks it recently used for the other workers' eviction too
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another worker
+            self._total -= self._entries.pop(file_unique_id)
+            return None
+        self._entries.move_to_end(file_unique_id)
+        self.hits += 1
+        return path, size
+
+    def fill(self, file_unique_id: str, telegram_file_id: str) -> _Fill:
+        """Join the download of this file, starting it if nobody has."""
+        fill = self._fills.get(file_unique_id)
+        if fill is not None:
+            self.coalesced += 1
+            return fill
+        self.misses += 1
+        fill = _Fill(self.directory / f"{file_unique_id}.{uuid.uuid4().hex}.tmp")
+        self._fills[file_unique_id] = fill
+        fill.task = asyncio.create_task(self._download(file_unique_id, telegram_file_id, fill))
+        return fill
+
+    async def _download(self, file_unique_id: str, telegram_file_id: str, fill: _Fill) -> None:
+        try:
+            await self._ensure_loaded()
+            resp = await open_telegram_file(telegram_file_id)
+            if resp is None:
+                raise FileUnavailable(file_unique_id)
+            try:
+                if resp.headers.get("content-length"):
+                    fill.size = int(resp.headers["content-length"])
+                fill.started = True
+                fill.notify()
+                async with aiofiles.open(fill.path, "wb") as f:
+                    async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                        await f.write(chunk)
+                        await f.flush()
+                        fill.written += len(chunk)
+                        fill.notify()
+            finally:
+                await resp.aclose()
+            fill.size = fill.written
+            os.replace(fill.path, self._path(file_unique_id))
+            fill.path = self._path(file_unique_id)
+            self._entries[file_unique_id] = fill.size
+            self._entries.move_to_end(file_unique_id)
+            await self._evict()
+        except BaseException as e:
+            # Cancellation included: readers must see an error, not a finished fill without a file
+            fill.error = e if isinstance(e, FileUnavailable) else FileUnavailable(str(e) or type(e).__name__)
+            if fill.path != self._path(file_unique_id):
+                fill.path.unlink(missing_ok=True)
+            if not isinstance(e, Exception):
+                raise
+            logger.warning(f"Caching Telegram file {file_unique_id} failed: {e!r}")
+        finally:
+            fill.done = True
+            self._fills.pop(file_unique_id, None)
+            fill.notify()
+
+    async def wait_size(self, fill: _Fill) -> int | None:
+        """Wait until upstream answers; None if it sent no length (stream it chunked)."""
+        while not fill.started and not fill.done:
+            await fill.changed.wait()
+        if fill.error:
+            raise fill.error
+        return fill.size
+
+    async def wait_done(self, fill: _Fill) -> tuple[Path, int]:
+        while not fill.done:
+            await fill.changed.wait()
+        if fill.error:
+            raise fill.error
+        return fill.path, fill.size or 0
+
+    async def tail(self, fill: _Fill) -> AsyncIterator[bytes]:
+        """Stream a file while it is being downloaded."""
+        f = None
+        while f is None:
+            if fill.error:
+                raise fill.error
+            try:
+                # The handle stays valid when the finished file is renamed or evicted
+                f = await aiofiles.open(fill.path, "rb")
+            except FileNotFoundError:
+                if fill.done and not fill.error:
+                    raise FileUnavailable(str(fill.path))
+                await fill.changed.wait()
+        try:
+            sent = 0
+            while True:
+                changed = fill.changed
+                if sent < fill.written:
+                    chunk = await f.read(min(CHUNK_SIZE, fill.written - sent))
+                    if chunk:
+                        sent += len(chunk)
+                        yield chunk
+                        continue
+                if fill.done:
+                    if fill.error:
+                        raise fill.error
+                    return
+                await changed.wait()
+        finally:
+            await f.close()
+
+    async def close(self) -> None:
+        tasks = [fill.task for fill in self._fills.values() if fill.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "downloading": len(self._fills),
+        }
+
+
+async def read_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    """Bytes ``start``..``end`` (inclusive) of a file."""
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Single ``bytes=`` range as inclusive offsets; raises ValueError if unsatisfiable.
+
+    Multi-range requests are answered with the whole file (None), as RFC 9110 allows.
+    """
+    match = RANGE_RE.fullmatch(header.strip()) if header else None
+    if not match or not (match[1] or match[2]):
+        return None
+    first, last = match[1], match[2]
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+telegram_file_cache = TelegramFileCache(settings.telegram_cache_path, settings.telegram_cache_max_bytes)
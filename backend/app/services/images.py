@@ -0,0 +1,222 @@
+"""CPU-bound image work (HEIC decoding, JPEG encoding, previews) off the event loop.
+
+Conversions run in a small process pool so a 12 MP photo does not stall
+WebSockets and API requests in the serving process. Uploads and the bot's
+inbound HEIC documents both go through ``image_service``.
+"""
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+def is_heic_file(data: bytes, filename: str, content_type: str) -> bool:
+    """Check if file is HEIC/HEIF by content-type, extension, or magic bytes."""
+    # Check by content-type
+    if content_type in ('image/heic', 'image/heif'):
+        return True
+    # Check by extension
+    if filename.lower().endswith(('.heic', '.heif')):
+        return True
+    # Check by magic bytes (ftyp box with heic/heif brands)
+    if len(data) >= 12:
+        # HEIC files start with ftyp box
+        if data[4:8] == b'ftyp':
+            brand = data[8:12].decode('ascii', errors='ignore').lower()
+            if brand in ('heic', 'heix', 'hevc', 'hevx', 'mif1', 'msf1'):
+                return True
+    return False
+
+
+def _heic_to_jpeg(data: bytes, quality: int, max_pixels: int) -> bytes:
+    """Runs in a worker process."""
+    import pillow_heif
+
+    # Use open_heif which handles complex HEIC files better (Live Photos, HDR)
+    heif_file = pillow_heif.open_heif(data)
+    width, height = heif_file.size
+    if width * height > max_pixels:
+        raise ImageRejected(f"{width}x{height} exceeds {max_pixels} pixels")
+    img = heif_file.to_pillow()
+    # HEIC can have alpha or other modes; JPEG needs RGB
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def _webp_thumbnail(img, max_side: int, quality: int) -> bytes:
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    img.thumbnail((max_side, max_side))
+    output = io.BytesIO()
+    img.save(output, format='WEBP', quality=quality, method=4)
+    return output.getvalue()
+
+
+def _image_preview(path: str, max_side: int, quality: int, max_pixels: int) -> dict:
+    """Runs in a worker process."""
+    from PIL import Image, ImageOps
+    import pillow_heif
+
+    pillow_heif.register_heif_opener()
+    with Image.open(path) as img:
+        if img.width * img.height > max_pixels:
+            raise ImageRejected(f"{img.width}x{img.height} exceeds {max_pixels} pixels")
+        # Report and render what the viewer sees (EXIF rotation may swap the sides)
+        img = ImageOps.exif_transpose(img)
+        return {"width": img.width, "height": img.height, "thumb": _webp_thumbnail(img, max_side, quality)}
+
+
+def _video_preview(path: str, max_side: int, quality: int, max_pixels: int) -> dict:
+    """Runs in a worker process: probe with ffprobe, poster frame with ffmpeg."""
+    from PIL import Image
+
+    probe = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=width,height:format=duration", "-of", "json", path,
+        ],
+        capture_output=True, check=True, timeout=20,
+    )
+    info = json.loads(probe.stdout)
+    stream = (info.get("streams") or [{}])[0]
+    duration = float(info.get("format", {}).get("duration") or 0)
+    # Skip black intro frames, but stay inside very short clips
+    offset = min(1.0, duration / 2) if duration else 0
+    frame = subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-ss", f"{offset:.2f}", "-i", path,
+            "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "-",
+        ],
+        capture_output=True, check=True, timeout=30,
+    )
+    with Image.open(io.BytesIO(frame.stdout)) as img:
+        return {
+            "width": stream.get("width"),
+            "height": stream.get("height"),
+            "duration": round(duration, 2) if duration else None,
+            "thumb": _webp_thumbnail(img, max_side, quality),
+        }
+
+
+def _release(semaphore: asyncio.Semaphore, future: asyncio.Future) -> None:
+    semaphore.release()
+    if not future.cancelled():
+        # Retrieved so an abandoned job's error is not logged as never retrieved
+        future.exception()
+
+
+class ImageService:
+    def __init__(self) -> None:
+        self._pool: ProcessPoolExecutor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.jobs = 0
+        self.failures = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.image_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._semaphore = asyncio.Semaphore(settings.image_max_concurrency)
+        return self._pool
+
+    async def _run(self, label: str, func, *args):
+        """Run ``func`` in the pool; None if the input is rejected, fails or times out."""
+        pool = self._get_pool()
+        semaphore = self._semaphore
+        loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            started = time.perf_counter()
+            future = loop.run_in_executor(pool, func, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+        # A worker keeps going after a timeout, so its slot is freed only when it is done
+        future.add_done_callback(lambda f: _release(semaphore, f))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), settings.image_timeout_seconds)
+        except ImageRejected as e:
+            self.rejected += 1
+            logger.warning(f"{label} rejected: {e}")
+            return None
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"{label} failed: {e!r}")
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.jobs += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        return result
+
+    async def heic_to_jpeg(self, data: bytes) -> bytes | None:
+        """Convert HEIC/HEIF to JPEG; None if the image is rejected or conversion fails."""
+        if len(data) > settings.image_max_input_bytes:
+            self.rejected += 1
+            logger.warning(f"HEIC conversion skipped: {len(data)} bytes exceeds the input limit")
+            return None
+        return await self._run(
+            "HEIC conversion", _heic_to_jpeg, data, settings.image_jpeg_quality, settings.image_max_pixels
+        )
+
+    async def preview(self, path: str, kind: str) -> dict | None:
+        """Dimensions (and duration for videos) plus a WebP thumbnail of a local file.
+
+        Videos need ffmpeg; without it they are skipped.
+        """
+        if kind == "video":
+            if not shutil.which("ffmpeg"):
+                return None
+            func = _video_preview
+        else:
+            func = _image_preview
+        return await self._run(
+            f"Preview of {path}", func, path, settings.thumbnail_max_side, settings.thumbnail_quality, settings.image_max_pixels
+        )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": settings.image_workers,
+            "jobs": self.jobs,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "waiting": self.waiting,
+            "avg_ms": round(self.total_ms / self.jobs, 2) if self.jobs else None,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+image_service = ImageService()
@@ -0,0 +1,197 @@
+"""Periodic maintenance jobs with Postgres advisory-lock leader election."""
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import get_settings
+from app.db.session import engine
+from app.models.auth import AuditLog, PendingLogin, Session
+from app.models.telegram_code import TelegramAuthCode
+from app.services.blobs import purge_unreferenced
+from app.services.storage_gc import reconcile_batch
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+BatchFunc = Callable[[AsyncConnection, int], Awaitable[int]]
+
+
+def advisory_lock_key(name: str) -> int:
+    """Stable signed 64-bit key for pg_try_advisory_lock derived from the job name."""
+    digest = hashlib.sha256(f"maintenance:{name}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@dataclass
+class MaintenanceJob:
+    name: str
+    interval_seconds: int
+    run_batch: BatchFunc
+    runs: int = 0
+    skipped: int = 0
+    last_run_at: datetime | None = None
+    last_duration_ms: float | None = None
+    last_rows: int = 0
+    total_rows: int = 0
+    last_error: str | None = None
+    next_run_at: float = 0.0
+
+    @property
+    def lock_key(self) -> int:
+        return advisory_lock_key(self.name)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "last_rows": self.last_rows,
+            "total_rows": self.total_rows,
+            "last_error": self.last_error,
+        }
+
+
+_jobs: dict[str, MaintenanceJob] = {}
+
+
+def maintenance_job(name: str, interval_seconds: int) -> Callable[[BatchFunc], BatchFunc]:
+    """Register a batch function as a periodic job.
+
+    The function receives a dedicated connection and the batch size and returns
+    the number of affected rows; it is called repeatedly until a batch comes back
+    short, with a commit after every batch.
+    """
+
+    def decorator(func: BatchFunc) -> BatchFunc:
+        _jobs[name] = MaintenanceJob(name=name, interval_seconds=interval_seconds, run_batch=func)
+        return func
+
+    return decorator
+
+
+def get_jobs() -> list[MaintenanceJob]:
+    return list(_jobs.values())
+
+
+def get_job_stats() -> list[dict]:
+    return [job.stats() for job in _jobs.values()]
+
+
+def _batched_delete(model, condition, batch_size: int):
+    ids = select(model.id).where(condition).limit(batch_size).scalar_subquery()
+    return delete(model).where(model.id.in_(ids))
+
+
+async def run_job(job: MaintenanceJob) -> bool:
+    """Run a job to completion if this process wins its advisory lock."""
+    batch_size = settings.maintenance_batch_size
+    async with engine.connect() as conn:
+        acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": job.lock_key})
+        await conn.commit()
+        if not acquired:
+            job.skipped += 1
+            return False
+        started = time.perf_counter()
+        rows = 0
+        error = None
+        try:
+            for _ in range(settings.maintenance_max_batches):
+                affected = await job.run_batch(conn, batch_size)
+                await conn.commit()
+                rows += affected
+                if affected < batch_size:
+                    break
+                # Let other tasks on the loop breathe between batches
+                await asyncio.sleep(0)
+        except Exception as e:
+            error = str(e)
+            await conn.rollback()
+            logger.error(f"Maintenance job {job.name} failed: {e}", exc_info=True)
+        finally:
+            try:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": job.lock_key})
+                await conn.commit()
+            except Exception:
+                # The lock is released together with the connection anyway
+                pass
+        job.runs += 1
+        job.last_run_at = datetime.now(timezone.utc)
+        job.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        job.last_rows = rows
+        job.total_rows += rows
+        job.last_error = error
+        if rows:
+            logger.info(f"Maintenance job {job.name}: {rows} rows in {job.last_duration_ms} ms")
+        return True
+
+
+async def maintenance_loop() -> None:
+    """Run due jobs; every worker ticks, only the lock holder does the work."""
+    logger.info("Maintenance scheduler started")
+    while True:
+        try:
+            for job in get_jobs():
+                if job.next_run_at <= time.monotonic():
+                    await run_job(job)
+                    job.next_run_at = time.monotonic() + job.interval_seconds
+        except Exception as e:
+            logger.error(f"Maintenance scheduler error: {e}", exc_info=True)
+        await asyncio.sleep(settings.maintenance_tick_seconds)
+
+
+async def start_maintenance_scheduler() -> asyncio.Task:
+    """Start the maintenance scheduler as a background task."""
+    return asyncio.create_task(maintenance_loop())
+
+
+@maintenance_job("purge_pending_logins", interval_seconds=15 * 60)
+async def purge_pending_logins(conn: AsyncConnection, batch_size: int) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=1)
+    result = await conn.execute(_batched_delete(PendingLogin, PendingLogin.expires_at < cutoff, batch_size))
+    return result.rowcount
+
+
+@maintenance_job("purge_telegram_auth_codes", interval_seconds=15 * 60)
+async def purge_telegram_auth_codes(conn: AsyncConnection, batch_size: int) -> int:
+    now = datetime.now(timezone.utc)
+    condition = or_(TelegramAuthCode.used.is_(True), TelegramAuthCode.expires_at < now)
+    result = await conn.execute(_batched_delete(TelegramAuthCode, condition, batch_size))
+    return result.rowcount
+
+
+@maintenance_job("purge_sessions", interval_seconds=60 * 60)
+async def purge_sessions(conn: AsyncConnection, batch_size: int) -> int:
+    now = datetime.now(timezone.utc)
+    revoked_cutoff = now - timedelta(days=settings.session_retention_days)
+    # Sessions idle for longer than the refresh token lifetime can never be used again
+    idle_cutoff = now - timedelta(minutes=settings.refresh_token_exp_minutes)
+    condition = or_(Session.revoked_at < revoked_cutoff, Session.last_used_at < idle_cutoff)
+    result = await conn.execute(_batched_delete(Session, condition, batch_size))
+    return result.rowcount
+
+
+@maintenance_job("purge_audit_logs", interval_seconds=6 * 60 * 60)
+async def purge_audit_logs(conn: AsyncConnection, batch_size: int) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.audit_log_retention_days)
+    result = await conn.execute(_batched_delete(AuditLog, AuditLog.created_at < cutoff, batch_size))
+    return result.rowcount
+
+
+@maintenance_job("purge_unreferenced_blobs", interval_seconds=60 * 60)
+async def purge_unreferenced_blobs(conn: AsyncConnection, batch_size: int) -> int:
+    return await purge_unreferenced(conn, batch_size)
+
+
+@maintenance_job("reconcile_storage", interval_seconds=6 * 60 * 60)
+async def reconcile_storage(conn: AsyncConnection, batch_size: int) -> int:
+    return await reconcile_batch(conn, batch_size)
@@ -0,0 +1,214 @@
+"""Transactional outbox for operator replies.
+
+``create_message`` writes the message and its outbox row in one transaction;
+this worker hands due rows to the bot (which answers 202 with a job id) and the
+bot's delivery report settles them. Status changes go out as ``message_updated``.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.config import get_settings
+from app.db.session import AsyncSessionLocal
+from app.models.chat import Chat
+from app.models.enums import DeliveryStatus
+from app.models.message import Message
+from app.models.outbox import MessageOutbox
+from app.schemas.messages import DeliveryReportFromBot
+from app.schemas.templates import TemplateOut
+from app.services.bot_client import BotClient
+from app.services.serializers import serialize_message
+from app.services.upload_ids import merge_upload_ids, remember_on_templates
+from app.ws.manager import manager
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Errors the bot reports that a retry cannot fix
+PERMANENT_ERRORS = {"too_large"}
+
+_wakeup = asyncio.Event()
+
+
+def enqueue_message(db: AsyncSession, msg: Message) -> None:
+    """Stage delivery of ``msg``; becomes visible to the worker on commit."""
+    msg.delivery_status = DeliveryStatus.queued
+    db.add(MessageOutbox(message_id=msg.id))
+
+
+def notify_outbox() -> None:
+    """Wake the local worker after a commit instead of waiting for the next poll."""
+    _wakeup.set()
+
+
+def _retry_delay(attempts: int) -> float:
+    return min(settings.outbox_max_backoff_seconds, settings.outbox_base_backoff_seconds * 2 ** (attempts - 1))
+
+
+def _record_failure(entry: MessageOutbox, msg: Message, error: str, permanent: bool = False) -> bool:
+    """Schedule a retry with backoff; returns True when delivery is given up and the row should go."""
+    entry.attempts += 1
+    entry.last_error = error
+    entry.job_id = None
+    entry.dispatched_at = None
+    if permanent or entry.attempts >= settings.outbox_max_attempts:
+        msg.delivery_status = DeliveryStatus.failed
+        logger.warning(f"Giving up on message {msg.id} after {entry.attempts} attempts: {error}")
+        return True
+    msg.delivery_status = DeliveryStatus.retrying
+    entry.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=_retry_delay(entry.attempts))
+    return False
+
+
+async def _broadcast_status(messages: list[Message]) -> None:
+    await manager.broadcast_many(
+        [
+            ("message_updated", {"chat_id": str(m.chat_id), "message": serialize_message(m, m.attachments or [])})
+            for m in messages
+        ]
+    )
+
+
+async def dispatch_due(limit: int) -> int:
+    """Hand due outbox rows to the bot; returns the number of rows processed.
+
+    Rows are claimed (``dispatched_at`` set) and committed before the bot is
+    called, so no row lock is held across the HTTP calls. The outbox id goes to
+    the bot as an idempotency key, so a re-dispatched job is not sent twice.
+    """
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=settings.outbox_dispatch_timeout_seconds)
+    changed: list[Message] = []
+    claimed: list[tuple[int, int, Message]] = []
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(MessageOutbox)
+            .where(
+                or_(
+                    and_(MessageOutbox.dispatched_at.is_(None), MessageOutbox.next_attempt_at <= now),
+                    MessageOutbox.dispatched_at < stale,
+                )
+            )
+            .order_by(MessageOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        entries = list(result.scalars().all())
+        if not entries:
+            return 0
+        msg_result = await db.execute(
+            select(Message, Chat.tg_id)
+            .join(Chat, Chat.id == Message.chat_id)
+            .where(Message.id.in_([e.message_id for e in entries]))
+            .options(selectinload(Message.attachments))
+        )
+        messages = {msg.id: (msg, tg_id) for msg, tg_id in msg_result.all()}
+        for entry in entries:
+            if entry.message_id not in messages:
+                await db.delete(entry)
+                continue
+            msg, tg_id = messages[entry.message_id]
+            if entry.dispatched_at is not None:
+                # The bot accepted the job but never reported back (e.g. it restarted):
+                # a failed attempt, retried with backoff like any other
+                if _record_failure(entry, msg, "no delivery report"):
+                    await db.delete(entry)
+                changed.append(msg)
+                continue
+            entry.dispatched_at = now
+            claimed.append((entry.id, tg_id, msg))
+        await db.commit()
+
+    client = BotClient()
+    job_ids = {
+        entry_id: await client.queue_to_user(tg_id, msg, msg.attachments or [], idempotency_key=str(entry_id))
+        for entry_id, tg_id, msg in claimed
+    }
+
+    if job_ids:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(MessageOutbox).where(MessageOutbox.id.in_(list(job_ids))).with_for_update()
+            )
+            for entry in result.scalars().all():
+                if entry.dispatched_at != now:
+                    # Already settled by a delivery report
+                    continue
+                if job_ids[entry.id]:
+                    entry.job_id = job_ids[entry.id]
+                    continue
+                msg = await db.get(Message, entry.message_id, options=[selectinload(Message.attachments)])
+                if _record_failure(entry, msg, "bot unavailable"):
+                    await db.delete(entry)
+                changed.append(msg)
+            await db.commit()
+    if changed:
+        await _broadcast_status(changed)
+    return len(entries)
+
+
+async def apply_delivery_report(db: AsyncSession, report: DeliveryReportFromBot) -> bool:
+    """Settle an outbox row from the bot's delivery callback."""
+    msg_result = await db.execute(
+        select(Message).where(Message.id == report.message_id).options(selectinload(Message.attachments))
+    )
+    msg = msg_result.scalar_one_or_none()
+    if not msg:
+        return False
+    entry = await db.scalar(
+        select(MessageOutbox).where(MessageOutbox.message_id == msg.id).with_for_update()
+    )
+    templates = []
+    if report.ok:
+        if report.telegram_message_id:
+            msg.telegram_message_id = report.telegram_message_id
+        msg.delivery_status = DeliveryStatus.sent
+        if entry is not None:
+            await db.delete(entry)
+        if report.uploads:
+            # Later sends of these files (this message, templates using them) reuse Telegram's copy
+            uploads = [u.model_dump() for u in report.uploads]
+            merge_upload_ids(msg.attachments, uploads)
+            templates = await remember_on_templates(db, uploads)
+    elif entry is not None and (
+        entry.job_id == report.job_id
+        # The report beat the dispatcher to recording the job id
+        or (entry.job_id is None and entry.dispatched_at is not None)
+    ):
+        permanent = report.error in PERMANENT_ERRORS
+        if _record_failure(entry, msg, report.error or "unknown error", permanent=permanent):
+            await db.delete(entry)
+    else:
+        # Report for a job that was already superseded by a retry
+        return True
+    await db.commit()
+    await _broadcast_status([msg])
+    for template in templates:
+        await db.refresh(template)
+        await manager.broadcast("template_updated", {"template": TemplateOut.model_validate(template).model_dump()})
+    return True
+
+
+async def outbox_worker_loop() -> None:
+    logger.info("Message outbox worker started")
+    while True:
+        processed = 0
+        try:
+            processed = await dispatch_due(settings.outbox_batch_size)
+        except Exception as e:
+            logger.error(f"Message outbox worker error: {e}", exc_info=True)
+        if processed < settings.outbox_batch_size:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), settings.outbox_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+
+
+async def start_outbox_worker() -> asyncio.Task:
+    """Start the message outbox worker as a background task."""
+    return asyncio.create_task(outbox_worker_loop())
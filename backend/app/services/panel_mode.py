@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.chat import Chat
 from app.models.enums import ChatStatus, MessageDirection, MessageType
 from app.models.message import Message
-from app.models.setting import Setting
+from app.services.settings_cache import settings_cache
 
 PANEL_MODE_KEY = "panel_mode"
 PANEL_MODE_TEST = "test"
@@ -19,10 +19,9 @@ TEST_CHAT_LAST_NAME = "Пользователь"
 
 
 async def get_panel_mode(db: AsyncSession) -> str:
-    result = await db.execute(select(Setting).where(Setting.key == PANEL_MODE_KEY))
-    setting = result.scalar_one_or_none()
-    if setting and isinstance(setting.value_json, dict):
-        mode = setting.value_json.get("mode")
+    value = await settings_cache.get(PANEL_MODE_KEY)
+    if isinstance(value, dict):
+        mode = value.get("mode")
         if mode in (PANEL_MODE_TEST, PANEL_MODE_PROD):
             return mode
     return PANEL_MODE_PROD
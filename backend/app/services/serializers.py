@@ -8,18 +8,34 @@ from app.core.config import get_settings
 
 settings = get_settings()
 
-def _proxy_telegram_url(url: str | None) -> str | None:
-    if not url:
+def _backend_base() -> str:
+    # Extract base URL from storage_public_base_url to make absolute proxy URL
+    base = settings.storage_public_base_url.rstrip("/")
+    # Remove /static suffix to get backend origin
+    if base.endswith("/static"):
+        base = base[:-7]
+    return base
+
+
+TELEGRAM_FILE_URL = "https://api.telegram.org/file/bot"
+
+
+def telegram_file_route(file_unique_id: str) -> str:
+    """Backend route serving a Telegram file by its ``file_unique_id``."""
+    return f"{_backend_base()}{settings.api_prefix}/files/tg/{quote(str(file_unique_id), safe='')}"
+
+
+def _telegram_file_url(url: str | None, telegram_file_id: str | None, meta: dict | None) -> str | None:
+    """Stable route for files kept only by file_id.
+
+    Legacy download URLs embed the bot token; they are replaced by the route or dropped.
+    """
+    if url and not url.startswith(TELEGRAM_FILE_URL):
         return url
-    if url.startswith("https://api.telegram.org/file/bot"):
-        encoded = quote(url, safe="")
-        # Extract base URL from storage_public_base_url to make absolute proxy URL
-        base = settings.storage_public_base_url.rstrip("/")
-        # Remove /static suffix to get backend origin
-        if base.endswith("/static"):
-            base = base[:-7]
-        return f"{base}{settings.api_prefix}/files/proxy?url={encoded}"
-    return url
+    file_unique_id = (meta or {}).get("file_unique_id")
+    if not telegram_file_id or not file_unique_id:
+        return None
+    return telegram_file_route(file_unique_id)
 
 
 def serialize_message(message, attachments: Iterable | None = None) -> dict:
@@ -39,8 +55,8 @@ def serialize_message(message, attachments: Iterable | None = None) -> dict:
                     rel = local_path[len(base):].lstrip("/")
                     if rel:
                         att = {**att, "url": f"{settings.storage_public_base_url.rstrip('/')}/{rel}"}
-            if att.get("url"):
-                att = {**att, "url": _proxy_telegram_url(str(att.get("url")))}
+            if not att.get("local_path"):
+                att = {**att, "url": _telegram_file_url(att.get("url"), att.get("telegram_file_id"), att.get("meta"))}
             normalized.append(att)
         else:
             if not hasattr(att, "id"):
@@ -54,8 +70,8 @@ def serialize_message(message, attachments: Iterable | None = None) -> dict:
                             rel = local_path[len(base):].lstrip("/")
                             if rel:
                                 data["url"] = f"{settings.storage_public_base_url.rstrip('/')}/{rel}"
-                    if data.get("url"):
-                        data["url"] = _proxy_telegram_url(str(data.get("url")))
+                    if not data.get("local_path"):
+                        data["url"] = _telegram_file_url(data.get("url"), data.get("telegram_file_id"), data.get("meta"))
                     normalized.append(data)
                 except Exception:
                     normalized.append(att)
@@ -67,8 +83,13 @@ def serialize_message(message, attachments: Iterable | None = None) -> dict:
                         rel = local_path[len(base):].lstrip("/")
                         if rel:
                             att.url = f"{settings.storage_public_base_url.rstrip('/')}/{rel}"
-                if getattr(att, "url", None):
-                    att.url = _proxy_telegram_url(str(att.url))
+                if not getattr(att, "local_path", None):
+                    route = _telegram_file_url(
+                        getattr(att, "url", None), getattr(att, "telegram_file_id", None), getattr(att, "meta", None)
+                    )
+                    if route != getattr(att, "url", None):
+                        # Serialize a copy so the route is never flushed back into the row
+                        att = AttachmentOut.model_validate(att).model_copy(update={"url": route})
                 normalized.append(att)
     return MessageOut(
         id=message.id,
@@ -85,4 +106,5 @@ def serialize_message(message, attachments: Iterable | None = None) -> dict:
         created_at=message.created_at,
         attachments=[AttachmentOut.model_validate(a) for a in normalized],
         inline_buttons=getattr(message, "inline_buttons", None),
+        delivery_status=getattr(message, "delivery_status", None),
     ).model_dump()
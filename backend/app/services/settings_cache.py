@@ -0,0 +1,208 @@
+"""Process-local cache of the settings table.
+
+Every write bumps ``settings_version_seq`` and sends ``NOTIFY settings_changed``
+inside the writing transaction; each worker LISTENs on that channel and reloads
+the changed key. Versions are allocated before commit, so notifications can
+arrive out of version order; they are only compared per key. A dropped LISTEN
+connection is re-established (with a full reload), and a periodic full reload
+covers anything else that was missed.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.config import get_settings
+from app.db.session import AsyncSessionLocal, engine
+from app.models.setting import Setting
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+SETTINGS_CHANNEL = "settings_changed"
+
+
+async def bump_settings_version(db: AsyncSession, key: str) -> int:
+    """Allocate a new settings version and notify other workers on commit."""
+    version = int(await db.scalar(text("SELECT nextval('settings_version_seq')")))
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": SETTINGS_CHANNEL, "payload": json.dumps({"key": key, "version": version})},
+    )
+    return version
+
+
+class SettingsCache:
+    def __init__(self) -> None:
+        self._values: dict[str, dict] = {}
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._listener: AsyncConnection | None = None
+        self._watchdog: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+        # Newest version applied per key; ``version`` is the newest seen overall
+        self._versions: dict[str, int] = {}
+        self.version = 0
+
+    async def load(self) -> None:
+        async with self._lock:
+            await self._load()
+
+    async def _load(self) -> None:
+        """Full reload; the caller holds ``_lock``, so per-key reloads cannot interleave."""
+        async with AsyncSessionLocal() as db:
+            # Read the sequence first: anything committed after the snapshot has a higher version
+            row = (await db.execute(text("SELECT last_value, is_called FROM settings_version_seq"))).one()
+            result = await db.execute(select(Setting))
+            values = {s.key: s.value_json for s in result.scalars().all()}
+        floor = int(row.last_value) if row.is_called else 0
+        # Local writes applied while the snapshot was read may be newer than it; keep them
+        newer = {key: version for key, version in self._versions.items() if version > floor}
+        for key in newer:
+            if key in self._values:
+                values[key] = self._values[key]
+            else:
+                values.pop(key, None)
+        self._values = values
+        self._versions = newer
+        self._loaded_at = time.monotonic()
+        self._set_version(floor)
+
+    async def current_version(self) -> int:
+        """The newest version allocated in the database (may be ahead of this cache)."""
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(text("SELECT last_value, is_called FROM settings_version_seq"))).one()
+        return int(row.last_value) if row.is_called else 0
+
+    async def _ensure_fresh(self) -> None:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < settings.cached_settings_ttl_seconds:
+            return
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.cached_settings_ttl_seconds:
+                await self._load()
+
+    async def get(self, key: str) -> dict | None:
+        """Return the cached ``value_json`` for ``key``; treat it as read-only."""
+        await self._ensure_fresh()
+        return self._values.get(key)
+
+    async def get_many(self, keys: list[str]) -> dict[str, dict | None]:
+        await self._ensure_fresh()
+        return {key: self._values.get(key) for key in keys}
+
+    def apply(self, key: str, value: dict | None, version: int) -> None:
+        """Apply a committed write made by this process without a round trip."""
+        if version < self._versions.get(key, 0):
+            return
+        self._versions[key] = version
+        if value is None:
+            self._values.pop(key, None)
+        else:
+            self._values[key] = value
+        self._set_version(version)
+
+    def _set_version(self, version: int) -> None:
+        if version > self.version:
+            self.version = version
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        """Wait until the cache moves past ``version``; False on timeout."""
+        if self.version > version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _reload_key(self, key: str, version: int) -> None:
+        try:
+            # Serialized with full loads, so the newest read is always applied last
+            async with self._lock:
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(select(Setting).where(Setting.key == key))
+                    setting = result.scalar_one_or_none()
+                self.apply(key, setting.value_json if setting else None, version)
+        except Exception as e:
+            logger.warning(f"Settings cache reload of {key} failed, forcing full reload: {e}")
+            self._loaded_at = None
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            key, version = data["key"], int(data["version"])
+        except Exception:
+            self._loaded_at = None
+            return
+        if version <= self._versions.get(key, 0):
+            return
+        asyncio.get_running_loop().create_task(self._reload_key(key, version))
+
+    def _listening(self) -> bool:
+        if self._listener is None or self._listener.closed:
+            return False
+        try:
+            return not self._listener.sync_connection.connection.dbapi_connection.driver_connection.is_closed()
+        except Exception:
+            return False
+
+    async def _listen(self) -> None:
+        self._listener = await engine.connect()
+        raw = await self._listener.get_raw_connection()
+        await raw.driver_connection.add_listener(SETTINGS_CHANNEL, self._on_notify)
+
+    async def _watch(self) -> None:
+        """Re-establish a dead LISTEN connection; changes missed meanwhile come with a full reload."""
+        while True:
+            await asyncio.sleep(settings.cached_settings_listener_check_seconds)
+            if self._listening():
+                continue
+            await self._close_listener()
+            try:
+                await self._listen()
+                await self.load()
+                logger.info("Settings cache listener reconnected")
+            except Exception as e:
+                logger.warning(f"Settings cache listener reconnect failed: {e}")
+
+    async def start(self) -> None:
+        """Load all settings and subscribe to change notifications."""
+        try:
+            await self.load()
+        except Exception as e:
+            logger.warning(f"Settings cache preload failed, will load on first use: {e}")
+        try:
+            await self._listen()
+        except Exception as e:
+            logger.warning(f"Settings cache listener unavailable, will retry: {e}")
+            await self._close_listener()
+        self._watchdog = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        await self._close_listener()
+
+    async def _close_listener(self) -> None:
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        try:
+            raw = await listener.get_raw_connection()
+            await raw.driver_connection.remove_listener(SETTINGS_CHANNEL, self._on_notify)
+        except Exception:
+            pass
+        try:
+            await listener.close()
+        except Exception:
+            pass
+
+
+settings_cache = SettingsCache()
@@ -1,6 +1,14 @@
+import asyncio
+import bisect
+import hashlib
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
+from typing import AsyncIterator
 
 import aiofiles
 
@@ -8,34 +16,189 @@ from app.core.config import get_settings
 
 settings = get_settings()
 
+# S3 multipart parts must be at least 5 MiB (except the last one)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+S3_STAGING_PREFIX = "staging/"
+# Orphans moved aside by the storage reconciliation job
+ARCHIVE_PREFIX = "archive/"
+
 
 class StorageError(RuntimeError):
     pass
 
 
-def _make_key(filename: str | None) -> str:
-    ext = ""
+class StorageLimitExceeded(StorageError):
+    pass
+
+
+@dataclass
+class StoredFile:
+    local_path: str
+    url: str
+    size: int
+    sha256: str
+
+
+@dataclass
+class StorageEntry:
+    key: str
+    size: int
+    modified_at: datetime
+
+
+@dataclass
+class StagedFile:
+    """Bytes written under a temporary name, not yet visible under their content key."""
+
+    temp: str
+    key: str
+    size: int
+    sha256: str
+
+
+def _extension(filename: str | None) -> str:
     if filename and "." in filename:
-        ext = "." + filename.rsplit(".", 1)[-1]
-    return f"{uuid.uuid4().hex}{ext}"
+        ext = filename.rsplit(".", 1)[-1].lower()
+        if ext.isalnum() and len(ext) <= 10:
+            return "." + ext
+    return ""
+
+
+def content_key(sha256: str, filename: str | None) -> str:
+    """Objects are named by their SHA-256, so identical bytes share one object."""
+    return f"{sha256}{_extension(filename)}"
+
+
+def key_sha256(path: str | None) -> str | None:
+    """SHA-256 encoded in a content-addressed local path, S3 key or URL."""
+    if not path:
+        return None
+    stem = path.rsplit("/", 1)[-1].split(".", 1)[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    return None
+
+
+class _Meter:
+    """Counts and hashes chunks as they pass, failing once ``max_bytes`` is exceeded."""
+
+    def __init__(self, max_bytes: int | None) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._digest = hashlib.sha256()
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise StorageLimitExceeded(f"File exceeds {self.max_bytes} bytes")
+        self._digest.update(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+
+async def iter_bytes(data: bytes) -> AsyncIterator[bytes]:
+    yield data
 
 
 class LocalStorage:
     def __init__(self, base_path: str) -> None:
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
+        # Sorted file names of the listing pass in progress (see list_page)
+        self._listing: list[str] | None = None
+
+    def url_for(self, key: str) -> str:
+        return f"{settings.storage_public_base_url}/{key}"
+
+    def path_for(self, key: str) -> str:
+        return str(self.base_path / key)
 
     async def save(self, data: bytes, filename: str | None) -> tuple[str, str]:
-        key = _make_key(filename)
-        path = self.base_path / key
-        async with aiofiles.open(path, "wb") as f:
-            await f.write(data)
-        return str(path), f"{settings.storage_public_base_url}/{key}"
+        stored = await self.save_stream(iter_bytes(data), filename)
+        return stored.local_path, stored.url
+
+    async def save_stream(
+        self, chunks: AsyncIterator[bytes], filename: str | None, max_bytes: int | None = None
+    ) -> StoredFile:
+        return await self.promote(await self.stage_stream(chunks, filename, max_bytes))
+
+    async def stage_stream(
+        self, chunks: AsyncIterator[bytes], filename: str | None, max_bytes: int | None = None
+    ) -> StagedFile:
+        # Written under a temporary name so a half-written file is never served
+        part_path = self.base_path / f"{uuid.uuid4().hex}.part"
+        meter = _Meter(max_bytes)
+        try:
+            async with aiofiles.open(part_path, "wb") as f:
+                async for chunk in chunks:
+                    meter.feed(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        return StagedFile(str(part_path), content_key(meter.sha256, filename), meter.size, meter.sha256)
+
+    async def promote(self, staged: StagedFile) -> StoredFile:
+        """Move a staged file under its content key; an existing copy is kept as is."""
+        path = self.base_path / staged.key
+        if path.exists():
+            os.unlink(staged.temp)
+        else:
+            os.replace(staged.temp, path)
+        return StoredFile(str(path), self.url_for(staged.key), staged.size, staged.sha256)
+
+    async def discard(self, staged: StagedFile) -> None:
+        Path(staged.temp).unlink(missing_ok=True)
+
+    async def delete(self, key: str) -> None:
+        (self.base_path / key).unlink(missing_ok=True)
+
+    async def archive(self, key: str) -> None:
+        target = self.base_path / ARCHIVE_PREFIX / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.base_path / key, target)
+
+    def _list_page(self, after: str | None, limit: int) -> tuple[list[StorageEntry], str | None]:
+        if after is None or self._listing is None:
+            # One sorted scan per pass; later pages resume from the cursor in it
+            with os.scandir(self.base_path) as entries:
+                self._listing = sorted(entry.name for entry in entries if entry.is_file(follow_symlinks=False))
+        names = self._listing
+        start = bisect.bisect_right(names, after) if after is not None else 0
+        chosen = names[start:start + limit]
+        page = []
+        for name in chosen:
+            try:
+                stat = os.stat(self.base_path / name, follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            page.append(StorageEntry(name, stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc)))
+        next_after = chosen[-1] if start + limit < len(names) else None
+        if next_after is None:
+            self._listing = None
+        return page, next_after
+
+    async def list_page(self, after: str | None, limit: int) -> tuple[list[StorageEntry], str | None]:
+        """Top-level files in key order after ``after`` and the cursor for the next page.
+
+        The archive directory is not listed; the cursor is None after the last page.
+        Files added during a pass are picked up by the next one.
+        """
+        return await asyncio.to_thread(self._list_page, after, limit)
 
 
 class S3Storage:
+    """Shared boto3 client driven from a dedicated thread pool.
+
+    boto3 clients are thread-safe, so one client with a connection pool sized to
+    the executor serves every request; multipart parts upload concurrently.
+    """
+
     def __init__(self) -> None:
         import boto3
+        from botocore.config import Config
 
         if not settings.s3_bucket or not settings.s3_access_key or not settings.s3_secret_key:
             raise StorageError("S3 is not configured")
@@ -45,21 +208,180 @@ class S3Storage:
             aws_access_key_id=settings.s3_access_key,
             aws_secret_access_key=settings.s3_secret_key,
             region_name=settings.s3_region,
+            config=Config(max_pool_connections=settings.s3_max_pool_connections),
         )
         self.bucket = settings.s3_bucket
+        self.part_size = max(S3_MIN_PART_SIZE, settings.s3_part_size_bytes)
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.s3_max_pool_connections, thread_name_prefix="s3"
+        )
 
-    async def save(self, data: bytes, filename: str | None) -> tuple[str, str]:
-        key = _make_key(filename)
-        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+    async def _call(self, method: str, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(getattr(self.client, method), **kwargs)
+        )
+
+    def url_for(self, key: str) -> str:
         if settings.s3_endpoint_url:
-            url = f"{settings.s3_endpoint_url}/{self.bucket}/{key}"
+            return f"{settings.s3_endpoint_url}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    def path_for(self, key: str) -> str:
+        return key
+
+    async def save(self, data: bytes, filename: str | None) -> tuple[str, str]:
+        stored = await self.save_stream(iter_bytes(data), filename)
+        return stored.local_path, stored.url
+
+    async def save_stream(
+        self, chunks: AsyncIterator[bytes], filename: str | None, max_bytes: int | None = None
+    ) -> StoredFile:
+        return await self.promote(await self.stage_stream(chunks, filename, max_bytes))
+
+    async def stage_stream(
+        self, chunks: AsyncIterator[bytes], filename: str | None, max_bytes: int | None = None
+    ) -> StagedFile:
+        """Upload in multipart parts; files smaller than one part go up with a single PUT.
+
+        Up to ``s3_upload_concurrency`` parts are in flight at once, which also
+        bounds how much of the file is held in memory.
+        """
+        key = f"{S3_STAGING_PREFIX}{uuid.uuid4().hex}"
+        meter = _Meter(max_bytes)
+        buffer = bytearray()
+        upload_id: str | None = None
+        parts: list[dict] = []
+        pending: set[asyncio.Task] = set()
+        next_part = 1
+        slots = asyncio.Semaphore(settings.s3_upload_concurrency)
+
+        async def upload_part(number: int, body: bytes) -> None:
+            try:
+                resp = await self._call(
+                    "upload_part", Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+                )
+                parts.append({"ETag": resp["ETag"], "PartNumber": number})
+            finally:
+                slots.release()
+
+        async def start_part() -> None:
+            nonlocal upload_id, next_part
+            if upload_id is None:
+                created = await self._call("create_multipart_upload", Bucket=self.bucket, Key=key)
+                upload_id = created["UploadId"]
+            await slots.acquire()
+            # Surface a failed part before reading further
+            for task in [t for t in pending if t.done()]:
+                pending.discard(task)
+                task.result()
+            task = asyncio.create_task(upload_part(next_part, bytes(buffer)))
+            pending.add(task)
+            next_part += 1
+            buffer.clear()
+
+        try:
+            async for chunk in chunks:
+                meter.feed(chunk)
+                buffer.extend(chunk)
+                if len(buffer) >= self.part_size:
+                    await start_part()
+            if upload_id is None:
+                await self._call("put_object", Bucket=self.bucket, Key=key, Body=bytes(buffer))
+            else:
+                if buffer:
+                    await start_part()
+                await asyncio.gather(*pending)
+                await self._call(
+                    "complete_multipart_upload",
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
+                )
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if upload_id is not None:
+                await self._call("abort_multipart_upload", Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return StagedFile(key, content_key(meter.sha256, filename), meter.size, meter.sha256)
+
+    async def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            await self._call("head_object", Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    async def promote(self, staged: StagedFile) -> StoredFile:
+        """Copy a staged object under its content key server-side; an existing copy is kept."""
+        if not await self._exists(staged.key):
+            await self._call(
+                "copy_object",
+                Bucket=self.bucket,
+                Key=staged.key,
+                CopySource={"Bucket": self.bucket, "Key": staged.temp},
+            )
+        await self.discard(staged)
+        return StoredFile(staged.key, self.url_for(staged.key), staged.size, staged.sha256)
+
+    async def discard(self, staged: StagedFile) -> None:
+        await self.delete(staged.temp)
+
+    async def delete(self, key: str) -> None:
+        await self._call("delete_object", Bucket=self.bucket, Key=key)
+
+    async def download(self, key: str, dest: str) -> None:
+        await self._call("download_file", Bucket=self.bucket, Key=key, Filename=dest)
+
+    async def archive(self, key: str) -> None:
+        await self._call(
+            "copy_object",
+            Bucket=self.bucket,
+            Key=f"{ARCHIVE_PREFIX}{key}",
+            CopySource={"Bucket": self.bucket, "Key": key},
+        )
+        await self.delete(key)
+
+    async def list_page(self, after: str | None, limit: int) -> tuple[list[StorageEntry], str | None]:
+        """Objects in key order after ``after`` and the cursor for the next page, skipping archived ones."""
+        kwargs = {"Bucket": self.bucket, "MaxKeys": limit}
+        if after:
+            kwargs["StartAfter"] = after
+        resp = await self._call("list_objects_v2", **kwargs)
+        contents = resp.get("Contents", [])
+        page = [
+            StorageEntry(obj["Key"], obj["Size"], obj["LastModified"])
+            for obj in contents
+            if not obj["Key"].startswith(ARCHIVE_PREFIX)
+        ]
+        next_after = contents[-1]["Key"] if contents and resp.get("IsTruncated") else None
+        return page, next_after
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+_storage: LocalStorage | S3Storage | None = None
+
+
+def get_storage() -> LocalStorage | S3Storage:
+    global _storage
+    if _storage is None:
+        if settings.storage_backend.lower() == "s3":
+            _storage = S3Storage()
         else:
-            url = f"https://{self.bucket}.s3.amazonaws.com/{key}"
-        return key, url
+            _storage = LocalStorage(settings.storage_local_path)
+    return _storage
 
 
-def get_storage():
-    backend = settings.storage_backend.lower()
-    if backend == "s3":
-        return S3Storage()
-    return LocalStorage(settings.storage_local_path)
+def close_storage() -> None:
+    global _storage
+    if isinstance(_storage, S3Storage):
+        _storage.close()
+    _storage = None
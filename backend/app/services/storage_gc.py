@@ -0,0 +1,107 @@
+"""Reconciliation of stored files against the rows that reference them.
+
+Files nobody references any more (legacy uploads of deleted messages, uploads
+that were never sent, staging leftovers) are found by walking storage page by
+page; the cursor survives between maintenance runs so a large bucket is covered
+over several runs. Content-addressed blobs are tracked by ``blobs`` and always
+count as referenced here: their lifecycle belongs to ``purge_unreferenced_blobs``.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import get_settings
+from app.models.attachment import Attachment
+from app.models.blob import Blob
+from app.models.broadcast import Broadcast
+from app.models.template import Template
+from app.services.storage import StorageEntry, get_storage
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ACTIONS = ("dry_run", "archive", "delete")
+
+_cursor: str | None = None
+stats = {
+    "scanned": 0,
+    "orphans": 0,
+    "orphan_bytes": 0,
+    "archived": 0,
+    "deleted": 0,
+    "bytes_reclaimed": 0,
+    "passes": 0,
+    "last_pass_at": None,
+}
+
+
+# Names (last path segment) of template and broadcast attachments among the batch
+# keys; the JSON is searched in the database rather than loaded into Python
+JSON_REFERENCES = """
+SELECT DISTINCT names.name FROM {table}
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE jsonb_typeof(attachments) WHEN 'array' THEN attachments ELSE '[]'::jsonb END
+) AS item
+CROSS JOIN LATERAL (
+    VALUES (regexp_replace(item->>'local_path', '^.*/', '')), (regexp_replace(item->>'url', '^.*/', ''))
+) AS names(name)
+WHERE names.name = ANY(:keys)
+"""
+
+
+async def _referenced(conn: AsyncConnection, keys: list[str]) -> set[str]:
+    storage = get_storage()
+    referenced = set(
+        (await conn.execute(select(Blob.key).where(Blob.key.in_(keys)))).scalars().all()
+    )
+    paths = {storage.path_for(key): key for key in keys}
+    result = await conn.execute(select(Attachment.local_path).where(Attachment.local_path.in_(list(paths))))
+    referenced.update(paths[path] for path in result.scalars().all())
+    for table in (Template.__tablename__, Broadcast.__tablename__):
+        result = await conn.execute(text(JSON_REFERENCES.format(table=table)), {"keys": keys})
+        referenced.update(result.scalars().all())
+    return referenced
+
+
+async def _handle_orphan(entry: StorageEntry, action: str) -> None:
+    storage = get_storage()
+    stats["orphans"] += 1
+    stats["orphan_bytes"] += entry.size
+    if action == "delete":
+        await storage.delete(entry.key)
+        stats["deleted"] += 1
+        stats["bytes_reclaimed"] += entry.size
+    elif action == "archive":
+        await storage.archive(entry.key)
+        stats["archived"] += 1
+    logger.info(f"Orphaned file {entry.key} ({entry.size} bytes): {action}")
+
+
+async def reconcile_batch(conn: AsyncConnection, batch_size: int) -> int:
+    """Check one page of storage; returns the number of files looked at."""
+    global _cursor
+    action = settings.orphan_gc_action
+    if action not in ACTIONS:
+        raise ValueError(f"orphan_gc_action must be one of {ACTIONS}, got {action!r}")
+    page, next_cursor = await get_storage().list_page(_cursor, batch_size)
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.orphan_gc_grace_hours)
+    candidates = [entry for entry in page if entry.modified_at < cutoff]
+    if candidates:
+        referenced = await _referenced(conn, [entry.key for entry in candidates])
+        for entry in candidates:
+            if entry.key not in referenced:
+                await _handle_orphan(entry, action)
+    stats["scanned"] += len(page)
+    _cursor = next_cursor
+    if next_cursor is None:
+        stats["passes"] += 1
+        stats["last_pass_at"] = datetime.now(timezone.utc)
+        # A short count ends the run; the next run starts a new pass
+        return 0
+    return len(page)
+
+
+def get_storage_gc_stats() -> dict:
+    return {**stats, "action": settings.orphan_gc_action, "cursor": _cursor}
@@ -0,0 +1,139 @@
+"""On-demand resolution of Telegram file_id to a download path.
+
+Attachments are stored by ``telegram_file_id`` only. The bot resolves the
+current ``file_path`` via getFile when a file is actually requested; paths are
+cached for a bit less than Telegram's one-hour validity window.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import httpx
+
+from app.core.config import get_settings
+from app.services.bot_client import bot_request
+from app.services.settings_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+TELEGRAM_FILE_BASE = "https://api.telegram.org/file/bot"
+
+
+class FilePathCache:
+    """Bounded LRU of file_id -> file_path with expiry."""
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._items: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_id: str) -> str | None:
+        item = self._items.get(file_id)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._items[file_id]
+            self.misses += 1
+            return None
+        self._items.move_to_end(file_id)
+        self.hits += 1
+        return item[1]
+
+    def put(self, file_id: str, file_path: str) -> None:
+        self._items[file_id] = (time.monotonic() + self.ttl_seconds, file_path)
+        self._items.move_to_end(file_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, file_id: str) -> None:
+        self._items.pop(file_id, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+file_path_cache = FilePathCache(settings.telegram_file_path_cache_size, settings.telegram_file_path_ttl_seconds)
+_inflight: dict[str, asyncio.Future] = {}
+_http: httpx.AsyncClient | None = None
+
+
+async def _fetch_file_path(file_id: str) -> str | None:
+    resp = await bot_request("POST", "/internal/file-path", {"file_id": file_id})
+    if resp.status_code != 200:
+        return None
+    return resp.json().get("file_path")
+
+
+async def resolve_file_path(file_id: str) -> str | None:
+    """Return the current file_path, asking the bot at most once per file_id at a time."""
+    cached = file_path_cache.get(file_id)
+    if cached:
+        return cached
+    pending = _inflight.get(file_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    _inflight[file_id] = future
+    try:
+        file_path = await _fetch_file_path(file_id)
+        if file_path:
+            file_path_cache.put(file_id, file_path)
+        future.set_result(file_path)
+        return file_path
+    except Exception as e:
+        logger.warning(f"Resolving Telegram file {file_id} failed: {e}")
+        future.set_result(None)
+        return None
+    finally:
+        _inflight.pop(file_id, None)
+
+
+async def telegram_download_url(file_path: str) -> str | None:
+    token_setting = await settings_cache.get("telegram_bot_token")
+    token = token_setting.get("token") if token_setting else None
+    if not token:
+        return None
+    return f"{TELEGRAM_FILE_BASE}{token}/{file_path}"
+
+
+def get_telegram_http() -> httpx.AsyncClient:
+    """Shared keep-alive client for downloads from api.telegram.org."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(20.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _http
+
+
+async def close_telegram_http() -> None:
+    global _http
+    if _http is not None:
+        client, _http = _http, None
+        await client.aclose()
+
+
+async def open_telegram_file(file_id: str) -> httpx.Response | None:
+    """Start streaming a Telegram file; the caller must close the response.
+
+    A stale cached path is dropped and resolved once more before giving up.
+    """
+    client = get_telegram_http()
+    for _ in range(2):
+        file_path = await resolve_file_path(file_id)
+        if not file_path:
+            return None
+        url = await telegram_download_url(file_path)
+        if not url:
+            return None
+        resp = await client.send(client.build_request("GET", url), stream=True)
+        if resp.status_code < 400:
+            return resp
+        await resp.aclose()
+        file_path_cache.invalidate(file_id)
+    return None
@@ -0,0 +1,154 @@
+"""Previews for image and video attachments.
+
+Uploads get their preview before the upload request returns, so messages,
+templates and broadcasts built from them carry it in ``meta`` from the start.
+Attachments that arrive from Telegram are queued here after commit and patched
+in the background, followed by a ``message_updated`` event.
+
+``meta`` gains ``width``, ``height``, ``duration`` (videos) and ``thumb_url``;
+``thumb_path`` keeps the thumbnail blob referenced for as long as the attachment.
+"""
+import asyncio
+import logging
+import os
+import tempfile
+import uuid
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.config import get_settings
+from app.db.session import AsyncSessionLocal
+from app.models.attachment import Attachment
+from app.models.message import Message
+from app.services.blobs import adjust_refs, store_blob
+from app.services.file_cache import FileUnavailable, telegram_file_cache
+from app.services.images import image_service
+from app.services.serializers import serialize_message
+from app.services.storage import S3Storage, get_storage, iter_bytes
+from app.ws.manager import manager
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_queue: asyncio.Queue[uuid.UUID] = asyncio.Queue(maxsize=settings.thumbnail_queue_size)
+
+
+def preview_kind(mime: str | None, size: int | None) -> str | None:
+    """'image' or 'video' when a preview is worth making."""
+    mime = mime or ""
+    if mime.startswith("video/"):
+        return "video"
+    if mime.startswith("image/") and (size is None or size >= settings.thumbnail_min_bytes):
+        return "image"
+    return None
+
+
+async def render_stored_file(local_path: str, kind: str) -> dict | None:
+    """Render a preview of a file in our storage (fetched to a temp file on S3)."""
+    storage = get_storage()
+    if not isinstance(storage, S3Storage):
+        return await image_service.preview(local_path, kind)
+    fd, temp = tempfile.mkstemp(prefix="preview-")
+    os.close(fd)
+    try:
+        await storage.download(local_path, temp)
+        return await image_service.preview(temp, kind)
+    finally:
+        os.unlink(temp)
+
+
+async def store_preview(db: AsyncSession, preview: dict | None) -> dict:
+    """Save the rendered thumbnail and return the ``meta`` fields; empty without a preview."""
+    if not preview:
+        return {}
+    stored = await store_blob(db, iter_bytes(preview["thumb"]), "thumb.webp")
+    meta = {key: value for key, value in preview.items() if key != "thumb" and value is not None}
+    meta.update(thumb_url=stored.url, thumb_path=stored.local_path)
+    return meta
+
+
+def schedule_previews(attachments: Iterable[Attachment]) -> None:
+    """Queue Telegram attachments for preview generation; call after commit."""
+    for att in attachments:
+        if not att.telegram_file_id or (att.meta or {}).get("thumb_url"):
+            continue
+        if not (att.meta or {}).get("file_unique_id") or not preview_kind(att.mime, att.size):
+            continue
+        try:
+            _queue.put_nowait(att.id)
+        except asyncio.QueueFull:
+            logger.warning(f"Preview queue full, skipping attachment {att.id}")
+            return
+
+
+async def _telegram_path(file_unique_id: str, telegram_file_id: str) -> str:
+    cached = await telegram_file_cache.lookup(file_unique_id)
+    if cached:
+        return str(cached[0])
+    # Downloading through the file cache also warms it for the operator about to look
+    path, _ = await telegram_file_cache.wait_done(telegram_file_cache.fill(file_unique_id, telegram_file_id))
+    return str(path)
+
+
+async def generate_preview(attachment_id: uuid.UUID) -> bool:
+    async with AsyncSessionLocal() as db:
+        att = await db.get(Attachment, attachment_id)
+        if att is None or (att.meta or {}).get("thumb_url"):
+            return False
+        kind = preview_kind(att.mime, att.size)
+        if kind is None:
+            return False
+        local_path, telegram_file_id = att.local_path, att.telegram_file_id
+        file_unique_id = (att.meta or {}).get("file_unique_id")
+
+    # Rendering can take a while; no connection is held meanwhile
+    try:
+        if local_path:
+            preview = await render_stored_file(local_path, kind)
+        else:
+            preview = await image_service.preview(await _telegram_path(file_unique_id, telegram_file_id), kind)
+    except FileUnavailable:
+        return False
+    if not preview:
+        return False
+
+    async with AsyncSessionLocal() as db:
+        meta = await store_preview(db, preview)
+        att = await db.get(Attachment, attachment_id, with_for_update=True)
+        if att is None or (att.meta or {}).get("thumb_url"):
+            await db.commit()
+            return False
+        att.meta = {**(att.meta or {}), **meta}
+        await adjust_refs(db, [meta["thumb_path"]], 1)
+        await db.commit()
+        result = await db.execute(
+            select(Message).where(Message.id == att.message_id).options(selectinload(Message.attachments))
+        )
+        msg = result.scalar_one_or_none()
+    if msg is not None:
+        await manager.broadcast(
+            "message_updated",
+            {"chat_id": str(msg.chat_id), "message": serialize_message(msg, msg.attachments or [])},
+        )
+    return True
+
+
+async def _worker() -> None:
+    while True:
+        attachment_id = await _queue.get()
+        try:
+            await generate_preview(attachment_id)
+        except Exception as e:
+            logger.error(f"Preview for attachment {attachment_id} failed: {e}", exc_info=True)
+
+
+async def thumbnail_worker_loop() -> None:
+    await asyncio.gather(*(_worker() for _ in range(settings.thumbnail_concurrency)))
+
+
+async def start_thumbnail_worker() -> asyncio.Task:
+    """Start the preview workers as a background task."""
+    return asyncio.create_task(thumbnail_worker_loop())
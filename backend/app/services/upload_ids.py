@@ -0,0 +1,70 @@
+"""file_ids Telegram assigned to files the bot uploaded, kept in attachment ``meta``.
+
+The bot reports them after a send and passes them back on later sends of the
+same attachment, template or broadcast, so the bytes go up only once. Ids are
+kept per send method (``photo``, ``video``, ``document``...) because Telegram
+does not accept a photo's id for a document and vice versa.
+"""
+from typing import Iterable
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.template import Template
+
+META_KEY = "upload_file_ids"
+
+
+def merge_upload_ids(attachments: Iterable | None, uploads: list[dict]) -> bool:
+    """Merge reported file_ids into the ``meta`` of matching attachments, in place.
+
+    Works on attachment models and stored JSON dicts; files are matched by
+    their storage location. Returns whether anything changed.
+    """
+    by_path: dict[str, dict[str, str]] = {}
+    for upload in uploads:
+        path = upload.get("local_path") or upload.get("url")
+        if path:
+            by_path.setdefault(path, {})[upload["kind"]] = upload["file_id"]
+    changed = False
+    for att in attachments or []:
+        is_dict = isinstance(att, dict)
+        path = (att.get("local_path") or att.get("url")) if is_dict else (att.local_path or att.url)
+        ids = by_path.get(path) if path else None
+        if not ids:
+            continue
+        meta = (att.get("meta") if is_dict else att.meta) or {}
+        known = meta.get(META_KEY) or {}
+        if all(known.get(kind) == file_id for kind, file_id in ids.items()):
+            continue
+        merged = {**meta, META_KEY: {**known, **ids}}
+        if is_dict:
+            att["meta"] = merged
+        else:
+            att.meta = merged
+        changed = True
+    return changed
+
+
+async def remember_on_templates(db: AsyncSession, uploads: list[dict]) -> list[Template]:
+    """Store reported file_ids on the templates that use the same files (in the caller's transaction).
+
+    Returns the templates that changed.
+    """
+    conditions = []
+    for upload in uploads:
+        if upload.get("local_path"):
+            conditions.append(Template.attachments.contains([{"local_path": upload["local_path"]}]))
+        elif upload.get("url"):
+            conditions.append(Template.attachments.contains([{"url": upload["url"]}]))
+    if not conditions:
+        return []
+    result = await db.execute(select(Template).where(or_(*conditions)).with_for_update())
+    changed = []
+    for template in result.scalars().all():
+        # Copies, so the JSONB column sees a new value
+        attachments = [dict(att) for att in template.attachments or []]
+        if merge_upload_ids(attachments, uploads):
+            template.attachments = attachments
+            changed.append(template)
+    return changed
@@ -20,12 +20,19 @@ class ConnectionManager:
             self.active.discard(websocket)
 
     async def broadcast(self, event: str, payload: Any) -> None:
-        message = json.dumps({"event": event, "data": payload}, default=str)
+        await self.broadcast_many([(event, payload)])
+
+    async def broadcast_many(self, events: list[tuple[str, Any]]) -> None:
+        """Send several events in order, encoding each once and skipping dead sockets early."""
+        if not events:
+            return
+        messages = [json.dumps({"event": event, "data": payload}, default=str) for event, payload in events]
         async with self.lock:
             sockets = list(self.active)
         for ws in sockets:
             try:
-                await ws.send_text(message)
+                for message in messages:
+                    await ws.send_text(message)
             except Exception:
                 await self.disconnect(ws)
 
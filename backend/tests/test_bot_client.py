@@ -0,0 +1,58 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import bot_client
+
+
+@pytest.mark.asyncio
+async def test_bot_request_reuses_shared_client_and_counts(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.url.path, request.headers.get("x-internal-token"), request.extensions["timeout"]["read"]))
+        return httpx.Response(200, json={"ok": True, "telegram_message_id": 42})
+
+    client = httpx.AsyncClient(
+        base_url="http://bot",
+        headers={"X-Internal-Token": "secret"},
+        transport=httpx.MockTransport(handler),
+    )
+    monkeypatch.setattr(bot_client, "_client", client)
+    monkeypatch.setattr(bot_client, "_stats", {"requests": 0, "errors": 0, "in_flight": 0, "total_ms": 0.0})
+
+    assert bot_client.get_bot_http() is client
+    await bot_client.BotClient().delete_message(1, 2)
+    resp = await bot_client.BotClient().send_payload({"tg_id": 1, "text": "hi"})
+
+    assert resp.json()["telegram_message_id"] == 42
+    assert seen == [("/internal/delete", "secret", 10.0), ("/internal/send", "secret", 30.0)]
+    stats = bot_client.bot_http_stats()
+    assert stats["requests"] == 2
+    assert stats["errors"] == 0
+    assert stats["in_flight"] == 0
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_queue_to_user_returns_job_id_without_waiting_for_telegram(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(json.loads(request.content))
+        return httpx.Response(202, json={"ok": True, "job_id": "abc"})
+
+    client = httpx.AsyncClient(base_url="http://bot", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(bot_client, "_client", client)
+    monkeypatch.setattr(bot_client, "_stats", {"requests": 0, "errors": 0, "in_flight": 0, "total_ms": 0.0})
+    message = SimpleNamespace(id="m1", text="hi", type="text")
+
+    assert await bot_client.BotClient().queue_to_user(1, message, []) == "abc"
+    assert seen[0]["async"] is True
+    assert seen[0]["message_id"] == "m1"
+    assert "idempotency_key" not in seen[0]
+    assert await bot_client.BotClient().queue_to_user(1, message, [], idempotency_key="7") == "abc"
+    assert seen[1]["idempotency_key"] == "7"
+    await client.aclose()
@@ -0,0 +1,37 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import broadcast_worker
+from app.services.broadcast_worker import BotThrottled, TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_after_burst():
+    bucket = TokenBucket(rate=100, burst=5)
+    started = time.monotonic()
+    await asyncio.gather(*(bucket.acquire() for _ in range(15)))
+    # 5 at once, the other 10 at 100/s
+    assert 0.08 <= time.monotonic() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_throttling_halves_rate_and_retries(monkeypatch):
+    calls = []
+
+    async def fake_send(tg_id, text, attachments=None, inline_buttons=None):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise BotThrottled(0.05)
+        return {"ok": True}
+
+    monkeypatch.setattr(broadcast_worker, "send_broadcast_message", fake_send)
+    bucket = TokenBucket(rate=40, burst=1)
+    broadcast = SimpleNamespace(id=1, body="hi", inline_buttons=None)
+
+    assert await broadcast_worker._deliver(bucket, 1, broadcast, None) == {"ok": True}
+    assert calls[1] - calls[0] >= 0.05
+    # Halved by the 429, one step back up after the success
+    assert bucket.rate == pytest.approx(20 + 40 / 50)
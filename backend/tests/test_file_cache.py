@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from app.services import file_cache
+
+
+class FakeResponse:
+    def __init__(self, data: bytes, length: bool = True) -> None:
+        self.data = data
+        self.headers = {"content-length": str(len(data))} if length else {}
+        self.closed = False
+
+    async def aiter_bytes(self, chunk_size: int):
+        for start in range(0, len(self.data), 4):
+            await asyncio.sleep(0.001)
+            yield self.data[start:start + 4]
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+async def _collect(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_download(tmp_path, monkeypatch):
+    data = b"0123456789abcdefghij"
+    opened = []
+
+    async def fake_open(file_id: str):
+        opened.append(file_id)
+        return FakeResponse(data)
+
+    monkeypatch.setattr(file_cache, "open_telegram_file", fake_open)
+    cache = file_cache.TelegramFileCache(str(tmp_path), max_bytes=1024)
+    assert await cache.lookup("uniq") is None
+
+    fills = [cache.fill("uniq", "file-id") for _ in range(3)]
+    bodies = await asyncio.gather(*(_collect(cache.tail(fill)) for fill in fills))
+    assert bodies == [data] * 3
+    assert opened == ["file-id"]
+    assert cache.stats()["coalesced"] == 2
+
+    path, size = await cache.lookup("uniq")
+    assert size == len(data) and path.read_bytes() == data
+    assert await _collect(file_cache.read_range(path, 2, 5)) == b"2345"
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    async def fake_open(file_id: str):
+        return FakeResponse(b"x" * 10)
+
+    monkeypatch.setattr(file_cache, "open_telegram_file", fake_open)
+    cache = file_cache.TelegramFileCache(str(tmp_path), max_bytes=25)
+    for name in ("a", "b", "c"):
+        await cache.wait_done(cache.fill(name, name))
+        await cache.lookup("a")
+    assert await cache.lookup("b") is None
+    assert await cache.lookup("a") is not None
+    assert cache.stats()["bytes"] == 20
+
+
+@pytest.mark.asyncio
+async def test_eviction_counts_files_cached_by_other_workers(tmp_path, monkeypatch):
+    async def fake_open(file_id: str):
+        return FakeResponse(b"x" * 10)
+
+    monkeypatch.setattr(file_cache, "open_telegram_file", fake_open)
+    first = file_cache.TelegramFileCache(str(tmp_path), max_bytes=25)
+    second = file_cache.TelegramFileCache(str(tmp_path), max_bytes=25)
+    await first.wait_done(first.fill("a", "a"))
+    await second.wait_done(second.fill("b", "b"))
+    await first.wait_done(first.fill("c", "c"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b", "c"]
+    assert await second.lookup("a") is None
+
+
+@pytest.mark.asyncio
+async def test_missing_length_streams_without_waiting(tmp_path, monkeypatch):
+    release = asyncio.Event()
+
+    class SlowResponse(FakeResponse):
+        async def aiter_bytes(self, chunk_size: int):
+            yield self.data
+            await release.wait()
+
+    async def fake_open(file_id: str):
+        return SlowResponse(b"abcd", length=False)
+
+    monkeypatch.setattr(file_cache, "open_telegram_file", fake_open)
+    cache = file_cache.TelegramFileCache(str(tmp_path), max_bytes=1024)
+    fill = cache.fill("uniq", "file-id")
+    assert await asyncio.wait_for(cache.wait_size(fill), 1) is None
+    release.set()
+    assert (await cache.wait_done(fill))[1] == 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_download_fails_readers_and_removes_temp_file(tmp_path, monkeypatch):
+    class EndlessResponse(FakeResponse):
+        async def aiter_bytes(self, chunk_size: int):
+            while True:
+                await asyncio.sleep(0.001)
+                yield b"x"
+
+    async def fake_open(file_id: str):
+        return EndlessResponse(b"", length=False)
+
+    monkeypatch.setattr(file_cache, "open_telegram_file", fake_open)
+    cache = file_cache.TelegramFileCache(str(tmp_path), max_bytes=1024)
+    fill = cache.fill("uniq", "file-id")
+    await asyncio.sleep(0.02)
+    await cache.close()
+    with pytest.raises(file_cache.FileUnavailable):
+        await cache.wait_done(fill)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parse_range():
+    assert file_cache.parse_range("bytes=0-9", 10) == (0, 9)
+    assert file_cache.parse_range("bytes=5-", 10) == (5, 9)
+    assert file_cache.parse_range("bytes=-3", 10) == (7, 9)
+    assert file_cache.parse_range("bytes=0-1,3-4", 10) is None
+    with pytest.raises(ValueError):
+        file_cache.parse_range("bytes=20-", 10)
@@ -0,0 +1,91 @@
+import asyncio
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from app.services import images
+
+
+def _heic_bytes(size: tuple[int, int]) -> bytes:
+    pillow_heif = pytest.importorskip("pillow_heif")
+    heif = pillow_heif.from_pillow(Image.new("RGB", size, "red"))
+    output = io.BytesIO()
+    try:
+        heif.save(output, quality=50)
+    except Exception:
+        pytest.skip("libheif has no HEVC encoder")
+    return output.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_heic_converted_in_worker_pool(monkeypatch):
+    data = _heic_bytes((64, 48))
+    assert images.is_heic_file(data, "photo", "")
+    service = images.ImageService()
+    try:
+        jpeg = await service.heic_to_jpeg(data)
+        assert Image.open(io.BytesIO(jpeg)).size == (64, 48)
+        assert service.stats()["jobs"] == 1
+
+        monkeypatch.setattr(images.settings, "image_max_pixels", 100)
+        assert await service.heic_to_jpeg(data) is None
+        assert service.stats()["rejected"] == 1
+    finally:
+        service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_image_preview_follows_exif_rotation(tmp_path, monkeypatch):
+    path = tmp_path / "photo.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90° clockwise
+    Image.new("RGB", (200, 100), "blue").save(path, exif=exif)
+    monkeypatch.setattr(images.settings, "thumbnail_max_side", 50)
+    service = images.ImageService()
+    try:
+        preview = await service.preview(str(path), "image")
+    finally:
+        service.shutdown()
+    assert (preview["width"], preview["height"]) == (100, 200)
+    thumb = Image.open(io.BytesIO(preview["thumb"]))
+    assert thumb.format == "WEBP"
+    assert thumb.size == (25, 50)
+
+
+@pytest.mark.asyncio
+async def test_timed_out_job_keeps_its_slot_until_the_worker_is_done(monkeypatch):
+    monkeypatch.setattr(images.settings, "image_max_concurrency", 1)
+    monkeypatch.setattr(images.settings, "image_timeout_seconds", 0.2)
+    service = images.ImageService()
+    try:
+        assert await service._run("Slow job", time.sleep, 1.5) is None
+        assert service.stats()["failures"] == 1
+        # The worker is still busy, so the pool stays bounded
+        assert service._semaphore.locked()
+        for _ in range(200):
+            if not service._semaphore.locked():
+                break
+            await asyncio.sleep(0.05)
+        assert not service._semaphore.locked()
+        assert service.waiting == 0
+    finally:
+        service.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_is_not_counted_as_waiting(monkeypatch):
+    service = images.ImageService()
+    service._get_pool()
+    service._semaphore = asyncio.Semaphore(0)
+    try:
+        task = asyncio.create_task(service._run("Queued job", time.sleep, 0))
+        await asyncio.sleep(0.01)
+        assert service.waiting == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert service.waiting == 0
+    finally:
+        service.shutdown()
@@ -0,0 +1,103 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.api.bot import _ensure_chats, _ingest_events, _ingest_incoming, _new_chat_values
+from app.db.session import Base
+from app.models.chat import Chat
+from app.models.enums import ChatStatus
+from app.schemas.messages import MessageFromBot
+
+
+TEST_DSN = os.getenv("TEST_POSTGRES_DSN")
+
+
+class RecordingSession:
+    def __init__(self) -> None:
+        self.added = []
+
+    def add(self, obj) -> None:
+        self.added.append(obj)
+
+
+def _created_chats(payloads) -> tuple[dict[int, Chat], set[int]]:
+    """What _ensure_chats leaves behind when none of the chats existed yet."""
+    now = datetime.now(timezone.utc)
+    chats = {}
+    for payload in payloads:
+        chats.setdefault(payload.tg_id, Chat(**_new_chat_values(payload, now)))
+    return chats, set(chats)
+
+
+def test_batch_ingest_reuses_new_chat_and_coalesces_chat_updates():
+    db = RecordingSession()
+    payloads = [
+        MessageFromBot(tg_id=1, text="hello", telegram_message_id=10),
+        MessageFromBot(tg_id=2, text="/start", telegram_message_id=20),
+        MessageFromBot(tg_id=1, text="are you there?", telegram_message_id=11),
+    ]
+    chats, new_chats = _created_chats(payloads)
+    items = [_ingest_incoming(db, p, chats, set(), new_chats) for p in payloads]
+
+    assert items[0].chat is items[2].chat
+    assert items[0].created and not items[2].created
+    assert items[2].chat.unread_count == 2
+    assert items[2].chat.status == ChatStatus.new
+    assert [i.send_autoreply for i in items] == [True, False, True]
+    assert all(m.message.chat_id == m.chat.id for m in items)
+
+    events = _ingest_events(items)
+    names = [name for name, _ in events]
+    assert names.count("chat_created") == 2
+    assert names.count("message_created") == 3
+    updates = [data for name, data in events if name == "chat_updated"]
+    assert len(updates) == 2
+    assert {u["id"]: u["last_message_preview"] for u in updates}[str(items[0].chat.id)] == "are you there?"
+
+
+def test_retried_message_is_not_stored_twice():
+    db = RecordingSession()
+    delivered = set()
+    payload = MessageFromBot(tg_id=1, text="hello", telegram_message_id=10)
+    chats, new_chats = _created_chats([payload])
+
+    first = _ingest_incoming(db, payload, chats, delivered, new_chats)
+    assert first is not None
+    assert _ingest_incoming(db, payload, chats, delivered, new_chats) is None
+    assert first.chat.unread_count == 1
+    assert len(db.added) == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_created_concurrently_is_loaded_not_inserted_again():
+    if not TEST_DSN:
+        pytest.skip("TEST_POSTGRES_DSN not set")
+    engine = create_async_engine(TEST_DSN, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    payloads = [
+        MessageFromBot(tg_id=777001, text="hello"),
+        MessageFromBot(tg_id=777002, text="hi"),
+    ]
+
+    try:
+        async with SessionLocal() as db:
+            # Looked up before the other worker committed its insert
+            chats = {}
+            async with SessionLocal() as other:
+                other.add(Chat(**_new_chat_values(payloads[0], datetime.now(timezone.utc))))
+                await other.commit()
+            created = await _ensure_chats(db, payloads, chats)
+            await db.commit()
+
+        assert created == {777002}
+        assert set(chats) == {777001, 777002}
+        items = [_ingest_incoming(RecordingSession(), p, chats, set(), created) for p in payloads]
+        assert [item.created for item in items] == [False, True]
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
@@ -0,0 +1,140 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.session import Base
+from app.models.auth import AuditLog
+from app.services import maintenance
+from app.services.maintenance import MaintenanceJob, advisory_lock_key, get_job_stats, get_jobs, run_job
+
+
+TEST_DSN = os.getenv("TEST_POSTGRES_DSN")
+
+
+class FakeConnection:
+    def __init__(self, acquired: bool) -> None:
+        self.acquired = acquired
+        self.statements = []
+        self.commits = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def scalar(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self.acquired
+
+    async def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+    async def rollback(self) -> None:
+        pass
+
+
+class FakeEngine:
+    def __init__(self, conn: FakeConnection) -> None:
+        self.conn = conn
+
+    def connect(self) -> FakeConnection:
+        return self.conn
+
+
+def _job(sizes: list[int]) -> tuple[MaintenanceJob, list[int]]:
+    calls = []
+
+    async def run_batch(conn, batch_size: int) -> int:
+        calls.append(batch_size)
+        return sizes[len(calls) - 1]
+
+    return MaintenanceJob(name="test_job", interval_seconds=60, run_batch=run_batch), calls
+
+
+def test_advisory_lock_key_is_stable_and_fits_bigint():
+    key = advisory_lock_key("purge_sessions")
+    assert key == advisory_lock_key("purge_sessions")
+    assert key != advisory_lock_key("purge_audit_logs")
+    assert -(2**63) <= key < 2**63
+
+
+def test_builtin_jobs_registered():
+    names = {job.name for job in get_jobs()}
+    assert {"purge_pending_logins", "purge_telegram_auth_codes", "purge_sessions", "purge_audit_logs"} <= names
+    stats = {entry["name"]: entry for entry in get_job_stats()}
+    assert stats["purge_sessions"]["runs"] == 0
+    assert stats["purge_sessions"]["last_duration_ms"] is None
+
+
+@pytest.mark.asyncio
+async def test_job_runs_in_bounded_batches_until_one_comes_back_short(monkeypatch):
+    conn = FakeConnection(acquired=True)
+    monkeypatch.setattr(maintenance, "engine", FakeEngine(conn))
+    monkeypatch.setattr(maintenance.settings, "maintenance_batch_size", 3)
+    job, calls = _job([3, 3, 1, 3])
+
+    assert await run_job(job) is True
+    assert calls == [3, 3, 3]
+    assert job.runs == 1 and job.last_rows == 7 and job.last_error is None
+    # Lock, one commit per batch, unlock
+    assert conn.commits == 5
+    assert "pg_advisory_unlock" in conn.statements[-1]
+
+
+@pytest.mark.asyncio
+async def test_job_stops_at_max_batches(monkeypatch):
+    conn = FakeConnection(acquired=True)
+    monkeypatch.setattr(maintenance, "engine", FakeEngine(conn))
+    monkeypatch.setattr(maintenance.settings, "maintenance_batch_size", 2)
+    monkeypatch.setattr(maintenance.settings, "maintenance_max_batches", 2)
+    job, calls = _job([2, 2, 2])
+
+    assert await run_job(job) is True
+    assert calls == [2, 2]
+    assert job.total_rows == 4
+
+
+@pytest.mark.asyncio
+async def test_job_is_skipped_when_another_worker_holds_the_lock(monkeypatch):
+    conn = FakeConnection(acquired=False)
+    monkeypatch.setattr(maintenance, "engine", FakeEngine(conn))
+    job, calls = _job([1])
+
+    assert await run_job(job) is False
+    assert calls == []
+    assert job.skipped == 1 and job.runs == 0
+    assert ["pg_try_advisory_lock" in s for s in conn.statements] == [True]
+
+
+@pytest.mark.asyncio
+async def test_audit_log_purge_deletes_at_most_one_batch():
+    if not TEST_DSN:
+        pytest.skip("TEST_POSTGRES_DSN not set")
+    engine = create_async_engine(TEST_DSN, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    old = datetime.now(timezone.utc) - timedelta(days=maintenance.settings.audit_log_retention_days + 1)
+
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(
+                AuditLog.__table__.insert(),
+                [{"event_type": "test", "metadata": {}, "created_at": old} for _ in range(5)]
+                + [{"event_type": "test", "metadata": {}, "created_at": datetime.now(timezone.utc)}],
+            )
+            await conn.commit()
+            assert await maintenance.purge_audit_logs(conn, 2) == 2
+            assert await maintenance.purge_audit_logs(conn, 2) == 2
+            assert await maintenance.purge_audit_logs(conn, 2) == 1
+            assert await conn.scalar(select(func.count()).select_from(AuditLog)) == 1
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from app.models.enums import DeliveryStatus
+from app.models.outbox import MessageOutbox
+from app.services import message_outbox
+
+
+def test_failures_back_off_then_give_up(monkeypatch):
+    monkeypatch.setattr(message_outbox.settings, "outbox_max_attempts", 3)
+    monkeypatch.setattr(message_outbox.settings, "outbox_base_backoff_seconds", 2)
+    monkeypatch.setattr(message_outbox.settings, "outbox_max_backoff_seconds", 300)
+    entry = MessageOutbox(attempts=0, job_id="job", dispatched_at=None)
+    msg = SimpleNamespace(id="m1", delivery_status=DeliveryStatus.queued)
+
+    assert message_outbox._record_failure(entry, msg, "bot unavailable") is False
+    assert msg.delivery_status == DeliveryStatus.retrying
+    assert entry.job_id is None
+    assert message_outbox._retry_delay(2) == 4
+    assert message_outbox._record_failure(entry, msg, "bot unavailable") is False
+    assert message_outbox._record_failure(entry, msg, "bot unavailable") is True
+    assert msg.delivery_status == DeliveryStatus.failed
+    assert entry.attempts == 3
+
+
+def test_permanent_error_fails_immediately():
+    entry = MessageOutbox(attempts=0)
+    msg = SimpleNamespace(id="m1", delivery_status=DeliveryStatus.queued)
+    assert message_outbox._record_failure(entry, msg, "too_large", permanent=True) is True
+    assert msg.delivery_status == DeliveryStatus.failed
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import settings_cache as module
+from app.services.settings_cache import SettingsCache
+
+
+def _warm_cache(values: dict, version: int) -> SettingsCache:
+    cache = SettingsCache()
+    cache._values = dict(values)
+    cache._loaded_at = time.monotonic()
+    cache.version = version
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_apply_updates_value_and_version():
+    cache = _warm_cache({"panel_mode": {"mode": "prod"}}, version=3)
+    cache.apply("panel_mode", {"mode": "test"}, 5)
+    assert await cache.get("panel_mode") == {"mode": "test"}
+    assert cache.version == 5
+
+    cache.apply("panel_mode", None, 6)
+    assert await cache.get("panel_mode") is None
+    assert cache.version == 6
+
+
+@pytest.mark.asyncio
+async def test_stale_version_does_not_go_backwards():
+    cache = _warm_cache({}, version=10)
+    cache.apply("messages", {"greeting": "hi"}, 7)
+    assert cache.version == 10
+    assert await cache.get_many(["messages", "missing"]) == {"messages": {"greeting": "hi"}, "missing": None}
+
+
+@pytest.mark.asyncio
+async def test_notification_for_already_applied_version_is_ignored():
+    cache = _warm_cache({}, version=3)
+    cache.apply("messages", {"greeting": "hi"}, 4)
+    cache._on_notify(None, 1, "settings_changed", json.dumps({"key": "messages", "version": 4}))
+    assert await cache.get("messages") == {"greeting": "hi"}
+
+
+@pytest.mark.asyncio
+async def test_late_notification_for_other_key_is_reloaded(monkeypatch):
+    # Versions are taken before commit, so a lower one can be committed (and notified) last
+    cache = _warm_cache({}, version=3)
+    cache.apply("messages", {"greeting": "hi"}, 9)
+    reloaded = []
+
+    async def reload_key(key, version):
+        reloaded.append((key, version))
+
+    monkeypatch.setattr(cache, "_reload_key", reload_key)
+    cache._on_notify(None, 1, "settings_changed", json.dumps({"key": "panel_mode", "version": 8}))
+    cache._on_notify(None, 1, "settings_changed", json.dumps({"key": "messages", "version": 8}))
+    await asyncio.sleep(0)
+    assert reloaded == [("panel_mode", 8)]
+
+
+@pytest.mark.asyncio
+async def test_malformed_notification_forces_full_reload():
+    cache = _warm_cache({}, version=1)
+    cache._on_notify(None, 1, "settings_changed", "not-json")
+    assert cache._loaded_at is None
+
+
+@pytest.mark.asyncio
+async def test_wait_for_change_wakes_on_new_version():
+    cache = _warm_cache({}, version=2)
+    assert await cache.wait_for_change(1, timeout=0.01) is True
+    assert await cache.wait_for_change(2, timeout=0.01) is False
+
+    waiter = asyncio.create_task(cache.wait_for_change(2, timeout=1))
+    await asyncio.sleep(0)
+    cache.apply("messages", {"autoreply": "ok"}, 3)
+    assert await waiter is True
+
+
+@pytest.mark.asyncio
+async def test_long_poll_catches_up_instead_of_reporting_change(monkeypatch):
+    from app.api import bot as bot_api
+
+    cache = _warm_cache({"messages": {"greeting": "old"}}, version=5)
+    loads = []
+
+    async def current_version():
+        return 7
+
+    async def load():
+        loads.append(True)
+        cache._values = {"messages": {"greeting": "new"}}
+        cache.version = 7
+
+    monkeypatch.setattr(cache, "current_version", current_version)
+    monkeypatch.setattr(cache, "load", load)
+    monkeypatch.setattr(bot_api, "settings_cache", cache)
+
+    # The bot already has 7 (seen on another worker): reload, then wait rather than return at once
+    started = time.monotonic()
+    result = await bot_api.sync_settings(version=7, wait=0.05)
+    assert time.monotonic() - started >= 0.05
+    assert loads == [True]
+    assert result["version"] == 7
+    assert result["values"]["messages"] == {"greeting": "new"}
+
+
+class _FakeResult:
+    def __init__(self, row=None, settings=None):
+        self._row = row
+        self._settings = settings or []
+
+    def one(self):
+        return self._row
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._settings
+
+    def scalar_one_or_none(self):
+        return self._settings[0] if self._settings else None
+
+
+class _FakeSession:
+    def __init__(self, execute):
+        self.execute = execute
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.mark.asyncio
+async def test_full_load_keeps_newer_writes_applied_while_it_read(monkeypatch):
+    cache = _warm_cache({"messages": {"greeting": "old"}}, version=9)
+
+    async def execute(statement, *args):
+        if "settings_version_seq" in str(statement):
+            return _FakeResult(row=SimpleNamespace(last_value=10, is_called=True))
+        # A write committed after the sequence read lands while the snapshot is read
+        cache.apply("messages", {"greeting": "new"}, 11)
+        return _FakeResult(settings=[SimpleNamespace(key="messages", value_json={"greeting": "old"})])
+
+    monkeypatch.setattr(module, "AsyncSessionLocal", lambda: _FakeSession(execute))
+    await cache.load()
+    assert await cache.get("messages") == {"greeting": "new"}
+    assert cache._versions == {"messages": 11}
+    assert cache.version == 11
+
+
+@pytest.mark.asyncio
+async def test_key_reload_waits_for_a_full_load(monkeypatch):
+    cache = _warm_cache({}, version=1)
+    reads = []
+
+    async def execute(statement, *args):
+        reads.append("key")
+        return _FakeResult(settings=[SimpleNamespace(key="messages", value_json={"greeting": "hi"})])
+
+    monkeypatch.setattr(module, "AsyncSessionLocal", lambda: _FakeSession(execute))
+    async with cache._lock:
+        task = asyncio.create_task(cache._reload_key("messages", 2))
+        await asyncio.sleep(0.01)
+        assert reads == []
+    await task
+    assert reads == ["key"]
+    assert await cache.get("messages") == {"greeting": "hi"}
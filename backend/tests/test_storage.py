@@ -0,0 +1,46 @@
+import hashlib
+
+import pytest
+
+from app.services.storage import LocalStorage, StorageLimitExceeded, content_key, key_sha256
+
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_local_save_stream_hashes_and_sizes(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    stored = await storage.save_stream(_chunks(b"abc", b"def"), "notes.txt")
+    assert stored.size == 6
+    assert stored.sha256 == hashlib.sha256(b"abcdef").hexdigest()
+    assert stored.url.endswith(".txt")
+    with open(stored.local_path, "rb") as f:
+        assert f.read() == b"abcdef"
+
+
+@pytest.mark.asyncio
+async def test_local_save_stream_enforces_limit(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with pytest.raises(StorageLimitExceeded):
+        await storage.save_stream(_chunks(b"x" * 8, b"x" * 8), "big.bin", max_bytes=10)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_identical_content_shares_one_object(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    first = await storage.save_stream(_chunks(b"promo"), "promo.MP4")
+    second = await storage.save_stream(_chunks(b"pro", b"mo"), "again.mp4")
+    assert first.local_path == second.local_path
+    assert key_sha256(first.local_path) == hashlib.sha256(b"promo").hexdigest()
+    assert key_sha256(first.url) == first.sha256
+    assert [p.name for p in tmp_path.iterdir()] == [f"{first.sha256}.mp4"]
+
+
+def test_key_sha256_ignores_legacy_names():
+    assert key_sha256("/data/uploads/0f3c2a9d1e7b4c55a6f0b1d2c3e4f5a6.jpg") is None
+    assert key_sha256(None) is None
+    assert content_key("a" * 64, "../../etc/passwd") == "a" * 64
@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+from app.services import storage_gc
+from app.services.storage import LocalStorage
+
+TEST_DSN = os.getenv("TEST_POSTGRES_DSN")
+
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(storage_gc, "get_storage", lambda: storage)
+    monkeypatch.setattr(storage_gc, "_cursor", None)
+    monkeypatch.setattr(storage_gc, "stats", {**storage_gc.stats, "orphans": 0, "deleted": 0, "bytes_reclaimed": 0})
+    return tmp_path
+
+
+def _file(base, name: str, age_hours: float) -> None:
+    path = base / name
+    path.write_bytes(b"x" * 10)
+    mtime = time.time() - age_hours * 3600
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.asyncio
+async def test_reconcile_deletes_only_old_unreferenced_files(local, monkeypatch):
+    _file(local, "kept.jpg", 100)
+    _file(local, "orphan.jpg", 100)
+    _file(local, "fresh.jpg", 1)
+
+    async def referenced(conn, keys):
+        return {"kept.jpg"} & set(keys)
+
+    monkeypatch.setattr(storage_gc, "_referenced", referenced)
+    monkeypatch.setattr(storage_gc.settings, "orphan_gc_action", "delete")
+    monkeypatch.setattr(storage_gc.settings, "orphan_gc_grace_hours", 72)
+
+    assert await storage_gc.reconcile_batch(None, 2) == 2
+    assert await storage_gc.reconcile_batch(None, 2) == 0
+    assert sorted(p.name for p in local.iterdir()) == ["fresh.jpg", "kept.jpg"]
+    assert storage_gc.stats["bytes_reclaimed"] == 10
+    assert storage_gc._cursor is None
+
+
+@pytest.mark.asyncio
+async def test_reconcile_dry_run_and_archive(local, monkeypatch):
+    _file(local, "orphan.jpg", 100)
+
+    async def referenced(conn, keys):
+        return set()
+
+    monkeypatch.setattr(storage_gc, "_referenced", referenced)
+    monkeypatch.setattr(storage_gc.settings, "orphan_gc_action", "dry_run")
+    await storage_gc.reconcile_batch(None, 10)
+    assert (local / "orphan.jpg").exists()
+    assert storage_gc.stats["orphans"] == 1
+
+    monkeypatch.setattr(storage_gc.settings, "orphan_gc_action", "archive")
+    await storage_gc.reconcile_batch(None, 10)
+    assert (local / "archive" / "orphan.jpg").exists()
+    assert not (local / "orphan.jpg").exists()
+    # The archive directory itself is not listed again
+    page, _ = await storage_gc.get_storage().list_page(None, 10)
+    assert page == []
+
+
+@pytest.mark.asyncio
+async def test_local_listing_scans_the_directory_once_per_pass(local, monkeypatch):
+    for name in ("a", "b", "c", "d", "e"):
+        _file(local, name, 1)
+    scans = []
+    real_scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    storage = storage_gc.get_storage()
+    names, cursor = [], None
+    while True:
+        page, cursor = await storage.list_page(cursor, 2)
+        names += [entry.key for entry in page]
+        if cursor is None:
+            break
+    assert names == ["a", "b", "c", "d", "e"]
+    assert len(scans) == 1
+
+
+@pytest.mark.asyncio
+async def test_referenced_matches_json_attachments_in_the_database():
+    if not TEST_DSN:
+        pytest.skip("TEST_POSTGRES_DSN not set")
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.db.session import Base
+    from app.models.broadcast import Broadcast
+    from app.models.template import Template
+
+    engine = create_async_engine(TEST_DSN, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            Template.__table__.insert().values(
+                title="t", body="b", attachments=[{"local_path": "/data/uploads/kept.jpg", "url": None}]
+            )
+        )
+        await conn.execute(
+            Broadcast.__table__.insert().values(body="b", attachments=[{"url": "/static/sent.png"}])
+        )
+        referenced = await storage_gc._referenced(conn, ["kept.jpg", "sent.png", "orphan.jpg"])
+        assert referenced == {"kept.jpg", "sent.png"}
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
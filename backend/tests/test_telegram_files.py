@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from app.services import telegram_files
+from app.services.serializers import _telegram_file_url
+
+
+@pytest.mark.asyncio
+async def test_resolve_file_path_caches_and_coalesces(monkeypatch):
+    calls = []
+
+    async def fake_fetch(file_id: str) -> str | None:
+        calls.append(file_id)
+        await asyncio.sleep(0.01)
+        return f"documents/{file_id}.pdf"
+
+    monkeypatch.setattr(telegram_files, "_fetch_file_path", fake_fetch)
+    monkeypatch.setattr(telegram_files, "file_path_cache", telegram_files.FilePathCache(10, 60))
+
+    results = await asyncio.gather(*(telegram_files.resolve_file_path("abc") for _ in range(5)))
+    assert results == ["documents/abc.pdf"] * 5
+    assert await telegram_files.resolve_file_path("abc") == "documents/abc.pdf"
+    assert calls == ["abc"]
+
+
+def test_file_path_cache_expires_and_evicts(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(telegram_files.time, "monotonic", lambda: now[0])
+    cache = telegram_files.FilePathCache(max_size=2, ttl_seconds=60)
+    cache.put("a", "p/a")
+    cache.put("b", "p/b")
+    cache.put("c", "p/c")
+    assert cache.get("a") is None
+    assert cache.get("b") == "p/b"
+    now[0] += 61
+    assert cache.get("c") is None
+
+
+def test_telegram_file_url_replaces_expiring_links():
+    meta = {"file_unique_id": "AQADx"}
+    assert _telegram_file_url(None, "file-id", meta).endswith("/api/files/tg/AQADx")
+    legacy = "https://api.telegram.org/file/bot123:abc/photos/file_1.jpg"
+    assert _telegram_file_url(legacy, "file-id", meta).endswith("/api/files/tg/AQADx")
+    assert _telegram_file_url("/static/a.png", "file-id", meta) == "/static/a.png"
+    assert _telegram_file_url(None, None, meta) is None
+
+
+def test_chat_avatar_is_kept_as_file_id_never_as_token_url():
+    from app.api.bot import _update_chat_profile
+    from app.models.chat import Chat
+    from app.schemas.chats import ChatCreateFromBot
+
+    chat = Chat(tg_id=1)
+    leaked = ChatCreateFromBot(tg_id=1, photo_url="https://api.telegram.org/file/bot123:abc/photos/file_1.jpg")
+    assert _update_chat_profile(chat, leaked) is False
+    assert chat.photo_url is None
+
+    payload = ChatCreateFromBot(tg_id=1, photo_file_id="file-id", photo_file_unique_id="AQADx")
+    assert _update_chat_profile(chat, payload) is True
+    assert chat.photo_url.endswith("/api/files/tg/AQADx")
+    assert (chat.photo_file_id, chat.photo_file_unique_id) == ("file-id", "AQADx")
+    assert _update_chat_profile(chat, payload) is False
+
+
+def test_token_urls_never_reach_the_browser():
+    legacy = "https://api.telegram.org/file/bot123:abc/photos/file_1.jpg"
+    assert _telegram_file_url(legacy, None, None) is None
+    assert _telegram_file_url(legacy, "file-id", {}) is None
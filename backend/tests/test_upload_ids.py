@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from app.services.upload_ids import META_KEY, merge_upload_ids
+
+
+def test_upload_ids_merged_by_path_and_kind():
+    stored = [
+        {"local_path": "/data/uploads/a.jpg", "meta": {"width": 10}},
+        {"url": "https://example.com/b.mp4"},
+        {"local_path": "/data/uploads/c.pdf"},
+    ]
+    model = SimpleNamespace(local_path="/data/uploads/a.jpg", url=None, meta={META_KEY: {"document": "D1"}})
+    uploads = [
+        {"local_path": "/data/uploads/a.jpg", "url": None, "kind": "photo", "file_id": "P1"},
+        {"local_path": None, "url": "https://example.com/b.mp4", "kind": "video", "file_id": "V1"},
+    ]
+
+    assert merge_upload_ids(stored, uploads)
+    assert stored[0]["meta"] == {"width": 10, META_KEY: {"photo": "P1"}}
+    assert stored[1]["meta"] == {META_KEY: {"video": "V1"}}
+    assert "meta" not in stored[2]
+    assert not merge_upload_ids(stored, uploads)
+
+    assert merge_upload_ids([model], uploads)
+    assert model.meta[META_KEY] == {"document": "D1", "photo": "P1"}
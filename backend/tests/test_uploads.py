@@ -0,0 +1,34 @@
+import pytest
+
+from app.api import uploads
+from app.services.storage import StoredFile
+
+
+@pytest.mark.asyncio
+async def test_preview_is_rendered_once_per_content(monkeypatch):
+    saved = {}
+    renders = []
+
+    async def fake_blob_preview(db, sha256):
+        return saved.get(sha256)
+
+    async def fake_save_blob_preview(db, sha256, preview):
+        saved[sha256] = preview
+
+    async def fake_render(local_path, kind):
+        renders.append(local_path)
+        return {"thumb": b"webp", "width": 10, "height": 20}
+
+    async def fake_store_preview(db, preview):
+        return {"width": preview["width"], "height": preview["height"], "thumb_path": "/t.webp"}
+
+    monkeypatch.setattr(uploads, "blob_preview", fake_blob_preview)
+    monkeypatch.setattr(uploads, "save_blob_preview", fake_save_blob_preview)
+    monkeypatch.setattr(uploads, "render_stored_file", fake_render)
+    monkeypatch.setattr(uploads, "store_preview", fake_store_preview)
+    stored = StoredFile("/data/a.jpg", "/static/a.jpg", 10 * 1024 * 1024, "a" * 64)
+
+    first = await uploads._upload_result(None, stored, "a.jpg", "image/jpeg")
+    again = await uploads._upload_result(None, stored, "b.jpg", "image/jpeg")
+    assert first["meta"] == again["meta"] == {"width": 10, "height": 20, "thumb_path": "/t.webp"}
+    assert renders == ["/data/a.jpg"]
@@ -2,15 +2,21 @@ import asyncio
 import html
 import logging
 import os
-import io
+import json
+import signal
+import sqlite3
+import time
 import uuid
-from typing import Any
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
 from datetime import datetime
 
 import httpx
-from aiogram.exceptions import TelegramEntityTooLarge, TelegramBadRequest
+from aiogram.exceptions import TelegramEntityTooLarge, TelegramBadRequest, TelegramRetryAfter
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
 from aiogram.enums import ContentType, ParseMode, ChatAction
 from aiogram.filters import CommandStart, Command
 from aiogram.types import FSInputFile, Message, InputMediaPhoto, InputMediaVideo, InlineKeyboardMarkup, InlineKeyboardButton
@@ -24,75 +30,70 @@ INTERNAL_TOKEN = os.getenv("BOT_INTERNAL_TOKEN", "change-me-bot")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook/telegram")
 PORT = int(os.getenv("BOT_PORT", "8081"))
+# Optional Unix domain sockets on a shared volume: where this bot listens / where the backend listens
+BOT_UDS_PATH = os.getenv("BOT_UDS_PATH", "")
+BACKEND_UDS_PATH = os.getenv("BACKEND_UDS_PATH", "")
 MAX_TELEGRAM_FILE_BYTES = int(os.getenv("TELEGRAM_FILE_LIMIT_MB", "49")) * 1024 * 1024
 UPLOADS_PATH = os.getenv("UPLOADS_PATH", "/data/uploads")
-
-
-def convert_heic_to_jpeg(data: bytes) -> tuple[bytes, str]:
-    """Convert HEIC/HEIF image to JPEG. Returns (data, new_filename)."""
-    try:
-        import pillow_heif
-        from PIL import Image
-        
-        pillow_heif.register_heif_opener()
-        img = Image.open(io.BytesIO(data))
-        
-        # Convert to RGB if necessary
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=92)
-        return output.getvalue(), f"{uuid.uuid4().hex}.jpg"
-    except Exception as e:
-        logger.error(f"HEIC conversion failed: {e}")
-        return data, None
+SETTINGS_SYNC_WAIT = int(os.getenv("SETTINGS_SYNC_WAIT_SEC", "25"))
+PHOTO_CACHE_TTL = float(os.getenv("PHOTO_CACHE_TTL_HOURS", "12")) * 3600
+PHOTO_CACHE_SIZE = int(os.getenv("PHOTO_CACHE_SIZE", "10000"))
+SETTINGS_SYNC_RETRY = int(os.getenv("SETTINGS_SYNC_RETRY_SEC", "3"))
+# How long to wait for further parts of an album before forwarding it
+MEDIA_GROUP_WAIT_MS = int(os.getenv("MEDIA_GROUP_WAIT_MS", "800"))
+INBOUND_MAX_BATCH = int(os.getenv("INBOUND_MAX_BATCH", "100"))
+# Undeliverable events survive restarts here (keep it off the public uploads volume)
+SPOOL_PATH = os.getenv("BOT_SPOOL_PATH", "/data/spool/outbox.sqlite3")
+SPOOL_MAX_BACKOFF = float(os.getenv("BOT_SPOOL_MAX_BACKOFF_SEC", "60"))
+# Telegram flood limits: ~30 msg/s per bot, ~1 msg/s per private chat, 20 msg/min per group
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_PRIVATE_RATE = float(os.getenv("SEND_PRIVATE_RATE", "1"))
+SEND_GROUP_PER_MINUTE = float(os.getenv("SEND_GROUP_PER_MINUTE", "20"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+# Local photos are downscaled and re-encoded before upload; Telegram recompresses them anyway
+OUTBOUND_IMAGE_OPTIMIZE = os.getenv("OUTBOUND_IMAGE_OPTIMIZE", "1").lower() not in ("0", "false", "no")
+OUTBOUND_IMAGE_MAX_SIDE = int(os.getenv("OUTBOUND_IMAGE_MAX_SIDE", "2560"))
+OUTBOUND_IMAGE_QUALITY = int(os.getenv("OUTBOUND_IMAGE_QUALITY", "87"))
+OUTBOUND_IMAGE_MIN_BYTES = int(os.getenv("OUTBOUND_IMAGE_MIN_KB", "300")) * 1024
+# A subdirectory, so the backend's orphan reconciliation (top-level files only) leaves it alone
+OPTIMIZED_PATH = os.path.join(UPLOADS_PATH, "optimized")
 
 
 async def download_and_convert_heic(file_id: str, original_name: str) -> dict | None:
-    """Download HEIC file from Telegram, convert to JPEG, save locally."""
+    """Download a HEIC file from Telegram into the shared uploads volume and have
+    the backend convert it to JPEG in its image worker pool."""
     global bot
     if not bot:
         return None
     
     try:
-        # Download file from Telegram
+        # Download file from Telegram straight to disk
         file = await bot.get_file(file_id)
         if not file.file_path:
             return None
         
-        file_bytes = await bot.download_file(file.file_path)
-        if not file_bytes:
-            return None
-        
-        data = file_bytes.read()
-        
-        # Convert HEIC to JPEG
-        converted_data, new_filename = convert_heic_to_jpeg(data)
-        if not new_filename:
-            # Conversion failed, save as-is
-            new_filename = f"{uuid.uuid4().hex}.heic"
-            converted_data = data
-            mime = "image/heic"
-        else:
-            mime = "image/jpeg"
-        
-        # Save to uploads folder
         os.makedirs(UPLOADS_PATH, exist_ok=True)
+        new_filename = f"{uuid.uuid4().hex}.heic"
         local_path = os.path.join(UPLOADS_PATH, new_filename)
-        with open(local_path, 'wb') as f:
-            f.write(converted_data)
-        
+        await bot.download_file(file.file_path, destination=local_path)
+    except Exception as e:
+        logger.error(f"Failed to download HEIC: {e}")
+        return None
+
+    try:
+        return await backend_request(
+            "POST", "/api/bot/images/heic", {"local_path": local_path, "name": original_name}
+        )
+    except Exception as e:
+        # Conversion failed, keep the HEIC as-is
+        logger.error(f"HEIC conversion failed: {e}")
         return {
             "local_path": local_path,
             "url": f"/static/{new_filename}",
-            "name": original_name.rsplit('.', 1)[0] + ('.jpg' if mime == 'image/jpeg' else '.heic'),
-            "size": len(converted_data),
-            "mime": mime,
+            "name": original_name.rsplit('.', 1)[0] + '.heic',
+            "size": os.path.getsize(local_path),
+            "mime": "image/heic",
         }
-    except Exception as e:
-        logger.error(f"Failed to download/convert HEIC: {e}")
-        return None
 
 
 def build_inline_keyboard(buttons_data: list[list[dict]] | None) -> InlineKeyboardMarkup | None:
@@ -123,33 +124,348 @@ TELEGRAM_TOKEN: str = ""
 router = Router()
 
 
-async def backend_request(method: str, path: str, json_body: dict | None = None) -> Any:
-    headers = {"X-Internal-Token": INTERNAL_TOKEN}
-    async with httpx.AsyncClient(timeout=10) as client:
-        resp = await client.request(method, f"{BACKEND_BASE_URL}{path}", json=json_body, headers=headers)
-        resp.raise_for_status()
-        if resp.text:
-            return resp.json()
-        return None
+# Per-route timeouts (seconds) for bot -> backend calls
+BACKEND_ROUTE_TIMEOUTS = {
+    "/api/bot/incoming": 15.0,
+    "/api/bot/incoming/batch": 30.0,
+    "/api/bot/outgoing": 10.0,
+    "/api/bot/edited": 10.0,
+    "/api/bot/delivery": 10.0,
+    "/api/bot/images/heic": 60.0,
+}
+BACKEND_DEFAULT_TIMEOUT = 10.0
+
+backend_client: httpx.AsyncClient | None = None
+backend_stats = {"requests": 0, "errors": 0, "in_flight": 0}
+
+
+def get_backend_client() -> httpx.AsyncClient:
+    """Shared keep-alive client; one pool for all bot -> backend traffic."""
+    global backend_client
+    if backend_client is None:
+        transport = httpx.AsyncHTTPTransport(
+            uds=BACKEND_UDS_PATH or None,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60.0),
+        )
+        backend_client = httpx.AsyncClient(
+            base_url=BACKEND_BASE_URL,
+            headers={"X-Internal-Token": INTERNAL_TOKEN},
+            timeout=httpx.Timeout(BACKEND_DEFAULT_TIMEOUT, connect=3.0),
+            transport=transport,
+        )
+    return backend_client
+
 
+async def close_backend_client() -> None:
+    global backend_client
+    if backend_client is not None:
+        client, backend_client = backend_client, None
+        await client.aclose()
 
-async def fetch_bot_token() -> str | None:
-    """Fetch Telegram bot token from panel settings."""
+
+def backend_pool_stats() -> dict:
+    stats: dict[str, Any] = dict(backend_stats)
+    stats["transport"] = "uds" if BACKEND_UDS_PATH else "tcp"
+    if backend_client is not None:
+        try:
+            connections = backend_client._transport._pool.connections
+            stats["connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        except Exception:
+            pass
+    return stats
+
+
+async def backend_request(method: str, path: str, json_body: dict | None = None, timeout: float | None = None) -> Any:
+    client = get_backend_client()
+    route = path.split("?", 1)[0]
+    backend_stats["requests"] += 1
+    backend_stats["in_flight"] += 1
     try:
-        data = await backend_request("GET", "/api/bot/settings/telegram_bot_token")
-        if data and data.get("value_json"):
-            token = data["value_json"].get("token")
-            if token and isinstance(token, str) and ":" in token:
-                return token
-    except Exception as e:
-        logger.debug(f"Could not fetch bot token from panel: {e}")
+        resp = await client.request(
+            method,
+            path,
+            json=json_body,
+            timeout=timeout or BACKEND_ROUTE_TIMEOUTS.get(route, BACKEND_DEFAULT_TIMEOUT),
+        )
+        resp.raise_for_status()
+    except Exception:
+        backend_stats["errors"] += 1
+        raise
+    finally:
+        backend_stats["in_flight"] -= 1
+    if resp.text:
+        return resp.json()
+    return None
+
+
+class InboundQueue:
+    """Posts inbound messages in arrival order, batching whatever queued up meanwhile.
+
+    With one request in flight at a time, a quiet bot sends single messages with
+    no added delay, while a burst collapses into /api/bot/incoming/batch calls
+    whose size grows with the backlog.
+    """
+
+    def __init__(self, max_batch: int) -> None:
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future]] = asyncio.Queue()
+        self._posting = asyncio.Lock()
+        self._stopped = False
+        self.requests = 0
+        self.messages = 0
+        self.max_seen = 0
+
+    async def submit(self, payload: dict) -> Any:
+        if self._stopped:
+            spool.append("/api/bot/incoming", payload)
+            return None
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload, future))
+        return await future
+
+    async def _post(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        self.requests += 1
+        self.messages += len(batch)
+        self.max_seen = max(self.max_seen, len(batch))
+        try:
+            if len(batch) == 1:
+                results = [await backend_request("POST", "/api/bot/incoming", batch[0][0])]
+            else:
+                data = await backend_request(
+                    "POST", "/api/bot/incoming/batch", {"messages": [payload for payload, _ in batch]}
+                )
+                results = data["results"]
+        except Exception as e:
+            if len(batch) > 1 and not is_retryable(e):
+                # Rejected as a whole; post one by one so only the bad message fails
+                for item in batch:
+                    await self._post([item])
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            async with self._posting:
+                await self._post(batch)
+
+    async def stop(self) -> None:
+        """Let the request in flight finish, then spool whatever is still queued."""
+        self._stopped = True
+        async with self._posting:
+            while not self._queue.empty():
+                payload, future = self._queue.get_nowait()
+                spool.append("/api/bot/incoming", payload)
+                if not future.done():
+                    future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "requests": self.requests,
+            "messages": self.messages,
+            "max_batch_seen": self.max_seen,
+        }
+
+
+inbound_queue = InboundQueue(INBOUND_MAX_BATCH)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Backend down or restarting; 4xx answers will not get better on retry."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, OSError))
+
+
+class Spool:
+    """SQLite FIFO of bot -> backend events that could not be delivered.
+
+    Once anything is spooled, new events queue behind it so the backend sees
+    them in order; the backend ignores replays by (tg_id, telegram_message_id).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._wakeup = asyncio.Event()
+        self.depth = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, body TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.depth = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        if self.depth:
+            logger.info(f"Spool has {self.depth} undelivered events from a previous run")
+            self._wakeup.set()
+
+    def append(self, path: str, body: dict) -> None:
+        self._db.execute(
+            "INSERT INTO outbox (path, body, created_at) VALUES (?, ?, ?)",
+            (path, json.dumps(body, default=str), time.time()),
+        )
+        self.depth += 1
+        self._wakeup.set()
+
+    async def deliver(self, path: str, body: dict, send: Callable[[], Awaitable[Any]] | None = None) -> Any:
+        """Send now, or spool if the backend is unavailable or earlier events are still queued."""
+        if self._db is None:
+            return await (send() if send else backend_request("POST", path, body))
+        if self.depth:
+            self.append(path, body)
+            return None
+        try:
+            return await (send() if send else backend_request("POST", path, body))
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            logger.warning(f"Backend unavailable, spooling {path}: {e}")
+            self.append(path, body)
+            return None
+
+    def _head(self) -> tuple[list[int], str, dict]:
+        rows = self._db.execute("SELECT id, path, body FROM outbox ORDER BY id LIMIT ?", (INBOUND_MAX_BATCH,)).fetchall()
+        if rows[0][1] != "/api/bot/incoming":
+            return [rows[0][0]], rows[0][1], json.loads(rows[0][2])
+        # Replay a run of inbound messages with one batch request
+        run = []
+        for row in rows:
+            if row[1] != "/api/bot/incoming":
+                break
+            run.append(row)
+        if len(run) == 1:
+            return [run[0][0]], run[0][1], json.loads(run[0][2])
+        return [row[0] for row in run], "/api/bot/incoming/batch", {"messages": [json.loads(row[2]) for row in run]}
+
+    def _remove(self, ids: list[int]) -> None:
+        self._db.execute(f"DELETE FROM outbox WHERE id IN ({','.join('?' * len(ids))})", ids)
+        self.depth -= len(ids)
+
+    async def run(self) -> None:
+        backoff = 1.0
+        while True:
+            if not self.depth:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            ids, path, body = self._head()
+            try:
+                await backend_request("POST", path, body)
+            except Exception as e:
+                if is_retryable(e):
+                    settled = False
+                elif len(ids) > 1:
+                    # One bad message must not take the rest of the batch with it
+                    settled = await self._replay_each(ids, body["messages"])
+                else:
+                    logger.error(f"Dropping spooled {path} event rejected by backend: {e}")
+                    self.dropped += 1
+                    self._remove(ids)
+                    settled = True
+                if not settled:
+                    self.failures += 1
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, SPOOL_MAX_BACKOFF)
+                    continue
+            else:
+                self.delivered += len(ids)
+                self._remove(ids)
+            backoff = 1.0
+
+    async def _replay_each(self, ids: list[int], messages: list[dict]) -> bool:
+        """Send a rejected batch one message at a time, dropping only those rejected on
+        their own; False if the backend became unavailable (the rest stays spooled)."""
+        for row_id, message in zip(ids, messages):
+            try:
+                await backend_request("POST", "/api/bot/incoming", message)
+            except Exception as e:
+                if is_retryable(e):
+                    return False
+                logger.error(f"Dropping spooled /api/bot/incoming event rejected by backend: {e}")
+                self.dropped += 1
+            else:
+                self.delivered += 1
+            self._remove([row_id])
+        return True
+
+    def close(self) -> None:
+        if self._db is not None:
+            db, self._db = self._db, None
+            db.close()
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "delivered": self.delivered, "dropped": self.dropped, "failures": self.failures}
+
+
+spool = Spool(SPOOL_PATH)
+
+
+# Local snapshot of panel settings, kept fresh by settings_sync_loop
+settings_snapshot: dict[str, Any] = {}
+settings_version: int | None = None
+settings_updated = asyncio.Event()
+
+
+async def sync_settings_once(wait: int) -> None:
+    """Long-poll the backend and replace the local settings snapshot."""
+    global settings_version, settings_updated
+    params = f"version={settings_version or 0}&wait={wait}"
+    data = await backend_request("GET", f"/api/bot/settings?{params}", timeout=wait + 10)
+    if not data:
+        return
+    values = data.get("values") or {}
+    changed = values != settings_snapshot or settings_version is None
+    settings_snapshot.clear()
+    settings_snapshot.update(values)
+    settings_version = data.get("version") or 0
+    if changed:
+        updated, settings_updated = settings_updated, asyncio.Event()
+        updated.set()
+
+
+async def settings_sync_loop() -> None:
+    """Keep the snapshot current.
+
+    The backend answers as soon as a setting changes, so pushes arrive within
+    one round trip; a timed-out poll still returns the full snapshot, which
+    doubles as periodic reconciliation.
+    """
+    while True:
+        try:
+            await sync_settings_once(SETTINGS_SYNC_WAIT if settings_version is not None else 0)
+        except Exception as e:
+            logger.debug(f"Settings sync failed: {e}")
+            await asyncio.sleep(SETTINGS_SYNC_RETRY)
+
+
+def bot_token_from_settings() -> str | None:
+    value = settings_snapshot.get("telegram_bot_token")
+    token = value.get("token") if isinstance(value, dict) else None
+    if token and isinstance(token, str) and ":" in token:
+        return token
     return None
 
 
 async def send_system_to_panel(tg_id: int, text: str) -> None:
     try:
-        await backend_request(
-            "POST",
+        await spool.deliver(
             "/api/bot/outgoing",
             {
                 "tg_id": tg_id,
@@ -163,6 +479,8 @@ async def send_system_to_panel(tg_id: int, text: str) -> None:
 
 
 async def fetch_setting(key: str) -> dict | None:
+    if settings_version is not None:
+        return settings_snapshot.get(key)
     try:
         data = await backend_request("GET", f"/api/bot/settings/{key}")
         return data.get("value_json") if data else None
@@ -170,50 +488,115 @@ async def fetch_setting(key: str) -> dict | None:
         return None
 
 
-async def fetch_user_photo_url(user_id: int, username: str | None = None) -> str | None:
-    global bot, TELEGRAM_TOKEN
+async def fetch_user_photo(user_id: int, username: str | None = None) -> dict | None:
+    """Avatar fields for the backend: the photo's file ids, served by the backend's
+    /files/tg route. Download URLs are never sent, they embed the bot token."""
+    fallback = {"photo_url": f"https://t.me/i/userpic/320/{username}.jpg"} if username else None
     if not bot:
-        if username:
-            return f"https://t.me/i/userpic/320/{username}.jpg"
-        return None
+        return fallback
     try:
         photos = await bot.get_user_profile_photos(user_id, limit=1)
-        if not photos.photos:
-            if username:
-                return f"https://t.me/i/userpic/320/{username}.jpg"
-            return None
-        file_id = photos.photos[0][-1].file_id
-        file = await bot.get_file(file_id)
-        if not file.file_path:
-            if username:
-                return f"https://t.me/i/userpic/320/{username}.jpg"
-            return None
-        return f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file.file_path}"
     except Exception:
-        if username:
-            return f"https://t.me/i/userpic/320/{username}.jpg"
-        return None
+        return fallback
+    if not photos.photos:
+        return fallback
+    size = photos.photos[0][-1]
+    return {"photo_file_id": size.file_id, "photo_file_unique_id": size.file_unique_id}
+
+
+class PhotoCache:
+    """Bounded LRU of avatar fields per Telegram user; misses are cached too."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[int, tuple[dict | None, float]] = OrderedDict()
+        self.inflight: set[int] = set()
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+
+    def peek(self, user_id: int) -> tuple[bool, dict | None]:
+        """Return (fresh, photo) without touching the Telegram API or the hit counters."""
+        entry = self._items.get(user_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return False, None
+        self._items.move_to_end(user_id)
+        return True, entry[0]
+
+    def get(self, user_id: int) -> tuple[bool, dict | None]:
+        """Like peek, but counted; only the refresh path decides hit or miss."""
+        fresh, photo = self.peek(user_id)
+        if fresh:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return fresh, photo
+
+    def put(self, user_id: int, photo: dict | None) -> None:
+        self._items[user_id] = (photo, time.monotonic())
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "lookups": self.lookups,
+            "inflight": len(self.inflight),
+        }
+
+
+photo_cache = PhotoCache(PHOTO_CACHE_SIZE, PHOTO_CACHE_TTL)
+
+
+def cached_photo(user_id: int) -> dict:
+    _, photo = photo_cache.peek(user_id)
+    return photo or {}
+
+
+async def refresh_user_photo(user) -> None:
+    """Look the avatar up once per TTL and hand it to the backend."""
+    fresh, _ = photo_cache.get(user.id)
+    if fresh or user.id in photo_cache.inflight:
+        return
+    photo_cache.inflight.add(user.id)
+    try:
+        photo_cache.lookups += 1
+        photo = await fetch_user_photo(user.id, user.username)
+        photo_cache.put(user.id, photo)
+        if photo:
+            await backend_request("POST", "/api/bot/chat", {"tg_id": user.id, **photo})
+    except Exception as e:
+        logger.debug(f"Avatar refresh for {user.id} failed: {e}")
+    finally:
+        photo_cache.inflight.discard(user.id)
+
+
+def schedule_photo_refresh(resp: Any, user) -> None:
+    if isinstance(resp, dict) and resp.get("photo_refresh"):
+        asyncio.create_task(refresh_user_photo(user))
 
 
 @router.message(CommandStart())
 async def handle_start(message: Message) -> None:
-    photo_url = await fetch_user_photo_url(message.from_user.id, message.from_user.username)
-    await backend_request(
-        "POST",
-        "/api/bot/incoming",
-        {
-            "tg_id": message.from_user.id,
-            "tg_username": message.from_user.username,
-            "first_name": message.from_user.first_name,
-            "last_name": message.from_user.last_name,
-            "language_code": message.from_user.language_code,
-            "photo_url": photo_url,
-            "text": message.text or "/start",
-            "type": "text",
-            "telegram_message_id": message.message_id,
-            "attachments": [],
-        },
-    )
+    payload = {
+        "tg_id": message.from_user.id,
+        "tg_username": message.from_user.username,
+        "first_name": message.from_user.first_name,
+        "last_name": message.from_user.last_name,
+        "language_code": message.from_user.language_code,
+        **cached_photo(message.from_user.id),
+        "text": message.text or "/start",
+        "type": "text",
+        "telegram_message_id": message.message_id,
+        "attachments": [],
+    }
+    # Through the inbound queue, so /start cannot overtake messages queued before it
+    resp = await spool.deliver("/api/bot/incoming", payload, lambda: inbound_queue.submit(payload))
+    schedule_photo_refresh(resp, message.from_user)
     # Fetch greeting from 'messages' settings (same as panel uses)
     messages_settings = await fetch_setting("messages")
     if not messages_settings:
@@ -227,8 +610,7 @@ async def handle_start(message: Message) -> None:
         # If not configured in settings, don't send greeting
         return
     reply = await message.answer(text, parse_mode=ParseMode.HTML)
-    await backend_request(
-        "POST",
+    await spool.deliver(
         "/api/bot/outgoing",
         {
             "tg_id": message.from_user.id,
@@ -266,25 +648,16 @@ async def handle_login(message: Message) -> None:
     await message.answer(f"Код для входа: <code>{code}</code>")
 
 
-async def _file_url(file_id: str) -> str | None:
-    global bot, TELEGRAM_TOKEN
-    if not bot:
-        return None
-    try:
-        file = await bot.get_file(file_id)
-        if not file.file_path:
-            return None
-        return f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file.file_path}"
-    except Exception:
-        return None
+def is_heic_document(filename: str, mime: str) -> bool:
+    return mime in ('image/heic', 'image/heif') or filename.lower().endswith(('.heic', '.heif'))
 
 
-async def extract_attachment(message: Message) -> tuple[str, dict | None]:
+def describe_attachment(message: Message) -> tuple[str, dict | None]:
+    """Attachment metadata available from the update itself, without API calls."""
     if message.content_type == ContentType.PHOTO and message.photo:
         photo = message.photo[-1]
         return "photo", {
             "telegram_file_id": photo.file_id,
-            "url": await _file_url(photo.file_id),
             "name": "photo.jpg",
             "size": photo.file_size,
             "mime": "image/jpeg",
@@ -294,24 +667,9 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         doc = message.document
         filename = doc.file_name or ""
         mime = doc.mime_type or ""
-        
-        # Check if it's a HEIC/HEIF file - convert it
-        if mime in ('image/heic', 'image/heif') or filename.lower().endswith(('.heic', '.heif')):
-            converted = await download_and_convert_heic(doc.file_id, filename)
-            if converted:
-                return "photo", {
-                    "telegram_file_id": doc.file_id,
-                    "local_path": converted["local_path"],
-                    "url": converted["url"],
-                    "name": converted["name"],
-                    "size": converted["size"],
-                    "mime": converted["mime"],
-                    "meta": {"file_unique_id": doc.file_unique_id},
-                }
-        
+        # HEIC/HEIF documents are converted to JPEG later by enrich_attachment
         return "document", {
             "telegram_file_id": doc.file_id,
-            "url": await _file_url(doc.file_id),
             "name": filename,
             "size": doc.file_size,
             "mime": mime,
@@ -321,7 +679,6 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         video = message.video
         return "video", {
             "telegram_file_id": video.file_id,
-            "url": await _file_url(video.file_id),
             "name": "video.mp4",
             "size": video.file_size,
             "mime": video.mime_type,
@@ -331,7 +688,6 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         note = message.video_note
         return "video_note", {
             "telegram_file_id": note.file_id,
-            "url": await _file_url(note.file_id),
             "name": "video_note.mp4",
             "size": note.file_size,
             "mime": "video/mp4",
@@ -341,7 +697,6 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         anim = message.animation
         return "animation", {
             "telegram_file_id": anim.file_id,
-            "url": await _file_url(anim.file_id),
             "name": "animation.gif",
             "size": anim.file_size,
             "mime": anim.mime_type or "image/gif",
@@ -351,7 +706,6 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         voice = message.voice
         return "voice", {
             "telegram_file_id": voice.file_id,
-            "url": await _file_url(voice.file_id),
             "name": "voice.ogg",
             "size": voice.file_size,
             "mime": voice.mime_type or "audio/ogg",
@@ -361,7 +715,6 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         audio = message.audio
         return "audio", {
             "telegram_file_id": audio.file_id,
-            "url": await _file_url(audio.file_id),
             "name": audio.file_name,
             "size": audio.file_size,
             "mime": audio.mime_type or "audio/mpeg",
@@ -371,7 +724,6 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
         sticker = message.sticker
         return "sticker", {
             "telegram_file_id": sticker.file_id,
-            "url": await _file_url(sticker.file_id),
             "name": "sticker.webp",
             "size": sticker.file_size,
             "mime": "image/webp",
@@ -380,14 +732,44 @@ async def extract_attachment(message: Message) -> tuple[str, dict | None]:
     return "text", None
 
 
-@router.message()
-async def handle_any(message: Message) -> None:
-    if message.text and message.text.startswith("/"):
+async def enrich_attachment(tg_id: int, telegram_message_id: int, attachment: dict) -> None:
+    """Convert a HEIC document to JPEG after the message is already in the panel.
+
+    Other files need no enrichment: the backend resolves download paths on demand
+    through /internal/file-path.
+    """
+    file_id = attachment["telegram_file_id"]
+    patch: dict[str, Any] = {"file_unique_id": attachment["meta"]["file_unique_id"]}
+    converted = await download_and_convert_heic(file_id, attachment.get("name") or "photo.heic")
+    if not converted:
         return
-    photo_url = await fetch_user_photo_url(message.from_user.id, message.from_user.username)
-    msg_type, attachment = await extract_attachment(message)
-    
-    # Extract forward info
+    patch.update(converted)
+    await backend_request(
+        "POST",
+        "/api/bot/enrich",
+        {
+            "tg_id": tg_id,
+            "telegram_message_id": telegram_message_id,
+            "type": "photo",
+            "attachments": [patch],
+        },
+    )
+
+
+def schedule_enrichment(tg_id: int, telegram_message_id: int, attachment: dict | None) -> None:
+    if not attachment or not is_heic_document(attachment.get("name") or "", attachment.get("mime") or ""):
+        return
+
+    async def run() -> None:
+        try:
+            await enrich_attachment(tg_id, telegram_message_id, attachment)
+        except Exception as e:
+            logger.warning(f"Attachment enrichment for message {telegram_message_id} failed: {e}")
+
+    asyncio.create_task(run())
+
+
+def forward_info(message: Message) -> dict:
     forward_from_name = None
     forward_from_username = None
     forward_date = None
@@ -406,25 +788,115 @@ async def handle_any(message: Message) -> None:
         # Forwarded from a hidden user
         forward_from_name = message.forward_sender_name
         forward_date = message.forward_date.isoformat() if message.forward_date else None
-    
-    payload = {
+    return {
+        "forward_from_name": forward_from_name,
+        "forward_from_username": forward_from_username,
+        "forward_date": forward_date,
+    }
+
+
+def incoming_payload(message: Message, msg_type: str, attachments: list[dict], text: str | None) -> dict:
+    return {
         "tg_id": message.from_user.id,
         "tg_username": message.from_user.username,
         "first_name": message.from_user.first_name,
         "last_name": message.from_user.last_name,
         "language_code": message.from_user.language_code,
-        "photo_url": photo_url,
-        "text": message.text or message.caption,
+        **cached_photo(message.from_user.id),
+        "text": text,
         "type": msg_type,
         "telegram_message_id": message.message_id,
         "reply_to_telegram_message_id": message.reply_to_message.message_id if message.reply_to_message else None,
         "telegram_media_group_id": message.media_group_id,
-        "attachments": [attachment] if attachment else [],
-        "forward_from_name": forward_from_name,
-        "forward_from_username": forward_from_username,
-        "forward_date": forward_date,
+        "attachments": attachments,
+        **forward_info(message),
     }
-    resp = await backend_request("POST", "/api/bot/incoming", payload)
+
+
+class MediaGroupBuffer:
+    """Collects album parts, which Telegram delivers as separate updates, into one message.
+
+    Each part restarts a short timer; when no new part arrives within the window
+    the album is forwarded to the backend as a single inbound message.
+    """
+
+    def __init__(self, wait_seconds: float) -> None:
+        self.wait_seconds = wait_seconds
+        self._parts: dict[tuple[int, str], list[Message]] = {}
+        self._timers: dict[tuple[int, str], asyncio.TimerHandle] = {}
+        self.albums = 0
+        self.parts = 0
+
+    def add(self, message: Message) -> None:
+        key = (message.chat.id, message.media_group_id)
+        self._parts.setdefault(key, []).append(message)
+        self.parts += 1
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        self._timers[key] = asyncio.get_running_loop().call_later(self.wait_seconds, self._flush, key)
+
+    def _flush(self, key: tuple[int, str]) -> None:
+        self._timers.pop(key, None)
+        messages = self._parts.pop(key, None)
+        if messages:
+            self.albums += 1
+            asyncio.create_task(forward_album(messages))
+
+    async def flush_all(self) -> None:
+        """Forward albums still waiting for their window, e.g. on shutdown."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        pending, self._parts = list(self._parts.values()), {}
+        await asyncio.gather(*(forward_album(messages) for messages in pending))
+
+    def stats(self) -> dict:
+        return {"pending": len(self._parts), "albums": self.albums, "parts": self.parts}
+
+
+media_groups = MediaGroupBuffer(MEDIA_GROUP_WAIT_MS / 1000)
+
+
+async def forward_album(messages: list[Message]) -> None:
+    messages = sorted(messages, key=lambda m: m.message_id)
+    first = messages[0]
+    attachments = []
+    msg_type = None
+    text = None
+    for part in messages:
+        part_type, attachment = describe_attachment(part)
+        if attachment:
+            # Keep the per-part id so replies and edits can still be matched
+            attachment["meta"]["telegram_message_id"] = part.message_id
+            attachments.append(attachment)
+            msg_type = msg_type or part_type
+        # Telegram only shows a caption on one part of an album
+        text = text or part.caption
+    try:
+        await forward_incoming(first, incoming_payload(first, msg_type or "text", attachments, text))
+    except Exception as e:
+        logger.error(f"Forwarding album {first.media_group_id} failed: {e}", exc_info=True)
+
+
+@router.message()
+async def handle_any(message: Message) -> None:
+    if message.text and message.text.startswith("/"):
+        return
+    if message.media_group_id:
+        media_groups.add(message)
+        return
+    msg_type, attachment = describe_attachment(message)
+    payload = incoming_payload(message, msg_type, [attachment] if attachment else [], message.text or message.caption)
+    await forward_incoming(message, payload)
+
+
+async def forward_incoming(message: Message, payload: dict) -> None:
+    """Post an inbound message and run the follow-ups (avatar, enrichment, autoreply)."""
+    resp = await spool.deliver("/api/bot/incoming", payload, lambda: inbound_queue.submit(payload))
+    schedule_photo_refresh(resp, message.from_user)
+    for attachment in payload["attachments"]:
+        schedule_enrichment(message.from_user.id, message.message_id, attachment)
     if resp and resp.get("send_autoreply"):
         messages_settings = await fetch_setting("messages") or {}
         autoreply_enabled = messages_settings.get("autoreply_enabled", True)
@@ -451,8 +923,7 @@ async def handle_any(message: Message) -> None:
             reply = await message.answer(html.escape(safe_autoreply))
         except TelegramBadRequest:
             reply = await message.answer(safe_autoreply)
-        await backend_request(
-            "POST",
+        await spool.deliver(
             "/api/bot/outgoing",
             {
                 "tg_id": message.from_user.id,
@@ -487,7 +958,7 @@ async def handle_edited(message: Message) -> None:
         "text": message.text or message.caption,
         "edited_at": datetime.utcnow().isoformat(),
     }
-    await backend_request("POST", "/api/bot/edited", payload)
+    await spool.deliver("/api/bot/edited", payload)
 
 
 async def handle_internal_delete(request: web.Request) -> web.Response:
@@ -507,28 +978,306 @@ async def handle_internal_delete(request: web.Request) -> web.Response:
     return web.json_response({"ok": True})
 
 
-async def handle_internal_send(request: web.Request) -> web.Response:
-    global bot
-    token = request.headers.get("X-Internal-Token")
-    if token != INTERNAL_TOKEN:
+async def handle_internal_file_path(request: web.Request) -> web.Response:
+    """Resolve a file_id to its current Telegram download path for the backend."""
+    if request.headers.get("X-Internal-Token") != INTERNAL_TOKEN:
         return web.json_response({"error": "unauthorized"}, status=401)
     if not bot:
         return web.json_response({"error": "bot_not_initialized"}, status=503)
     data = await request.json()
+    try:
+        file = await bot.get_file(data["file_id"])
+    except TelegramBadRequest as e:
+        return web.json_response({"error": str(e)}, status=404)
+    if not file.file_path:
+        return web.json_response({"error": "no_file_path"}, status=404)
+    return web.json_response({"file_path": file.file_path, "file_size": file.file_size})
+
+
+# Priority lanes for outgoing messages; lower value is served first
+SEND_LANES = {"operator": 0, "broadcast": 1}
+send_lane: ContextVar[int] = ContextVar("send_lane", default=SEND_LANES["operator"])
+
+# Bot API methods that deliver messages and count against Telegram's flood limits
+THROTTLED_METHODS = {
+    "sendMessage", "sendPhoto", "sendVideo", "sendVideoNote", "sendAnimation", "sendAudio",
+    "sendVoice", "sendSticker", "sendDocument", "sendMediaGroup", "copyMessage", "forwardMessage",
+}
+
+
+class SendScheduler:
+    """Paces outgoing messages to Telegram's limits, serving operator replies first.
+
+    Each chat gets its own slots (private chats and groups have different
+    intervals); once a send's chat slot is due it waits for a global token, and
+    free tokens always go to the highest-priority lane.
+    """
+
+    def __init__(self, global_rate: float, private_interval: float, group_interval: float) -> None:
+        self.global_rate = global_rate
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self._tokens = global_rate
+        self._refilled_at = time.monotonic()
+        self._chat_next: dict[int, float] = {}
+        self._lanes: list[deque[tuple[asyncio.Future, int]]] = [deque() for _ in SEND_LANES]
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.pacing = 0
+        self.sent = 0
+        self.retry_after = 0
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+
+    def _chat_delay(self, chat_id: int, weight: int) -> float:
+        now = time.monotonic()
+        interval = self.private_interval if chat_id > 0 else self.group_interval
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + interval * weight
+        if len(self._chat_next) > 10000:
+            self._chat_next = {cid: t for cid, t in self._chat_next.items() if t > now}
+        return slot - now
+
+    def pause_chat(self, chat_id: int, seconds: float) -> None:
+        self.retry_after += 1
+        until = time.monotonic() + seconds
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), until)
+
+    async def acquire(self, chat_id: int, lane: int, weight: int = 1) -> None:
+        started = time.monotonic()
+        delay = self._chat_delay(chat_id, weight)
+        if delay > 0:
+            self.pacing += 1
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.pacing -= 1
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[lane].append((future, weight))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        await future
+        waited_ms = (time.monotonic() - started) * 1000
+        self.sent += 1
+        self.wait_ms_total += waited_ms
+        self.max_wait_ms = max(self.max_wait_ms, waited_ms)
+
+    def _next(self) -> tuple[asyncio.Future, int] | None:
+        for lane in self._lanes:
+            while lane:
+                future, weight = lane.popleft()
+                if not future.done():
+                    return future, weight
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            if not any(self._lanes):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            self._tokens = min(self.global_rate, self._tokens + (now - self._refilled_at) * self.global_rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.global_rate)
+                continue
+            entry = self._next()
+            if entry is None:
+                continue
+            future, weight = entry
+            # An album costs one token per item; the bucket may go briefly negative
+            self._tokens -= weight
+            future.set_result(None)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": {name: len(self._lanes[lane]) for name, lane in SEND_LANES.items()},
+            "pacing": self.pacing,
+            "sent": self.sent,
+            "retry_after": self.retry_after,
+            "avg_wait_ms": round(self.wait_ms_total / self.sent, 2) if self.sent else None,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+send_scheduler = SendScheduler(SEND_GLOBAL_RATE, 1 / SEND_PRIVATE_RATE, 60 / SEND_GROUP_PER_MINUTE)
+
+
+class UploadStats:
+    """Time spent uploading local files to Telegram, and what image optimization saved."""
+
+    def __init__(self) -> None:
+        self.uploads = 0
+        self.bytes = 0
+        self.total_ms = 0.0
+        self.optimized = 0
+        self.bytes_saved = 0
+
+    def record(self, size: int, elapsed_ms: float) -> None:
+        self.uploads += 1
+        self.bytes += size
+        self.total_ms += elapsed_ms
+        current = send_upload.get()
+        if current is not None:
+            current["bytes"] += size
+            current["ms"] += elapsed_ms
+
+    def stats(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "bytes": self.bytes,
+            "avg_ms": round(self.total_ms / self.uploads, 1) if self.uploads else None,
+            "optimized": self.optimized,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+upload_stats = UploadStats()
+# Upload totals of the send in progress (set by perform_send)
+send_upload: ContextVar[dict | None] = ContextVar("send_upload", default=None)
+
+
+def upload_size(method) -> int:
+    """Bytes of local files a Bot API call uploads."""
+    values = [value for _, value in method]
+    media = getattr(method, "media", None)
+    if isinstance(media, list):
+        values.extend(item.media for item in media)
+    size = 0
+    for value in values:
+        if isinstance(value, FSInputFile):
+            try:
+                size += os.path.getsize(value.path)
+            except OSError:
+                pass
+    return size
+
+
+def _optimize_image(source: str, dest: str) -> None:
+    """Downscale, drop EXIF and re-encode as JPEG (runs in a thread)."""
+    from PIL import Image, ImageOps
+
+    max_side = OUTBOUND_IMAGE_MAX_SIDE
+    with Image.open(source) as img:
+        # JPEG decodes straight at a reduced scale when it is much larger than needed
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, "white")
+            background.paste(img, mask=img.getchannel("A"))
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        temp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        img.save(temp, format="JPEG", quality=OUTBOUND_IMAGE_QUALITY, optimize=True, progressive=True)
+    os.replace(temp, dest)
+
+
+def _optimized_suffix() -> str:
+    return f".{OUTBOUND_IMAGE_MAX_SIDE}q{OUTBOUND_IMAGE_QUALITY}.jpg"
+
+
+async def optimize_outbound_image(att: dict) -> dict:
+    """The attachment with a large local photo swapped for a smaller cached copy."""
+    local_path = att.get("local_path")
+    mime = (att.get("mime") or "").lower()
+    if not OUTBOUND_IMAGE_OPTIMIZE or not local_path or mime not in ("image/jpeg", "image/png", "image/webp"):
+        return att
+    try:
+        size = os.path.getsize(local_path)
+    except OSError:
+        return att
+    if size < OUTBOUND_IMAGE_MIN_BYTES:
+        return att
+    dest = os.path.join(OPTIMIZED_PATH, os.path.basename(local_path) + _optimized_suffix())
+    if not os.path.exists(dest):
+        try:
+            os.makedirs(OPTIMIZED_PATH, exist_ok=True)
+            await asyncio.to_thread(_optimize_image, local_path, dest)
+        except Exception as e:
+            logger.warning(f"Could not optimize {local_path}, sending the original: {e}")
+            return att
+    optimized_size = os.path.getsize(dest)
+    if optimized_size >= size:
+        return att
+    upload_stats.optimized += 1
+    upload_stats.bytes_saved += size - optimized_size
+    name = (att.get("name") or "photo").rsplit(".", 1)[0] + ".jpg"
+    return {**att, "local_path": dest, "mime": "image/jpeg", "name": name, "size": optimized_size}
+
+
+def _prune_optimized() -> int:
+    """Drop optimized copies whose original is gone or that were made with other settings."""
+    if not os.path.isdir(OPTIMIZED_PATH):
+        return 0
+    suffix = _optimized_suffix()
+    removed = 0
+    for entry in os.scandir(OPTIMIZED_PATH):
+        if not entry.is_file():
+            continue
+        source = entry.name[: -len(suffix)] if entry.name.endswith(suffix) else None
+        if source and os.path.exists(os.path.join(UPLOADS_PATH, source)):
+            continue
+        if entry.name.endswith(".tmp") and time.time() - entry.stat().st_mtime < 3600:
+            continue
+        os.unlink(entry.path)
+        removed += 1
+    return removed
+
+
+async def optimized_sweep_loop() -> None:
+    while True:
+        try:
+            removed = await asyncio.to_thread(_prune_optimized)
+            if removed:
+                logger.info(f"Removed {removed} stale optimized images")
+        except Exception as e:
+            logger.warning(f"Optimized image sweep failed: {e}")
+        await asyncio.sleep(3600)
+
+
+class SendThrottleMiddleware(BaseRequestMiddleware):
+    """Routes message-sending Bot API calls through the scheduler and retries on RetryAfter."""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if method.__api_method__ not in THROTTLED_METHODS or not isinstance(chat_id, int):
+            return await make_request(bot, method)
+        weight = len(method.media) if method.__api_method__ == "sendMediaGroup" else 1
+        lane = send_lane.get()
+        size = upload_size(method)
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            await send_scheduler.acquire(chat_id, lane, weight)
+            try:
+                if not size:
+                    return await make_request(bot, method)
+                # Timed after the scheduler wait, so this is upload and processing time only
+                started = time.perf_counter()
+                result = await make_request(bot, method)
+                upload_stats.record(size, (time.perf_counter() - started) * 1000)
+                return result
+            except TelegramRetryAfter as e:
+                if attempt >= SEND_MAX_RETRIES:
+                    raise
+                logger.warning(f"Telegram asked to retry {method.__api_method__} to {chat_id} after {e.retry_after}s")
+                send_scheduler.pause_chat(chat_id, e.retry_after)
+
+
+async def show_typing(data: dict) -> None:
+    """Send a chat action and wait a bit for natural feel (async jobs only)."""
     tg_id = int(data.get("tg_id"))
     text = plain_text(data.get("text"))
     msg_type = data.get("type", "text")
-    reply_to = data.get("reply_to_telegram_message_id")
     attachments = data.get("attachments", [])
-    inline_buttons = data.get("inline_buttons")
-    
-    # Track sent message ID
-    sent_telegram_message_id = None
-    
-    # Build inline keyboard if buttons provided
-    reply_markup = build_inline_keyboard(inline_buttons)
-    
-    # Send typing action and wait a bit for natural feel
     try:
         if attachments:
             # Choose appropriate action based on content type
@@ -550,11 +1299,57 @@ async def handle_internal_send(request: web.Request) -> web.Response:
     except Exception as e:
         logger.debug(f"Could not send chat action: {e}")
 
+
+def stored_file_id(att: dict, kind: str) -> str | None:
+    """file_id Telegram returned when this attachment was last uploaded as ``kind``."""
+    return ((att.get("meta") or {}).get("upload_file_ids") or {}).get(kind)
+
+
+def sent_file_id(message: Message, kind: str) -> str | None:
+    if kind == "photo":
+        return message.photo[-1].file_id if message.photo else None
+    media = getattr(message, kind, None)
+    return getattr(media, "file_id", None)
+
+
+def file_id_rejected(error: TelegramBadRequest) -> bool:
+    text = str(error).lower()
+    return "file identifier" in text or "file reference" in text
+
+
+async def perform_send(data: dict) -> dict:
+    """Deliver one /internal/send payload to Telegram; returns the response body.
+
+    Files uploaded before are sent by the file_id Telegram returned for them; the
+    ids of new uploads are reported back in ``uploads`` for the backend to keep.
+    Ids belong to one bot token; an item whose id is rejected (e.g. after a token
+    change) is uploaded again on its own, an album as a whole.
+    """
+    tg_id = int(data.get("tg_id"))
+    text = plain_text(data.get("text"))
+    msg_type = data.get("type", "text")
+    reply_to = data.get("reply_to_telegram_message_id")
+    attachments = data.get("attachments", [])
+    inline_buttons = data.get("inline_buttons")
+    
+    # Track sent message ID
+    sent_telegram_message_id = None
+    
+    # Build inline keyboard if buttons provided
+    reply_markup = build_inline_keyboard(inline_buttons)
+    upload = {"bytes": 0, "ms": 0.0}
+    send_upload.set(upload)
+    uploads: list[dict] = []
+
     if attachments:
-        def to_file_input(att: dict):
+        originals = attachments
+
+        def to_file_input(att: dict, kind: str, reuse: bool = True):
             file_id = att.get("telegram_file_id")
             local_path = att.get("local_path")
             url = att.get("url")
+            if reuse and stored_file_id(att, kind):
+                return stored_file_id(att, kind)
             if local_path and os.path.exists(local_path):
                 return FSInputFile(local_path, filename=att.get("name"))
             if url:
@@ -563,6 +1358,17 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                 return file_id
             return None
 
+        def record_upload(index: int, kind: str, file_input, sent: Message) -> None:
+            """Remember what Telegram called a file we had to upload (or fetch from a URL)."""
+            att = originals[index]
+            if isinstance(file_input, str) and file_input in (att.get("telegram_file_id"), stored_file_id(att, kind)):
+                return
+            file_id = sent_file_id(sent, kind)
+            if file_id:
+                uploads.append(
+                    {"local_path": att.get("local_path"), "url": att.get("url"), "kind": kind, "file_id": file_id}
+                )
+
         def local_size(att: dict) -> int | None:
             local_path = att.get("local_path")
             if local_path and os.path.exists(local_path):
@@ -589,8 +1395,27 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                 return "audio"
             return "document"
 
+        def needs_upload(att: dict, kind: str) -> bool:
+            return not stored_file_id(att, kind)
+
+        async def upload_input(index: int, kind: str):
+            """Input that uploads an attachment again instead of sending its rejected file_id."""
+            att = originals[index]
+            if kind == "photo":
+                att = await optimize_outbound_image(att)
+            return to_file_input(att, kind, reuse=False)
+
+        if len(attachments) > 1:
+            attachments = [
+                await optimize_outbound_image(att) if infer_kind(att) == "photo" and needs_upload(att, "photo") else att
+                for att in attachments
+            ]
+        elif msg_type == "photo" and needs_upload(attachments[0], "photo"):
+            attachments = [await optimize_outbound_image(attachments[0])]
+
         if len(attachments) > 1:
             media = []
+            inputs = []
             all_media = True
             for idx, att in enumerate(attachments):
                 if not ensure_size(att):
@@ -601,7 +1426,7 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                     all_media = False
                     break
                 kind = infer_kind(att)
-                file_input = to_file_input(att)
+                file_input = to_file_input(att, kind)
                 if kind == "photo":
                     media.append(InputMediaPhoto(media=file_input, caption=text if idx == 0 else None))
                 elif kind == "video":
@@ -609,15 +1434,31 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                 else:
                     all_media = False
                     break
+                inputs.append((kind, file_input))
             if all_media and media:
                 try:
-                    await bot.send_media_group(tg_id, media=media, reply_to_message_id=reply_to)
+                    try:
+                        sent_group = await bot.send_media_group(tg_id, media=media, reply_to_message_id=reply_to)
+                    except TelegramBadRequest as e:
+                        if not file_id_rejected(e):
+                            raise
+                        # Nothing of the album went out; send it again with every file uploaded
+                        logger.warning(f"Stored file_id rejected, uploading the album again: {e}")
+                        inputs = [(kind, await upload_input(idx, kind)) for idx, (kind, _) in enumerate(inputs)]
+                        media = [
+                            type(item)(media=file_input, caption=item.caption)
+                            for item, (_, file_input) in zip(media, inputs)
+                        ]
+                        sent_group = await bot.send_media_group(tg_id, media=media, reply_to_message_id=reply_to)
+                    sent_telegram_message_id = sent_group[0].message_id if sent_group else None
+                    for idx, ((kind, file_input), sent) in enumerate(zip(inputs, sent_group)):
+                        record_upload(idx, kind, file_input, sent)
                 except TelegramEntityTooLarge:
                     await send_system_to_panel(
                         tg_id,
                         "Файлы слишком большие для Telegram. Отправка отменена.",
                     )
-                    return web.json_response({"ok": False, "error": "too_large"}, status=413)
+                    return {"ok": False, "error": "too_large"}
             else:
                 for idx, att in enumerate(attachments):
                     if not ensure_size(att):
@@ -626,21 +1467,35 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                             f"Файл слишком большой для Telegram: {att.get('name') or 'file'}",
                         )
                         continue
-                    file_input = to_file_input(att)
-                    caption = text if idx == 0 else None
                     kind = infer_kind(att)
+                    file_input = to_file_input(att, kind)
+                    caption = text if idx == 0 else None
                     # Only add reply_markup to last item
                     is_last = idx == len(attachments) - 1
                     markup = reply_markup if is_last else None
-                    try:
+
+                    async def send_item(file_input):
                         if kind == "photo":
-                            await bot.send_photo(tg_id, photo=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
+                            return await bot.send_photo(tg_id, photo=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
                         elif kind == "video":
-                            await bot.send_video(tg_id, video=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
+                            return await bot.send_video(tg_id, video=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
                         elif kind == "audio":
-                            await bot.send_audio(tg_id, audio=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
+                            return await bot.send_audio(tg_id, audio=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
                         else:
-                            await bot.send_document(tg_id, document=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
+                            return await bot.send_document(tg_id, document=file_input, caption=caption, reply_to_message_id=reply_to, reply_markup=markup)
+
+                    try:
+                        try:
+                            sent_msg = await send_item(file_input)
+                        except TelegramBadRequest as e:
+                            if not file_id_rejected(e) or not isinstance(file_input, str):
+                                raise
+                            # Items before this one were delivered; upload only this file again
+                            logger.warning(f"Stored file_id rejected, uploading {att.get('name') or 'file'} again: {e}")
+                            file_input = await upload_input(idx, kind)
+                            sent_msg = await send_item(file_input)
+                        sent_telegram_message_id = sent_telegram_message_id or sent_msg.message_id
+                        record_upload(idx, kind if kind in ("photo", "video", "audio") else "document", file_input, sent_msg)
                     except TelegramEntityTooLarge:
                         await send_system_to_panel(
                             tg_id,
@@ -653,8 +1508,12 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                     tg_id,
                     f"Файл слишком большой для Telegram: {attachment.get('name') or 'file'}",
                 )
-                return web.json_response({"ok": False, "error": "too_large"}, status=413)
-            file_input = to_file_input(attachment)
+                return {"ok": False, "error": "too_large"}
+            # What the message is sent as; unknown types go out as documents
+            kind = msg_type if msg_type in (
+                "photo", "video", "video_note", "animation", "audio", "voice", "sticker"
+            ) else "document"
+            file_input = to_file_input(attachment, kind)
             
             async def send_single_attachment(markup, caption_override=None):
                 cap = caption_override if caption_override is not None else (html.escape(text) if text else None)
@@ -683,6 +1542,11 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                     logger.warning(f"HTML parse error in caption, retrying with escaped text: {e}")
                     sent_msg = await send_single_attachment(reply_markup, caption_override=html.escape(text))
                     sent_telegram_message_id = sent_msg.message_id
+                elif file_id_rejected(e) and isinstance(file_input, str):
+                    logger.warning(f"Stored file_id rejected, uploading again: {e}")
+                    file_input = await upload_input(0, kind)
+                    sent_msg = await send_single_attachment(reply_markup)
+                    sent_telegram_message_id = sent_msg.message_id
                 elif "inline keyboard" in str(e).lower() or "url" in str(e).lower():
                     # Invalid inline keyboard URL - send without buttons
                     logger.warning(f"Invalid inline keyboard URL, sending without buttons: {e}")
@@ -696,7 +1560,8 @@ async def handle_internal_send(request: web.Request) -> web.Response:
                     tg_id,
                     f"Файл слишком большой для Telegram: {attachment.get('name') or 'file'}",
                 )
-                return web.json_response({"ok": False, "error": "too_large"}, status=413)
+                return {"ok": False, "error": "too_large"}
+            record_upload(0, kind, file_input, sent_msg)
     else:
         try:
             sent_msg = await bot.send_message(tg_id, html.escape(text), reply_to_message_id=reply_to, reply_markup=reply_markup)
@@ -715,7 +1580,87 @@ async def handle_internal_send(request: web.Request) -> web.Response:
             else:
                 raise
 
-    return web.json_response({"ok": True, "telegram_message_id": sent_telegram_message_id})
+    result = {"ok": True, "telegram_message_id": sent_telegram_message_id}
+    if uploads:
+        result["uploads"] = uploads
+    if upload["bytes"]:
+        result["upload_bytes"] = upload["bytes"]
+        result["upload_ms"] = round(upload["ms"])
+        logger.info(f"Uploaded {upload['bytes'] // 1024} KiB to {tg_id} in {result['upload_ms']} ms")
+    return result
+
+
+send_jobs: dict[str, asyncio.Task] = {}
+
+# Idempotency key (the backend's outbox id) -> {"job_id", "report"} for jobs in
+# flight or delivered; a re-dispatch gets the known job back instead of a second send.
+# Failed jobs are forgotten so their retry sends again.
+SEND_KEYS_MAX = 10000
+send_keys: OrderedDict[str, dict] = OrderedDict()
+
+
+def remember_send_key(key: str, job_id: str) -> None:
+    send_keys[key] = {"job_id": job_id, "report": None}
+    while len(send_keys) > SEND_KEYS_MAX:
+        send_keys.popitem(last=False)
+
+
+async def report_delivery(report: dict) -> None:
+    try:
+        await spool.deliver("/api/bot/delivery", report)
+    except Exception as e:
+        logger.error(f"Delivery report for job {report.get('job_id')} rejected: {e}")
+
+
+async def run_send_job(job_id: str, data: dict) -> None:
+    """Send in the background and report the outcome to /api/bot/delivery."""
+    send_lane.set(SEND_LANES.get(data.get("priority"), SEND_LANES["operator"]))
+    try:
+        await show_typing(data)
+        result = await perform_send(data)
+    except Exception as e:
+        logger.error(f"Send job {job_id} to {data.get('tg_id')} failed: {e}")
+        result = {"ok": False, "error": str(e)}
+    finally:
+        send_jobs.pop(job_id, None)
+    report = {"job_id": job_id, "message_id": data.get("message_id"), "tg_id": data.get("tg_id"), **result}
+    key = data.get("idempotency_key")
+    if key in send_keys:
+        if result["ok"]:
+            send_keys[key]["report"] = report
+        else:
+            send_keys.pop(key)
+    await report_delivery(report)
+
+
+async def handle_internal_send(request: web.Request) -> web.Response:
+    """Send a message; with "async": true, return 202 at once and report back via callback."""
+    token = request.headers.get("X-Internal-Token")
+    if token != INTERNAL_TOKEN:
+        return web.json_response({"error": "unauthorized"}, status=401)
+    if not bot:
+        return web.json_response({"error": "bot_not_initialized"}, status=503)
+    data = await request.json()
+    if data.get("async"):
+        key = data.get("idempotency_key")
+        known = send_keys.get(key) if key else None
+        if known:
+            if known["report"] is not None:
+                # Already delivered; the backend missed the report, so send it again
+                asyncio.create_task(report_delivery(known["report"]))
+            return web.json_response({"ok": True, "job_id": known["job_id"], "duplicate": True}, status=202)
+        job_id = uuid.uuid4().hex
+        if key:
+            remember_send_key(key, job_id)
+        send_jobs[job_id] = asyncio.create_task(run_send_job(job_id, data))
+        return web.json_response({"ok": True, "job_id": job_id}, status=202)
+    send_lane.set(SEND_LANES.get(data.get("priority"), SEND_LANES["operator"]))
+    try:
+        result = await perform_send(data)
+    except TelegramRetryAfter as e:
+        # Still flood-limited after the middleware's retries; the caller backs off
+        return web.json_response({"ok": False, "error": "retry_after", "retry_after": e.retry_after}, status=429)
+    return web.json_response(result, status=200 if result["ok"] else 413)
 
 
 async def wait_for_token() -> str:
@@ -724,19 +1669,24 @@ async def wait_for_token() -> str:
     logger.info("Waiting for Telegram bot token from panel settings...")
     
     while True:
-        token = await fetch_bot_token()
+        token = bot_token_from_settings()
         if token:
             TELEGRAM_TOKEN = token
             logger.info("Bot token received from panel!")
             return token
-        logger.info("No valid bot token in panel yet. Retrying in 10 seconds...")
-        await asyncio.sleep(10)
+        if settings_version is not None:
+            logger.info("No valid bot token in panel yet. Waiting for settings update...")
+        try:
+            await asyncio.wait_for(settings_updated.wait(), SETTINGS_SYNC_WAIT + 10)
+        except asyncio.TimeoutError:
+            pass
 
 
 async def initialize_bot(token: str) -> Bot:
     """Initialize the bot with the given token."""
     global bot
     bot = Bot(token=token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(SendThrottleMiddleware())
     logger.info("Bot initialized successfully!")
     return bot
 
@@ -753,11 +1703,20 @@ async def on_startup(app: web.Application) -> None:
 
 
 async def on_shutdown(app: web.Application) -> None:
-    task = app.get("polling_task")
-    if task:
-        task.cancel()
+    await media_groups.flush_all()
+    await inbound_queue.stop()
+    for name in ("polling_task", "settings_sync_task", "inbound_task", "spool_task", "optimized_sweep_task"):
+        task = app.get(name)
+        if task:
+            task.cancel()
+    if send_jobs:
+        # Let accepted sends finish so their delivery reports reach the backend or the spool
+        await asyncio.wait(list(send_jobs.values()), timeout=15)
+    await send_scheduler.stop()
     if bot:
         await bot.session.close()
+    await close_backend_client()
+    spool.close()
 
 
 async def health_check(request: web.Request) -> web.Response:
@@ -766,6 +1725,23 @@ async def health_check(request: web.Request) -> web.Response:
         "ok": True,
         "bot_initialized": bot is not None,
         "token_configured": bool(TELEGRAM_TOKEN),
+        "settings_version": settings_version,
+    })
+
+
+async def handle_internal_metrics(request: web.Request) -> web.Response:
+    if request.headers.get("X-Internal-Token") != INTERNAL_TOKEN:
+        return web.json_response({"error": "unauthorized"}, status=401)
+    return web.json_response({
+        "backend_http": backend_pool_stats(),
+        "photo_cache": photo_cache.stats(),
+        "media_groups": media_groups.stats(),
+        "inbound": inbound_queue.stats(),
+        "spool": spool.stats(),
+        "send_scheduler": send_scheduler.stats(),
+        "send_jobs": len(send_jobs),
+        "send_keys": len(send_keys),
+        "uploads": upload_stats.stats(),
     })
 
 
@@ -781,6 +1757,8 @@ async def create_app() -> web.Application:
     app.router.add_get("/health", health_check)
     app.router.add_post("/internal/send", handle_internal_send)
     app.router.add_post("/internal/delete", handle_internal_delete)
+    app.router.add_post("/internal/file-path", handle_internal_file_path)
+    app.router.add_get("/internal/metrics", handle_internal_metrics)
     
     app.on_shutdown.append(on_shutdown)
     return app
@@ -788,11 +1766,44 @@ async def create_app() -> web.Application:
 
 async def run_bot():
     """Main entry point that waits for token before starting."""
-    global bot
-    
     # Create the web app first (for health checks)
     app = await create_app()
+
+    # Mirror panel settings locally; the token arrives through the same stream
+    app["settings_sync_task"] = asyncio.create_task(settings_sync_loop())
+    app["inbound_task"] = asyncio.create_task(inbound_queue.run())
+    spool.open()
+    app["spool_task"] = asyncio.create_task(spool.run())
+    app["optimized_sweep_task"] = asyncio.create_task(optimized_sweep_loop())
     
+    # Stop on SIGTERM/SIGINT through runner.cleanup(), so on_shutdown flushes albums,
+    # finishes accepted sends and closes the spool
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    main = asyncio.create_task(serve(app))
+    stopping = asyncio.create_task(stop.wait())
+    try:
+        done, _ = await asyncio.wait([main, stopping], return_when=asyncio.FIRST_COMPLETED)
+        if main in done:
+            main.result()
+    finally:
+        logger.info("Shutting down")
+        for task in (main, stopping):
+            task.cancel()
+        await asyncio.gather(main, stopping, return_exceptions=True)
+        runner = app.get("runner")
+        if runner:
+            await runner.cleanup()
+        else:
+            await on_shutdown(app)
+
+
+async def serve(app: web.Application) -> None:
+    """Wait for the token, then serve HTTP and Telegram updates until cancelled."""
+    global bot
+
     # Wait for token from panel BEFORE starting the server
     token = await wait_for_token()
     
@@ -806,9 +1817,17 @@ async def run_bot():
     # NOW start web server (after all handlers are registered)
     runner = web.AppRunner(app)
     await runner.setup()
+    app["runner"] = runner
     site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
     logger.info(f"HTTP server started on port {PORT}")
+    if BOT_UDS_PATH:
+        if os.path.exists(BOT_UDS_PATH):
+            os.unlink(BOT_UDS_PATH)
+        os.makedirs(os.path.dirname(BOT_UDS_PATH) or ".", exist_ok=True)
+        await web.UnixSite(runner, BOT_UDS_PATH).start()
+        os.chmod(BOT_UDS_PATH, 0o666)
+        logger.info(f"HTTP server listening on unix socket {BOT_UDS_PATH}")
     
     # Setup webhook or polling
     if WEBHOOK_URL:
@@ -819,7 +1838,8 @@ async def run_bot():
             await asyncio.sleep(3600)
     else:
         logger.info("Starting polling...")
-        await app["dispatcher"].start_polling(bot)
+        # Signals and the bot session are handled by run_bot/on_shutdown
+        await app["dispatcher"].start_polling(bot, handle_signals=False, close_bot_session=False)
 
 
 if __name__ == "__main__":
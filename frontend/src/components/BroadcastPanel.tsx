@@ -554,6 +554,12 @@ export default function BroadcastPanel() {
                               {broadcast.stats.failed > 0 && (
                                 <span className="text-rose-400">✗ {broadcast.stats.failed}</span>
                               )}
+                              {broadcast.status === 'in_progress' && (broadcast.stats.total ?? 0) > 0 && (
+                                <span className="text-white/40">
+                                  {broadcast.stats.sent + broadcast.stats.failed}/{broadcast.stats.total}
+                                  {broadcast.stats.per_second ? ` · ${broadcast.stats.per_second}/с` : ''}
+                                </span>
+                              )}
                             </div>
                           )}
                         </div>
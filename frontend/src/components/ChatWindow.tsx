@@ -926,6 +926,7 @@ export default function ChatWindow({
                 const renderSingle = (att: any, index: number) => {
                   if (!att) return null
                   const src = att.url || att.local_path
+                  const thumb: string | undefined = att.meta?.thumb_url
                   const mime = (att.mime || '').toLowerCase()
                   const name = (att.name || '').toLowerCase()
                   const isSticker = msg.type === 'sticker'
@@ -1022,8 +1023,10 @@ export default function ChatWindow({
                       ) : src && isImage ? (
                         <div className="flex flex-col gap-2">
                           <img
-                            src={src}
+                            src={expanded ? src : thumb || src}
                             alt={att.name || 'image'}
+                            width={att.meta?.width}
+                            height={att.meta?.height}
                             className={`rounded-xl border border-white/10 cursor-pointer ${
                               expanded
                                 ? 'max-h-[50vh] max-w-[60vw] w-auto h-auto object-contain'
@@ -1063,6 +1066,8 @@ export default function ChatWindow({
                         <div className="flex flex-col gap-2">
                           <video
                             src={src}
+                            poster={thumb}
+                            preload={thumb ? 'none' : 'metadata'}
                             controls
                             className={`rounded-lg border border-white/10 ${
                               expanded
@@ -1136,7 +1141,7 @@ export default function ChatWindow({
                             >
                               {isImage && src && (
                                 <img
-                                  src={src}
+                                  src={att.meta?.thumb_url || src}
                                   alt={att.name || 'image'}
                                   className="h-24 w-full object-cover"
                                   loading="lazy"
@@ -1144,7 +1149,11 @@ export default function ChatWindow({
                               )}
                               {isVideo && src && (
                                 <>
-                                  <video src={src} className="h-24 w-full object-cover" />
+                                  {att.meta?.thumb_url ? (
+                                    <img src={att.meta.thumb_url} alt={att.name || 'video'} className="h-24 w-full object-cover" loading="lazy" />
+                                  ) : (
+                                    <video src={src} preload="metadata" className="h-24 w-full object-cover" />
+                                  )}
                                   <span className="absolute inset-0 flex items-center justify-center text-white/80">
                                     ▶
                                   </span>
@@ -1201,6 +1210,20 @@ export default function ChatWindow({
               )}
               <div className="mt-1 text-right text-[9px] text-white/40">
                 {formatMsgTime(msg.created_at)}
+                {msg.delivery_status && msg.delivery_status !== 'sent' && (
+                  <span
+                    className={clsx('ml-1', msg.delivery_status === 'failed' && 'text-rose-300')}
+                    title={
+                      msg.delivery_status === 'failed'
+                        ? 'Не доставлено'
+                        : msg.delivery_status === 'retrying'
+                          ? 'Повторная отправка'
+                          : 'В очереди'
+                    }
+                  >
+                    {msg.delivery_status === 'failed' ? '⚠' : '🕓'}
+                  </span>
+                )}
               </div>
               </div>
               <div className={clsx('shrink-0 pt-1', !deleteMode && 'opacity-0 group-hover:opacity-100 transition-opacity')}>
@@ -1544,7 +1567,7 @@ export default function ChatWindow({
                               else if (mime.startsWith('video/')) type = 'video'
                               else if (mime.startsWith('audio/')) type = 'audio'
                               return {
-                                upload: { url: att.url, local_path: att.local_path, mime: att.mime, name: att.name, size: att.size },
+                                upload: { url: att.url, local_path: att.local_path, mime: att.mime, name: att.name, size: att.size, meta: att.meta },
                                 type,
                                 name: att.name,
                                 mime: att.mime
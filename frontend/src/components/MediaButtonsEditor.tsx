@@ -71,6 +71,7 @@ export default function MediaButtonsEditor({
           mime: result.mime,
           name: result.name,
           size: result.size,
+          meta: result.meta,
         })
       }
       onAttachmentsChange([...attachments, ...newAttachments])
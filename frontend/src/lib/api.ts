@@ -31,6 +31,7 @@ export type Message = {
   created_at?: string
   attachments?: AttachmentData[]
   inline_buttons?: InlineButton[][] | null
+  delivery_status?: 'queued' | 'sent' | 'failed' | 'retrying' | null
   // Forward info
   forward_from_name?: string | null
   forward_from_username?: string | null
@@ -50,7 +51,7 @@ export type ExternalProfile = {
 }
 
 export type InlineButton = { text: string; url: string }
-export type AttachmentData = { url?: string; local_path?: string; mime?: string; name?: string; size?: number }
+export type AttachmentData = { url?: string; local_path?: string; mime?: string; name?: string; size?: number; meta?: Record<string, any> }
 
 export type Template = { 
   id: number
@@ -64,7 +65,7 @@ export type Broadcast = {
   body: string
   status: string
   target_statuses?: string[] | null
-  stats?: { sent: number; failed: number } | null
+  stats?: { sent: number; failed: number; total?: number; per_second?: number | null; rate_limit?: number } | null
   attachments?: AttachmentData[] | null
   inline_buttons?: InlineButton[][] | null
   created_at?: string
@@ -199,6 +200,19 @@ async function request<T>(path: string, options: RequestInit = {}): Promise<T> {
   return (await res.json()) as T
 }
 
+// Hashing needs a secure context; very large files are just uploaded
+const HASH_MAX_BYTES = 64 * 1024 * 1024
+
+async function fileSha256(file: File): Promise<string | null> {
+  if (!globalThis.crypto?.subtle || file.size > HASH_MAX_BYTES) return null
+  try {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer())
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('')
+  } catch {
+    return null
+  }
+}
+
 export const api = {
   // Paginated version - returns items with cursor info
   getChats: async (tab = 'active', search = '', searchScope?: string, cursor?: string, limit = 30): Promise<PaginatedResponse<Chat>> => {
@@ -233,6 +247,13 @@ export const api = {
   updateChatNote: (chatId: string, note: string | null) =>
     request<Chat>(`/api/chats/${chatId}/note`, { method: 'PATCH', body: JSON.stringify({ note }) }),
   upload: async (file: File) => {
+    // Content the server already stores is not sent again
+    const sha256 = await fileSha256(file)
+    if (sha256) {
+      const params = new URLSearchParams({ name: file.name, mime: file.type })
+      const existing = await fetch(`/api/uploads/blobs/${sha256}?${params}`, { credentials: 'include' })
+      if (existing.ok) return existing.json()
+    }
     const form = new FormData()
     form.append('file', file)
     const csrf = getCookie('csrf_token')